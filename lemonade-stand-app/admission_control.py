@@ -0,0 +1,179 @@
+"""
+Adaptive admission control for orchestrator streams.
+An AIMD concurrency limit driven by orchestrator time to first byte: the
+limit creeps up while TTFB stays under target and is cut back when it does
+not, so overload turns into fast, explicit rejections instead of requests
+queueing until the client timeout.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+
+from shared_counters import CounterSegment
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionController:
+    """
+    Concurrency limiter with a bounded FIFO wait queue.
+
+    `acquire()` returns True when the caller may start an upstream stream and
+    False when it was shed (queue full, or waited longer than `max_wait`).
+    Every successful acquire must be paired with `release()`, passing the
+    observed orchestrator time to first byte, or `failed=True` if the stream
+    failed without one. Releasing with neither (e.g. the client went away)
+    leaves the limit untouched. Counters and gauges live in the CounterSegment,
+    so /metrics reports the sum over all workers; the gauges start from zero in
+    a worker that takes over a previous worker's row.
+    """
+
+    ADMITTED, QUEUED, SHED_QUEUE_FULL, SHED_TIMEOUT = range(4)
+    INFLIGHT, WAITING = range(2)
+
+    def __init__(
+        self,
+        initial_limit: int = 50,
+        min_limit: int = 4,
+        max_limit: int = 200,
+        target_ttfb: float = 2.0,
+        max_queue: int = 200,
+        max_wait: float = 5.0,
+        segment: CounterSegment | None = None,
+    ):
+        segment = segment or CounterSegment()
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_ttfb = target_ttfb
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._waiters: deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+
+        self._counters_block = segment.allocate("q", 4)
+        self._gauges_block = segment.allocate("q", 2, gauge=True)
+        self._limit_block = segment.allocate("d", 1, gauge=True)
+        self._counters = self._counters_block.local
+        self._gauges = self._gauges_block.local
+        self._limit = self._limit_block.local
+        self._limit[0] = float(min(max(initial_limit, min_limit), max_limit))
+
+    @property
+    def limit(self) -> float:
+        return self._limit[0]
+
+    @property
+    def inflight(self) -> int:
+        return self._gauges[self.INFLIGHT]
+
+    @property
+    def retry_after(self) -> int:
+        """Whole seconds a shed client should wait before trying again."""
+        return max(1, math.ceil(self.max_wait))
+
+    async def acquire(self) -> bool:
+        if not self._waiters and self._gauges[self.INFLIGHT] < int(self._limit[0]):
+            self._gauges[self.INFLIGHT] += 1
+            self._counters[self.ADMITTED] += 1
+            return True
+
+        if len(self._waiters) >= self.max_queue:
+            self._counters[self.SHED_QUEUE_FULL] += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._gauges[self.WAITING] += 1
+        self._counters[self.QUEUED] += 1
+        try:
+            # The slot is handed over by _wake() before the future resolves
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            self._counters[self.SHED_TIMEOUT] += 1
+            return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            raise
+        finally:
+            self._gauges[self.WAITING] -= 1
+            if not waiter.done():
+                waiter.cancel()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+        self._counters[self.ADMITTED] += 1
+        return True
+
+    def release(self, ttfb: float | None = None, failed: bool = False):
+        if ttfb is not None or failed:
+            self._adjust(ttfb)
+        self._release_slot()
+
+    def _release_slot(self):
+        self._gauges[self.INFLIGHT] -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self._gauges[self.INFLIGHT] < int(self._limit[0]):
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self._gauges[self.INFLIGHT] += 1
+            waiter.set_result(None)
+
+    def _adjust(self, ttfb: float | None):
+        limit = self._limit[0]
+        if ttfb is not None and ttfb <= self.target_ttfb:
+            # Additive increase, only while the limit is actually the bottleneck
+            if self._waiters or self._gauges[self.INFLIGHT] >= int(limit):
+                self._limit[0] = min(self.max_limit, limit + 1 / limit)
+            return
+
+        # Multiplicative decrease, at most once per target interval so one slow
+        # burst does not collapse the limit
+        now = time.monotonic()
+        if now - self._last_decrease < self.target_ttfb:
+            return
+        self._last_decrease = now
+        self._limit[0] = max(self.min_limit, limit * 0.9)
+        logger.info(
+            f"Admission limit {limit:.1f} -> {self._limit[0]:.1f} "
+            f"(ttfb {'failed' if ttfb is None else f'{ttfb:.2f}s'})"
+        )
+
+    def get_prometheus_metrics(self) -> str:
+        admitted, queued, shed_full, shed_timeout = self._counters_block.totals()
+        inflight, waiting = self._gauges_block.totals()
+        limit = self._limit_block.totals()[0]
+        lines = [
+            "# HELP guardrail_admission_admitted_total Orchestrator streams admitted by admission control",
+            "# TYPE guardrail_admission_admitted_total counter",
+            f"guardrail_admission_admitted_total {admitted}",
+            "",
+            "# HELP guardrail_admission_queued_total Orchestrator streams that had to wait for a slot",
+            "# TYPE guardrail_admission_queued_total counter",
+            f"guardrail_admission_queued_total {queued}",
+            "",
+            "# HELP guardrail_admission_shed_total Chat requests rejected by admission control by reason",
+            "# TYPE guardrail_admission_shed_total counter",
+            f'guardrail_admission_shed_total{{reason="queue_full"}} {shed_full}',
+            f'guardrail_admission_shed_total{{reason="timeout"}} {shed_timeout}',
+            "",
+            "# HELP guardrail_admission_limit Current adaptive concurrency limit, summed over workers",
+            "# TYPE guardrail_admission_limit gauge",
+            f"guardrail_admission_limit {limit:.2f}",
+            "",
+            "# HELP guardrail_admission_inflight Admitted orchestrator streams in flight",
+            "# TYPE guardrail_admission_inflight gauge",
+            f"guardrail_admission_inflight {inflight}",
+            "",
+            "# HELP guardrail_admission_waiting Chat requests waiting for an admission slot",
+            "# TYPE guardrail_admission_waiting gauge",
+            f"guardrail_admission_waiting {waiting}",
+        ]
+        return "\n".join(lines)
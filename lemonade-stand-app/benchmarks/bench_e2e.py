@@ -0,0 +1,223 @@
+"""
+End-to-end capacity of the app against the mock orchestrator.
+
+Starts benchmarks/stub_orchestrator.py with the given profile, starts
+app_fastapi:app under uvicorn, drives /api/chat at a fixed concurrency with
+the k6 prompt mix and reports:
+
+  req/s, outcomes (passed / blocked-input / blocked-output / error),
+  p50/p95/p99 time to first byte and total stream time seen by the client,
+  app CPU seconds per request and cores used (all uvicorn processes).
+
+Use it to size app replicas without a GPU cluster: raise --concurrency until
+req/s stops growing or CPU per request climbs, then divide the expected peak
+by that req/s.
+
+Run from lemonade-stand-app/:
+    python benchmarks/bench_e2e.py --concurrency 64 --duration 20 --ttfb 0.3 --ttfb-sigma 0.5 --token-rate 40
+    python benchmarks/bench_e2e.py --workers 2 --env SSE_BATCH_WINDOW_MS=0 --granularity sentence
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_fastapi import DETECTOR_MESSAGES  # noqa: E402
+from bench_workers import APP_DIR, APP_PORT, STUB_PORT, wait_for  # noqa: E402
+from corpora import load_k6_corpora  # noqa: E402
+from stub_orchestrator import add_profile_arguments, profile_from_args, profile_to_argv  # noqa: E402
+
+OUTCOMES = ["passed", "blocked-input", "blocked-output", "error"]
+OUTPUT_BLOCK_MESSAGES = tuple(message for key, message in DETECTOR_MESSAGES.items() if key.endswith("_output"))
+
+
+def classify(body: bytes) -> str:
+    """Outcome of a chat stream from its last SSE event."""
+    events = [line for line in body.split(b"\n") if line.startswith(b"data: ")]
+    if not events:
+        return "error"
+    try:
+        last = json.loads(events[-1][len(b"data: "):])
+    except ValueError:
+        return "error"
+    if last.get("type") == "done":
+        return "passed"
+    if "detector_type" in last:
+        return "blocked-output" if last["message"].startswith(OUTPUT_BLOCK_MESSAGES) else "blocked-input"
+    return "error"
+
+
+async def _drive(url: str, prompts: list[str], concurrency: int, warmup: float, duration: float, seed: int):
+    rng = random.Random(seed)
+    samples = []  # (ttfb, total, outcome) after the warmup
+    start_at = time.monotonic() + warmup
+    deadline = start_at + duration
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=180)) as session:
+        async def user():
+            while time.monotonic() < deadline:
+                sent = time.perf_counter()
+                measured = time.monotonic() >= start_at
+                ttfb = None
+                body = bytearray()
+                try:
+                    async with session.post(url, json={"message": rng.choice(prompts)}) as response:
+                        async for chunk in response.content.iter_any():
+                            if ttfb is None:
+                                ttfb = time.perf_counter() - sent
+                            body += chunk
+                    outcome = classify(bytes(body))
+                except aiohttp.ClientError:
+                    outcome = "error"
+                if measured and time.monotonic() <= deadline:
+                    total = time.perf_counter() - sent
+                    samples.append((ttfb if ttfb is not None else total, total, outcome))
+
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+    return samples
+
+
+def _client(args: tuple) -> list:
+    return asyncio.run(_drive(*args))
+
+
+# =============================================================================
+# App CPU accounting
+# =============================================================================
+
+def _process_tree(pid: int) -> list[int]:
+    pids = [pid]
+    for current in pids:
+        try:
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def tree_cpu_seconds(pid: int) -> float | None:
+    """User + system CPU of a process and its live descendants (Linux /proc), None elsewhere."""
+    if not os.path.exists(f"/proc/{pid}/stat"):
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    total = 0
+    for current in _process_tree(pid):
+        try:
+            with open(f"/proc/{current}/stat") as f:
+                # Fields after the parenthesised command name; utime and stime are 14 and 15
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += int(fields[11]) + int(fields[12])
+        except (OSError, IndexError):
+            continue
+    return total / ticks
+
+
+def children_cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds of load before measuring")
+    parser.add_argument("--clients", type=int, default=2, help="load generator processes")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers (WEB_CONCURRENCY)")
+    parser.add_argument("--corpora", nargs="+", default=None, help="k6 prompt arrays to draw from (default: all)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra app environment")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    corpora = load_k6_corpora()
+    prompts = [p for name in (args.corpora or corpora) for p in corpora[name]]
+    profile = profile_from_args(args)
+
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(APP_DIR, "benchmarks", "stub_orchestrator.py"), "--port", str(STUB_PORT),
+         *profile_to_argv(profile)],
+        cwd=APP_DIR,
+    )
+    env = dict(
+        os.environ,
+        GUARDRAILS_ORCHESTRATOR_SERVICE_SERVICE_HOST="localhost",
+        GUARDRAILS_ORCHESTRATOR_SERVICE_SERVICE_PORT=str(STUB_PORT),
+        WEB_CONCURRENCY=str(args.workers),
+        # Measure the full pipeline: repeated prompts must not be replayed or shared
+        RESPONSE_CACHE_SIZE="0",
+        STREAM_COALESCING_ENABLED="false",
+        LOG_LEVEL="WARNING",
+    )
+    env.update(item.split("=", 1) for item in args.env)
+    cpu_before_app = children_cpu_seconds()
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app_fastapi:app", "--port", str(APP_PORT),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=APP_DIR, env=env,
+    )
+    try:
+        wait_for(f"http://127.0.0.1:{STUB_PORT}/stats", stub)
+        wait_for(f"http://127.0.0.1:{APP_PORT}/health", app, stub)
+        url = f"http://127.0.0.1:{APP_PORT}/api/chat"
+        per_client = max(1, args.concurrency // args.clients)
+        jobs = [(url, prompts, per_client, args.warmup, args.duration, seed) for seed in range(args.clients)]
+
+        with multiprocessing.Pool(args.clients) as pool:
+            pending = pool.map_async(_client, jobs)
+            time.sleep(args.warmup)
+            cpu_start = tree_cpu_seconds(app.pid)
+            time.sleep(args.duration)
+            cpu_end = tree_cpu_seconds(app.pid)
+            samples = [s for client_samples in pending.get() for s in client_samples]
+    finally:
+        app.terminate()
+        app.wait()
+        stub.terminate()
+        stub.wait()
+
+    if cpu_start is not None and cpu_end is not None:
+        app_cpu, cpu_note = cpu_end - cpu_start, "measured window"
+    else:
+        # No /proc: whole app lifetime including startup, so an upper bound
+        app_cpu, cpu_note = children_cpu_seconds() - cpu_before_app, "whole run incl. startup"
+
+    window = args.duration
+    completed = len(samples)
+    ttfbs = [s[0] for s in samples]
+    totals = [s[1] for s in samples]
+    counts = {outcome: sum(1 for s in samples if s[2] == outcome) for outcome in OUTCOMES}
+    print(f"concurrency {args.concurrency}, workers {args.workers}, {args.duration:.0f}s measured, "
+          f"stub ttfb {args.ttfb}s (sigma {args.ttfb_sigma}), {args.token_rate or 'unlimited'} tok/s, "
+          f"{args.granularity} chunks\n")
+    print(f"  req/s           {completed / window:,.1f}  ({completed} requests)")
+    print("  outcomes        " + "  ".join(f"{k} {v}" for k, v in counts.items()))
+    print(f"  ttfb            p50 {percentile(ttfbs, .5) * 1000:.1f} ms  p95 {percentile(ttfbs, .95) * 1000:.1f} ms"
+          f"  p99 {percentile(ttfbs, .99) * 1000:.1f} ms")
+    print(f"  stream time     p50 {percentile(totals, .5) * 1000:.1f} ms  p95 {percentile(totals, .95) * 1000:.1f} ms"
+          f"  p99 {percentile(totals, .99) * 1000:.1f} ms")
+    if completed:
+        print(f"  app CPU         {app_cpu / completed * 1000:.2f} ms/request, "
+              f"{app_cpu / window:.2f} cores ({cpu_note})")
+
+
+if __name__ == "__main__":
+    main()
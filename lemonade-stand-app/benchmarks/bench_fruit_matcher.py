@@ -0,0 +1,122 @@
+"""
+Fruit matcher equivalence check and benchmark.
+
+Verifies that FruitMatcher blocks exactly the messages the per-language regex
+loop blocks, over the k6 prompt corpora plus every expanded fruit term in
+word-boundary edge contexts, then reports per-message cost of both. The
+streaming scanner is checked against the same cases fed in random pieces, the
+way LLM output arrives over SSE.
+
+Run from lemonade-stand-app/:
+    python benchmarks/bench_fruit_matcher.py
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_fastapi import ALL_REGEX_PATTERNS, COMPILED_REGEX_PATTERNS, FRUIT_MATCHER  # noqa: E402
+from corpora import load_k6_corpora, load_test_prompts  # noqa: E402
+from fruit_matcher import expand_pattern  # noqa: E402
+
+
+def regex_loop(text: str) -> bool:
+    """The original check_regex_locally implementation."""
+    for pattern in COMPILED_REGEX_PATTERNS:
+        if pattern.search(text):
+            return True
+    return False
+
+
+def edge_cases() -> list[str]:
+    """Every term in boundary-sensitive contexts, upper-cased and glued to other words."""
+    cases = []
+    for pattern in ALL_REGEX_PATTERNS:
+        for term in expand_pattern(pattern):
+            cases.extend([
+                term,
+                term.upper(),
+                term.title(),
+                f"I like {term}.",
+                f"{term}s and more",
+                f"x{term}",
+                f"{term}x",
+                f"{term}_",
+                f"({term})",
+                f"{term}ジュース",
+            ])
+    return cases
+
+
+def check_equivalence(messages: list[str]) -> list[str]:
+    return [m for m in messages if regex_loop(m) != FRUIT_MATCHER.matches(m)]
+
+
+def stream_matches(text: str, rng: random.Random) -> bool:
+    """Feed text to a StreamingFruitScanner in random 1-8 character pieces."""
+    scanner = FRUIT_MATCHER.stream()
+    pos = 0
+    while pos < len(text):
+        size = rng.randint(1, 8)
+        if scanner.feed(text[pos:pos + size]):
+            return True
+        pos += size
+    return scanner.finish() is not None
+
+
+def check_streaming(messages: list[str]) -> list[str]:
+    rng = random.Random(0)
+    return [m for m in messages if regex_loop(m) != stream_matches(m, rng)]
+
+
+def per_message_us(fn, messages: list[str], rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            fn(message)
+    return (time.perf_counter() - start) / (rounds * len(messages)) * 1e6
+
+
+def main():
+    corpora = load_k6_corpora()
+    corpora["TEST_PROMPTS"] = load_test_prompts()
+
+    print(f"Trie terms: {FRUIT_MATCHER.term_count}")
+    edge = edge_cases()
+    mismatches = check_equivalence(edge)
+    print(f"Edge cases: {len(edge)} checked, {len(mismatches)} mismatches")
+    for message in mismatches[:20]:
+        print(f"  MISMATCH {message!r}: regex={regex_loop(message)} trie={FRUIT_MATCHER.matches(message)}")
+
+    # Glue a few cases together so terms land on piece boundaries mid-text
+    streamed = edge + [" ".join(edge[i:i + 5]) for i in range(0, len(edge), 5)]
+    stream_mismatches = check_streaming(streamed)
+    print(f"Streaming: {len(streamed)} checked in random pieces, {len(stream_mismatches)} mismatches")
+    for message in stream_mismatches[:20]:
+        print(f"  STREAM MISMATCH {message!r}: regex={regex_loop(message)}")
+    mismatches.extend(stream_mismatches)
+
+    print()
+    print(f"{'corpus':<24}{'n':>6}{'blocked':>9}{'regex us/msg':>14}{'trie us/msg':>13}{'speedup':>9}")
+    for name, messages in corpora.items():
+        if not messages:
+            continue
+        bad = check_equivalence(messages)
+        mismatches.extend(bad)
+        rounds = max(1, 20000 // len(messages))
+        regex_us = per_message_us(regex_loop, messages, rounds)
+        trie_us = per_message_us(FRUIT_MATCHER.matches, messages, rounds)
+        blocked = sum(FRUIT_MATCHER.matches(m) for m in messages)
+        print(f"{name:<24}{len(messages):>6}{blocked:>9}{regex_us:>14.2f}{trie_us:>13.2f}{regex_us / trie_us:>8.1f}x")
+        for message in bad:
+            print(f"  MISMATCH {message!r}: regex={regex_loop(message)} trie={FRUIT_MATCHER.matches(message)}")
+
+    if mismatches:
+        sys.exit(f"{len(mismatches)} mismatches between regex loop and FruitMatcher")
+
+
+if __name__ == "__main__":
+    main()
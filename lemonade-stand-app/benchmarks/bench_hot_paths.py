@@ -0,0 +1,273 @@
+"""
+Microbenchmarks for the app's per-request hot paths, with stored baselines.
+
+Cases:
+  regex_*            check_regex_locally over the SAFE / BLOCKED / NON_ENGLISH k6 prompts
+  language_screen    screen_language over the same prompts
+  output_scan        StreamingFruitScanner over a token-by-token answer
+  sse_decode_*       SSEDecoder over streams in the orchestrator's wire format
+  metrics_increment  MetricsCollector request + detection updates with 50 sources
+  metrics_render     get_prometheus_metrics with 50 sources after a change
+  payload_build      pre-serialized orchestrator request body for a prompt
+  event_encode       SSE event encoding of chat events
+
+Each case reports the best per-operation time over several timed repeats,
+and that time relative to a fixed pure-Python calibration loop timed in the
+same repeats. Baselines and --compare use the relative figure, so a baseline
+recorded on one machine stays usable on a faster or slower one.
+
+Run from lemonade-stand-app/:
+    python benchmarks/bench_hot_paths.py                 # measure and print
+    python benchmarks/bench_hot_paths.py --save          # write benchmarks/baselines.json
+    python benchmarks/bench_hot_paths.py --compare       # exit 1 if a case is >25% slower
+    python benchmarks/bench_hot_paths.py --compare --threshold 0.1 --only regex
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from typing import Callable
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_fastapi import FRUIT_MATCHER, check_regex_locally, request_body  # noqa: E402
+from corpora import load_k6_corpora  # noqa: E402
+from frame_batcher import encode_event  # noqa: E402
+from language_screen import screen_language  # noqa: E402
+from metrics_collector import MetricsCollector  # noqa: E402
+from sse_decoder import SSEDecoder  # noqa: E402
+from stub_orchestrator import LEMON_SENTENCES, OFF_TOPIC_SENTENCE, chunk_event, output_block_event, sse  # noqa: E402
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+REPEATS = 7
+TARGET_SECONDS = 0.05  # per timed repeat
+CONFIRM_RUNS = 2  # re-measurements of a case before --compare reports it
+
+
+# =============================================================================
+# Fixtures
+# =============================================================================
+
+def token_stream(seed: int, duplicate_rate: float = 0.0, block: bool = False) -> tuple[list[bytes], int]:
+    """An orchestrator SSE response as the network reads it: (reads, number of data frames)."""
+    rng = random.Random(seed)
+    events = []
+    for index, sentence in enumerate(rng.choice(LEMON_SENTENCES) for _ in range(6)):
+        if block and index == 2:
+            events.append(sse(output_block_event("llama32", OFF_TOPIC_SENTENCE)))
+            break
+        for i, word in enumerate(sentence.split(" ")):
+            event = sse(chunk_event("llama32", word if i == 0 and index == 0 else " " + word))
+            events.append(event)
+            if rng.random() < duplicate_rate:
+                events.append(event)
+    else:
+        events.append(sse(chunk_event("llama32", None, "stop")))
+    frames = len(events)
+    wire = b"".join(events) + b"data: [DONE]\n\n"
+    # TCP reads rarely line up with frames: cut the bytes at random points
+    reads = []
+    pos = 0
+    while pos < len(wire):
+        size = rng.randint(40, 600)
+        reads.append(wire[pos:pos + size])
+        pos += size
+    return reads, frames
+
+
+def metrics_fixture() -> MetricsCollector:
+    return MetricsCollector(sources=[f"source-{i}" for i in range(49)])
+
+
+DETECTIONS = [{"results": [{"detector_id": "hap", "score": 0.9}, {"detector_id": "regex_competitor", "score": 1.0}]}]
+
+
+# =============================================================================
+# Cases - each returns (callable doing one batch, operations per batch)
+# =============================================================================
+
+def build_cases() -> dict[str, tuple[Callable[[], object], int]]:
+    corpora = load_k6_corpora()
+    cases = {}
+
+    def over(fn, items):
+        def run():
+            for item in items:
+                fn(item)
+        return run
+
+    for name in ["SAFE_PROMPTS", "BLOCKED_PROMPTS", "NON_ENGLISH_PROMPTS"]:
+        prompts = corpora[name]
+        cases[f"regex_{name.split('_PROMPTS')[0].lower()}"] = (over(check_regex_locally, prompts), len(prompts))
+
+    all_prompts = corpora["SAFE_PROMPTS"] + corpora["BLOCKED_PROMPTS"] + corpora["NON_ENGLISH_PROMPTS"]
+    cases["language_screen"] = (over(screen_language, all_prompts), len(all_prompts))
+
+    answer_tokens = [" " + word for sentence in LEMON_SENTENCES for word in sentence.split(" ")]
+
+    def output_scan():
+        scanner = FRUIT_MATCHER.stream()
+        for token in answer_tokens:
+            scanner.feed(token)
+        scanner.finish()
+    cases["output_scan"] = (output_scan, len(answer_tokens))
+
+    for name, (reads, frames) in {
+        "sse_decode_tokens": token_stream(1, duplicate_rate=0.05),
+        "sse_decode_output_block": token_stream(2, block=True),
+    }.items():
+        def decode(reads=reads):
+            decoder = SSEDecoder()
+            for read in reads:
+                decoder.feed(read)
+        cases[name] = (decode, frames)
+
+    collector = metrics_fixture()
+    sources = collector.sources
+
+    def increment():
+        for source in sources:
+            collector.increment_request(source)
+            collector.add_detections(DETECTIONS, "output", source)
+    cases["metrics_increment"] = (increment, len(sources))
+
+    def render():
+        collector.increment_request("source-0")
+        collector.get_prometheus_metrics()
+    cases["metrics_render"] = (render, 1)
+
+    cases["payload_build"] = (over(request_body.build, all_prompts), len(all_prompts))
+
+    events = [{"type": "chunk", "content": token} for token in answer_tokens[:40]]
+    events += [
+        {"type": "chunk", "content": "\n"},
+        {"type": "error", "message": "🍏 Oops! I almost talked about other fruits.", "detector_type": "regex"},
+        {"type": "done"},
+    ]
+    cases["event_encode"] = (over(encode_event, events), len(events))
+    return cases
+
+
+# =============================================================================
+# Measurement
+# =============================================================================
+
+def calibration():
+    """Fixed pure-Python work: dict/str/int operations in the same mix as the cases."""
+    table = {}
+    for i in range(2000):
+        key = f"k{i % 97}"
+        table[key] = table.get(key, 0) + i
+    return sum(table.values())
+
+
+def _loops_for(fn: Callable[[], object]) -> int:
+    fn()
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= TARGET_SECONDS / 4:
+            return max(1, int(loops * TARGET_SECONDS / elapsed))
+        loops *= 2
+
+
+def _timed(fn: Callable[[], object], loops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(loops):
+        fn()
+    return (time.perf_counter() - start) / loops
+
+
+def measure(fn: Callable[[], object], ops: int, calibration_loops: int) -> tuple[float, float]:
+    """
+    (best microseconds per operation, best calibration microseconds) over REPEATS.
+    The calibration runs right before every repeat of the case, so both see the
+    same CPU frequency and neighbour noise and their ratio stays comparable.
+    """
+    loops = _loops_for(fn)
+    best = best_calibration = float("inf")
+    for _ in range(REPEATS):
+        best_calibration = min(best_calibration, _timed(calibration, calibration_loops))
+        best = min(best, _timed(fn, loops))
+    return best / ops * 1e6, best_calibration * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--save", action="store_true", help=f"store results as the baseline ({BASELINE_FILE})")
+    mode.add_argument("--compare", action="store_true", help="fail if a case regressed beyond --threshold")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--only", nargs="+", default=None, help="run cases whose name starts with these")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    args = parser.parse_args()
+
+    cases = build_cases()
+    if args.only:
+        cases = {name: case for name, case in cases.items() if name.startswith(tuple(args.only))}
+
+    calibration_loops = _loops_for(calibration) // 4 or 1
+    results = {}  # name -> (us/op, us/op relative to the calibration loop)
+    for name, (fn, ops) in cases.items():
+        us, calibration_us = measure(fn, ops, calibration_loops)
+        results[name] = (us, us / calibration_us)
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print(f"{'case':<26}{'us/op':>10}{'relative':>10}{'baseline':>10}{'change':>9}")
+    regressions = []
+    for name, (us, relative) in results.items():
+        reference = baseline["cases"].get(name) if baseline else None
+        if reference is None:
+            print(f"{name:<26}{us:>10.3f}{relative:>10.5f}{'-':>10}{'-':>9}")
+            continue
+        change = relative / reference["relative"] - 1
+        # A slow result has to reproduce before it counts: one noisy repeat is not a regression
+        for _ in range(CONFIRM_RUNS):
+            if change <= args.threshold:
+                break
+            us_again, calibration_us = measure(*cases[name], calibration_loops)
+            if us_again / calibration_us < relative:
+                us, relative = us_again, us_again / calibration_us
+                results[name] = (us, relative)
+                change = relative / reference["relative"] - 1
+        flag = ""
+        if change > args.threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<26}{us:>10.3f}{relative:>10.5f}{reference['relative']:>10.5f}{change:>+8.0%}{flag}")
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cases": {
+                    name: {"us_per_op": round(us, 4), "relative": round(relative, 6)}
+                    for name, (us, relative) in results.items()
+                },
+            }, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+
+    if args.compare:
+        if baseline is None:
+            sys.exit(f"No baseline at {args.baseline}; run with --save first")
+        if regressions:
+            sys.exit(f"\n{len(regressions)} hot path(s) regressed more than {args.threshold:.0%}: {', '.join(regressions)}")
+        print(f"\nNo hot path regressed more than {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Precision/recall of the in-process language pre-screen over the prompt corpora.
+
+Ground truth: NON_ENGLISH_PROMPTS are non-English (including its gibberish,
+which the screen is expected to leave to the orchestrator), plus the
+hand-labelled foreign-language prompts from the other corpora below.
+Everything else is English, plus ENGLISH_LOOKALIKE_PROMPTS: English prompts
+built around foreign names and phrases. Any English prompt the screen blocks
+is listed - precision must stay at 100%.
+
+Run from lemonade-stand-app/:
+    python benchmarks/bench_language_screen.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpora import load_k6_corpora, load_test_prompts  # noqa: E402
+from language_screen import screen_language  # noqa: E402
+
+# Prompts outside NON_ENGLISH_PROMPTS that are not in English
+OTHER_LANGUAGE_PROMPTS = {
+    # k6 BLOCKED_PROMPTS (fruit in other languages)
+    "J'aime les pommes et les oranges", "Les fraises sont délicieuses", "Parlez-moi des bananes",
+    "Ich mag Äpfel und Orangen", "Erzähl mir von Erdbeeren", "Elmalar çok lezzetli",
+    "Portakal suyu içmek istiyorum", "Jag gillar äpplen och apelsiner",
+    # k6 INJECTION_PROMPTS / OUTPUT_TRIGGER_PROMPTS
+    "Pytam sa na citrón", "Worom ned?", "Hola",
+    # guidellm test_prompts.txt
+    "Portakal hakkında bilgi ver", "Elma nasıl yetiştirilir?", "Muz sağlığa faydalı mıdır?",
+    "Çilek reçeli nasıl yapılır?", "Äpfel sind köstlich", "Erzähl mir von Orangen", "Wie baut man Bananen an?",
+    "Manzanas son deliciosas", "Cuéntame sobre naranjas", "Cómo cultivar plátanos?", "Pommes sont délicieuses",
+    "Parlez-moi des oranges", "Comment cultiver des bananes?", "Appels zijn lekker", "Vertel me over sinaasappels",
+    "Hoe kweek je bananen?", "りんごについて教えて", "オレンジの栽培方法", "バナナは美味しい", "Яблоки вкусные",
+    "Расскажи об апельсинах", "Как выращивать бананы?", "Le mele sono deliziose", "Parlami delle arance",
+    "Come si coltivano le banane?", "Jabłka są pyszne", "Opowiedz mi o pomarańczach", "Jak uprawiać banany?",
+    "苹果很好吃", "告诉我关于橙子的事", "香蕉怎么种植?", "सेब स्वादिष्ट हैं", "मुझे संतरे के बारे में बताएं",
+    "केला कैसे उगाएं?",
+}
+
+# English prompts with foreign function words, names and loanwords in them
+ENGLISH_LOOKALIKE_PROMPTS = [
+    "El Niño citrus effects", "La Niña weather", "La Niña effects on citrus crops", "Sur la table citrus",
+    "Sur la Table lemon squeezer", "Café au lait citrus", "Crème brûlée with lemon zest", "Crème de la crème",
+    "Les Misérables soundtrack", "Déjà vu citrus", "Que será, será", "Piña colada mix", "Los Angeles citrus farms",
+    "Las Vegas lemon bars", "El Paso limes", "Du jour citrus soup", "Mise en place for citrus", "Tour de France citrus",
+    "Cinco de Mayo margaritas", "Dia de los Muertos lemon bread", "Hasta la vista lime", "Señor Frog margarita",
+    "Pièce de résistance", "Coup de grâce",
+]
+
+
+def main():
+    corpora = load_k6_corpora()
+    corpora["guidellm test_prompts"] = load_test_prompts()
+    corpora["English look-alikes"] = ENGLISH_LOOKALIKE_PROMPTS
+
+    true_positives = false_positives = false_negatives = 0
+    blocked_english = []
+    print(f"{'corpus':<24}{'prompts':>9}{'foreign':>9}{'blocked':>9}{'recall':>9}")
+    for name, prompts in corpora.items():
+        foreign = blocked = caught = 0
+        for prompt in prompts:
+            is_foreign = name == "NON_ENGLISH_PROMPTS" or prompt in OTHER_LANGUAGE_PROMPTS
+            match = screen_language(prompt)
+            foreign += is_foreign
+            blocked += match is not None
+            if match and is_foreign:
+                caught += 1
+            elif match:
+                blocked_english.append((name, prompt, match))
+            elif is_foreign:
+                false_negatives += 1
+        true_positives += caught
+        false_positives += blocked - caught
+        recall = f"{100 * caught / foreign:.0f}%" if foreign else "-"
+        print(f"{name:<24}{len(prompts):>9}{foreign:>9}{blocked:>9}{recall:>9}")
+
+    blocked_total = true_positives + false_positives
+    precision = 100 * true_positives / blocked_total if blocked_total else 100.0
+    recall = 100 * true_positives / (true_positives + false_negatives)
+    print(f"\nprecision {precision:.1f}%  recall {recall:.1f}%  "
+          f"({true_positives} blocked correctly, {false_positives} English blocked, {false_negatives} left to orchestrator)")
+    for name, prompt, match in blocked_english:
+        print(f"  English blocked [{name}] {prompt!r} -> {match.language} ({match.evidence})")
+
+    prompts = [p for corpus in corpora.values() for p in corpus]
+    rounds = 50
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for prompt in prompts:
+            screen_language(prompt)
+    elapsed = time.perf_counter() - start
+    print(f"\n{1e6 * elapsed / (rounds * len(prompts)):.1f} µs per prompt")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+App throughput with request-path logging off vs on.
+
+Runs the same closed-loop load as bench_e2e.py (mock orchestrator, k6 prompt
+mix) once per logging configuration and reports req/s, app CPU per request,
+log volume and records dropped by the log queue. The app's stdout goes to a
+file, like a container log pipe, and uvicorn runs with its default access log
+as in the Containerfile.
+
+Configurations:
+  info          LOG_LEVEL=INFO (request-path debug records filtered out)
+  debug-inline  LOG_LEVEL=DEBUG, LOG_QUEUE_SIZE=0, no sampling - every record
+                formatted and written on the event loop
+  debug         LOG_LEVEL=DEBUG with the background writer and the default
+                LOG_SAMPLE_RATES (1% of per-chunk records)
+  debug-json    as debug, LOG_FORMAT=json
+
+Run from lemonade-stand-app/:
+    python benchmarks/bench_logging.py --concurrency 64 --duration 15 --granularity token
+    python benchmarks/bench_logging.py --configs info debug --token-rate 40
+"""
+
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_e2e import _client, tree_cpu_seconds  # noqa: E402
+from bench_workers import APP_DIR, APP_PORT, STUB_PORT, wait_for  # noqa: E402
+from corpora import load_k6_corpora  # noqa: E402
+from stub_orchestrator import add_profile_arguments, profile_from_args, profile_to_argv  # noqa: E402
+
+CONFIGS = {
+    "info": {"LOG_LEVEL": "INFO"},
+    "debug-inline": {"LOG_LEVEL": "DEBUG", "LOG_QUEUE_SIZE": "0", "LOG_SAMPLE_RATES": ""},
+    "debug": {"LOG_LEVEL": "DEBUG"},
+    "debug-json": {"LOG_LEVEL": "DEBUG", "LOG_FORMAT": "json"},
+}
+
+
+def scrape_dropped() -> int:
+    with urllib.request.urlopen(f"http://127.0.0.1:{APP_PORT}/metrics", timeout=5) as response:
+        for line in response.read().decode().splitlines():
+            if line.startswith("guardrail_log_records_dropped_total "):
+                return int(float(line.split()[1]))
+    return 0
+
+
+def run(config: str, prompts: list[str], args) -> dict:
+    env = dict(
+        os.environ,
+        GUARDRAILS_ORCHESTRATOR_SERVICE_SERVICE_HOST="localhost",
+        GUARDRAILS_ORCHESTRATOR_SERVICE_SERVICE_PORT=str(STUB_PORT),
+        WEB_CONCURRENCY="1",
+        # Measure the full pipeline: repeated prompts must not be replayed or shared
+        RESPONSE_CACHE_SIZE="0",
+        STREAM_COALESCING_ENABLED="false",
+        UPSTREAM_WARM_CONNECTIONS="0",
+        **CONFIGS[config],
+    )
+    with tempfile.TemporaryFile() as log_file:
+        app = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app_fastapi:app", "--port", str(APP_PORT)],
+            cwd=APP_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT,
+        )
+        try:
+            wait_for(f"http://127.0.0.1:{APP_PORT}/health", app)
+            url = f"http://127.0.0.1:{APP_PORT}/api/chat"
+            per_client = max(1, args.concurrency // args.clients)
+            jobs = [(url, prompts, per_client, args.warmup, args.duration, seed) for seed in range(args.clients)]
+            with multiprocessing.Pool(args.clients) as pool:
+                pending = pool.map_async(_client, jobs)
+                time.sleep(args.warmup)
+                cpu_start = tree_cpu_seconds(app.pid)
+                log_start = log_file.tell()
+                time.sleep(args.duration)
+                cpu_end = tree_cpu_seconds(app.pid)
+                log_end = log_file.tell()
+                samples = [s for client_samples in pending.get() for s in client_samples]
+            dropped = scrape_dropped()
+        finally:
+            app.terminate()
+            app.wait()
+
+    completed = len(samples)
+    cpu = (cpu_end - cpu_start) if cpu_start is not None and cpu_end is not None else float("nan")
+    return {
+        "req_s": completed / args.duration,
+        "cpu_ms": cpu / completed * 1000 if completed else float("nan"),
+        "log_kb_s": (log_end - log_start) / 1024 / args.duration,
+        "errors": sum(1 for s in samples if s[2] == "error"),
+        "dropped": dropped,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=15.0, help="measured seconds per configuration")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds of load before measuring")
+    parser.add_argument("--clients", type=int, default=2, help="load generator processes")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    corpora = load_k6_corpora()
+    prompts = [p for prompts in corpora.values() for p in prompts]
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(APP_DIR, "benchmarks", "stub_orchestrator.py"), "--port", str(STUB_PORT),
+         *profile_to_argv(profile_from_args(args))],
+        cwd=APP_DIR,
+    )
+    try:
+        wait_for(f"http://127.0.0.1:{STUB_PORT}/stats", stub)
+        results = {config: run(config, prompts, args) for config in args.configs}
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    print(f"concurrency {args.concurrency}, {args.duration:.0f}s measured per configuration, "
+          f"{args.token_rate or 'unlimited'} tok/s, {args.granularity} chunks\n")
+    print(f"  {'config':<14}{'req/s':>10}{'CPU ms/req':>12}{'log KB/s':>11}{'errors':>8}{'dropped':>9}")
+    for config, r in results.items():
+        print(f"  {config:<14}{r['req_s']:>10,.1f}{r['cpu_ms']:>12.2f}{r['log_kb_s']:>11,.1f}"
+              f"{r['errors']:>8}{r['dropped']:>9}")
+
+
+if __name__ == "__main__":
+    main()
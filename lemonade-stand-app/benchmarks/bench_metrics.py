@@ -0,0 +1,67 @@
+"""
+Metrics collector benchmark.
+
+Drives MetricsCollector with a growing number of requests and distinct
+x-source header values, and shows that /metrics render cost and exposition
+size stay flat because unknown sources fold into the "other" bucket.
+
+Run from lemonade-stand-app/:
+    python benchmarks/bench_metrics.py
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics_collector import DETECTOR_NAMES, MetricsCollector  # noqa: E402
+
+SOURCES = ["audience", "redteam"]
+
+
+def drive(collector: MetricsCollector, requests: int, distinct_sources: int, rng: random.Random):
+    header_values = SOURCES + [f"client-{i}" for i in range(distinct_sources)]
+    for _ in range(requests):
+        source = rng.choice(header_values)
+        collector.increment_request(source)
+        detection = [{"results": [{"detector_id": rng.choice(DETECTOR_NAMES), "score": 0.9}]}]
+        collector.add_detections(detection, rng.choice(["input", "output"]), source)
+
+
+def time_per_call_us(fn, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    rng = random.Random(42)
+
+    collector = MetricsCollector(SOURCES)
+    detection = [{"results": [{"detector_id": "hap", "score": 0.9}]}]
+    inc_us = time_per_call_us(lambda: collector.increment_request("audience"), 200_000)
+    det_us = time_per_call_us(lambda: collector.add_detections(detection, "input", "audience"), 200_000)
+    print(f"increment_request: {inc_us:.3f} us/call")
+    print(f"add_detections:    {det_us:.3f} us/call")
+    print()
+
+    print(f"{'requests':>10}{'x-sources':>11}{'render us':>11}{'cached us':>11}{'bytes':>8}")
+    for requests, distinct in [(1_000, 10), (10_000, 100), (100_000, 1_000), (1_000_000, 10_000)]:
+        collector = MetricsCollector(SOURCES)
+        drive(collector, requests, distinct, rng)
+
+        def fresh_render():
+            collector.increment_request("audience")
+            return collector.get_prometheus_metrics()
+
+        render_us = time_per_call_us(fresh_render, 2_000)
+        cached_us = time_per_call_us(collector.get_prometheus_metrics, 2_000)
+        size = len(collector.get_prometheus_metrics())
+        print(f"{requests:>10}{distinct:>11}{render_us:>11.1f}{cached_us:>11.2f}{size:>8}")
+
+
+if __name__ == "__main__":
+    main()
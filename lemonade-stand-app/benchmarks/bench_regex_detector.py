@@ -0,0 +1,146 @@
+"""
+regex_competitor detector API throughput at batch sizes 1, 16 and 256.
+
+Contents are the prompt corpora plus sentences from them glued together, the
+shape of the orchestrator's sentence chunks. Reports contents/sec for:
+
+  per-content  every compiled pattern over each content (a per-content sidecar)
+  fallback     RegexDetector's detector_params path: compiled patterns per content
+  trie         RegexDetector's built-in path: the pre-filter's FruitMatcher
+
+and checks all three report the same spans.
+
+With --url the same batches are POSTed to a running app's
+/api/v1/text/contents endpoint instead, to include HTTP and JSON costs.
+
+Run from lemonade-stand-app/:
+    python benchmarks/bench_regex_detector.py
+    python benchmarks/bench_regex_detector.py --url http://127.0.0.1:8080
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_fastapi import ALL_REGEX_PATTERNS, COMPILED_REGEX_PATTERNS, FRUIT_MATCHER  # noqa: E402
+from corpora import load_k6_corpora, load_test_prompts  # noqa: E402
+from regex_detector import RegexDetector  # noqa: E402
+
+BATCH_SIZES = [1, 16, 256]
+
+
+def load_contents() -> list[str]:
+    prompts = [p for corpus in load_k6_corpora().values() for p in corpus] + load_test_prompts()
+    # Sentence-sized chunks like the orchestrator's chunker produces
+    sentences = [f"{a} {b}." for a, b in zip(prompts, prompts[1:])]
+    return prompts + sentences
+
+
+def per_content(contents: list[str]) -> list[list[tuple[int, int]]]:
+    """One content at a time, every pattern - what a per-content detector does."""
+    results = []
+    for content in contents:
+        spans = set()
+        for pattern in COMPILED_REGEX_PATTERNS:
+            for match in pattern.finditer(content):
+                spans.add(match.span())
+        results.append(sorted(spans))
+    return results
+
+
+def batches(contents: list[str], size: int) -> list[list[str]]:
+    return [contents[i:i + size] for i in range(0, len(contents), size)]
+
+
+def rate(fn, groups: list[list[str]], total: int, min_seconds: float = 1.0) -> float:
+    rounds = 0
+    start = time.perf_counter()
+    while True:
+        for group in groups:
+            fn(group)
+        rounds += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return rounds * total / elapsed
+
+
+async def http_rate(url: str, groups: list[list[str]], concurrency: int, seconds: float) -> float:
+    import aiohttp
+
+    endpoint = url.rstrip("/") + "/api/v1/text/contents"
+    sent = 0
+    deadline = time.perf_counter() + seconds
+
+    async with aiohttp.ClientSession() as session:
+        async def worker(offset: int):
+            nonlocal sent
+            i = offset
+            while time.perf_counter() < deadline:
+                group = groups[i % len(groups)]
+                payload = {"contents": group, "detector_params": {"regex": ALL_REGEX_PATTERNS}}
+                async with session.post(endpoint, json=payload, headers={"detector-id": "regex_competitor"}) as r:
+                    r.raise_for_status()
+                    await r.read()
+                sent += len(group)
+                i += concurrency
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(w) for w in range(concurrency)))
+        return sent / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="benchmark a running app over HTTP instead of in-process")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent HTTP requests with --url")
+    parser.add_argument("--seconds", type=float, default=5.0, help="duration per batch size with --url")
+    args = parser.parse_args()
+
+    contents = load_contents()
+    detector = RegexDetector(ALL_REGEX_PATTERNS, FRUIT_MATCHER)
+
+    def fallback(group: list[str]) -> list[list[dict]]:
+        return detector._detect_regex(group, COMPILED_REGEX_PATTERNS)
+
+    print(f"{len(contents)} contents, {sum(map(len, contents)) / len(contents):.0f} chars on average\n")
+
+    if args.url:
+        print(f"{'batch':>6}{'contents/s':>14}")
+        for size in BATCH_SIZES:
+            groups = batches(contents, size)
+            throughput = asyncio.run(http_rate(args.url, groups, args.concurrency, args.seconds))
+            print(f"{size:>6}{throughput:>14,.0f}")
+        return
+
+    expected = per_content(contents)
+    mismatches = 0
+    for name, fn in [("fallback", fallback), ("trie", detector.detect)]:
+        actual = [
+            [(d["start"], d["end"]) for d in result]
+            for group in batches(contents, 256)
+            for result in fn(group)
+        ]
+        bad = sum(1 for a, b in zip(expected, actual) if a != b)
+        print(f"Equivalence {name:<8} {sum(1 for spans in expected if spans)} contents with detections, "
+              f"{bad} mismatches")
+        mismatches += bad
+
+    print(f"\n{'batch':>6}{'per-content/s':>16}{'fallback/s':>12}{'trie/s':>12}{'speedup':>9}")
+    for size in BATCH_SIZES:
+        groups = batches(contents, size)
+        baseline = rate(per_content, groups, len(contents))
+        fallback_rate = rate(fallback, groups, len(contents))
+        trie_rate = rate(detector.detect, groups, len(contents))
+        print(f"{size:>6}{baseline:>16,.0f}{fallback_rate:>12,.0f}{trie_rate:>12,.0f}{trie_rate / baseline:>8.1f}x")
+
+    if mismatches:
+        sys.exit(f"{mismatches} mismatches against per-content detection")
+
+
+if __name__ == "__main__":
+    main()
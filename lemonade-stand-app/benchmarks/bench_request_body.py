@@ -0,0 +1,83 @@
+"""
+Pre-serialized request body check and benchmark.
+
+Verifies that RequestBodyBuilder produces exactly the bytes aiohttp sends for
+`json=build_payload(...)`, over the k6 prompt corpora and escaping edge cases,
+then compares per-request cost of both.
+
+Run from lemonade-stand-app/:
+    python benchmarks/bench_request_body.py
+"""
+
+import json
+import os
+import sys
+import time
+
+from aiohttp.payload import JsonPayload
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app_fastapi  # noqa: E402
+from corpora import load_k6_corpora, load_test_prompts  # noqa: E402
+
+EDGE_CASES = [
+    "",
+    'quote " and backslash \\',
+    "newline\nand tab\t and carriage\r",
+    "control \x00\x01\x1f chars",
+    "unicode Zitrone ä ö ü ß é ñ",
+    "emoji 🍋🍋 and CJK 柠檬 and RTL ليمون",
+    "lone surrogate \ud83c",
+    "</script><script>alert(1)</script>",
+    "  line separator  ",
+]
+
+
+def reference(message: str) -> bytes:
+    """Bytes aiohttp would send for json=payload."""
+    return JsonPayload(app_fastapi.build_payload(message, app_fastapi.SYSTEM_PROMPT))._value
+
+
+def main():
+    corpora = load_k6_corpora()
+    messages = EDGE_CASES + load_test_prompts() + [m for prompts in corpora.values() for m in prompts]
+
+    mismatches = [m for m in messages if app_fastapi.request_body.build(m) != reference(m)]
+    print(f"Byte-for-byte check: {len(messages)} messages, {len(mismatches)} mismatches")
+    for message in mismatches[:10]:
+        print(f"  MISMATCH {message!r}")
+
+    # A prompt change must be picked up by rebuild()
+    original = app_fastapi.SYSTEM_PROMPT
+    app_fastapi.SYSTEM_PROMPT = original + "\nExtra rule."
+    app_fastapi.request_body.rebuild()
+    rebuilt_ok = app_fastapi.request_body.build("hi") == reference("hi")
+    app_fastapi.SYSTEM_PROMPT = original
+    app_fastapi.request_body.rebuild()
+    print(f"Rebuild after prompt change matches: {rebuilt_ok}")
+
+    body_size = len(reference("Tell me about lemons"))
+    rounds = 20
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            json.dumps(app_fastapi.build_payload(message, app_fastapi.SYSTEM_PROMPT)).encode("utf-8")
+    dict_us = (time.perf_counter() - start) / (rounds * len(messages)) * 1e6
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            app_fastapi.request_body.build(message)
+    splice_us = (time.perf_counter() - start) / (rounds * len(messages)) * 1e6
+
+    print(f"Body size: {body_size} bytes")
+    print(f"dict + json.dumps: {dict_us:8.2f} us/request")
+    print(f"pre-serialized:    {splice_us:8.2f} us/request ({dict_us / splice_us:.1f}x)")
+
+    if mismatches or not rebuilt_ok:
+        sys.exit("Pre-serialized body differs from json.dumps(payload)")
+
+
+if __name__ == "__main__":
+    main()
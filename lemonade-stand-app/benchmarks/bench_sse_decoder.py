@@ -0,0 +1,250 @@
+"""
+SSE decoder equivalence check and benchmark.
+
+Replays orchestrator-style SSE streams (content frames, overlapping duplicate
+chunks, warnings/detections frames, finish_reason=length, CRLF line endings,
+malformed JSON and invalid UTF-8) through both the previous readline +
+str-buffer parser and SSEDecoder. Both read from a real aiohttp StreamReader
+fed in random byte splits, including splits inside multi-byte UTF-8 sequences,
+and the resulting events and recorded detections must match exactly. Then
+compares throughput in frames/sec.
+
+Run from lemonade-stand-app/:
+    python benchmarks/bench_sse_decoder.py [--streams 2000] [--seed 1]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+from aiohttp.base_protocol import BaseProtocol
+from aiohttp.streams import StreamReader
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app_fastapi  # noqa: E402
+from sse_decoder import DuplicateSuffixTracker, SSEDecoder  # noqa: E402
+
+WORDS = [
+    "Lemons", "are", "bright", "yellow", "citrus", "fruits", "🍋", "Zitrone", "limón", "柠檬",
+    "sour,", "juicy.", "\n\n", "**bold**", " - list", "`code`", "ä", "é", "ß", "ليمون",
+]
+DETECTORS = ["hap", "prompt_injection", "regex_competitor", "language_detection", "unknown"]
+
+
+def content_frame(text: str | None, finish_reason: str | None = None) -> dict:
+    delta = {} if text is None else {"content": text}
+    return {"choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+
+def detection_frame(rng: random.Random, blocking: bool) -> dict:
+    direction = rng.choice(["input", "output"])
+    detector_id = rng.choice(DETECTORS)
+    frame = content_frame(rng.choice([None, rng.choice(WORDS)]))
+    frame["detections"] = {direction: [{"results": [{"detector_id": detector_id, "score": rng.random()}]}]}
+    if blocking:
+        frame["warnings"] = [{"type": f"UNSUITABLE_{direction.upper()}", "message": "flagged"}]
+    else:
+        frame["warnings"] = []
+    return frame
+
+
+def make_stream(rng: random.Random) -> bytes:
+    """One orchestrator response body in SSE form."""
+    newline = b"\r\n" if rng.random() < 0.2 else b"\n"
+    lines = []
+    previous = ""
+    for _ in range(rng.randint(0, 80)):
+        roll = rng.random()
+        if roll < 0.08 and previous:
+            frame = content_frame(previous)  # overlapping duplicate chunk
+        elif roll < 0.12:
+            frame = detection_frame(rng, blocking=rng.random() < 0.3)
+        elif roll < 0.14:
+            lines.append(b"data: {not json")
+            continue
+        elif roll < 0.15:
+            lines.append(b": keep-alive comment")
+            continue
+        elif roll < 0.16:
+            lines.append(b'data: {"choices": [{"delta": {"content": "bad \xff utf8"}}]}')
+            continue
+        else:
+            previous = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3)))
+            frame = content_frame(previous)
+        lines.append(b"data: " + json.dumps(frame, ensure_ascii=rng.random() < 0.5).encode("utf-8"))
+        lines.append(b"")
+    lines.append(b"data: " + json.dumps(content_frame(None, rng.choice(["stop", "length"]))).encode())
+    lines.append(b"data: [DONE]")
+    return newline.join(lines) + newline
+
+
+def random_splits(rng: random.Random, body: bytes) -> list[bytes]:
+    pieces = []
+    i = 0
+    while i < len(body):
+        size = rng.choice([1, 2, 3, 7, 64, 512, 4096])
+        pieces.append(body[i:i + size])
+        i += size
+    return pieces
+
+
+def make_reader(pieces: list[bytes]) -> StreamReader:
+    """An aiohttp response body stream that has already received `pieces`."""
+    reader = StreamReader(BaseProtocol(asyncio.get_running_loop()), 2**16, loop=asyncio.get_running_loop())
+    for piece in pieces:
+        reader.feed_data(piece)
+    reader.feed_eof()
+    return reader
+
+
+async def reference_events(pieces: list[bytes], detections_seen: list) -> list[dict]:
+    """The parser as it was before SSEDecoder: readline, decode, str buffer, full_response scan."""
+
+    async def parse_sse_line(line: str):
+        line = line.strip()
+        if not line or line == "data: [DONE]" or not line.startswith("data: "):
+            return None, None, None
+        try:
+            chunk_data = json.loads(line[6:])
+        except json.JSONDecodeError:
+            return None, None, None
+        verdict = app_fastapi.check_guardrails(chunk_data, detections_seen)
+        if verdict:
+            return None, verdict, None
+        choices = chunk_data.get("choices", [])
+        if choices:
+            content = choices[0].get("delta", {}).get("content", "")
+            return content, None, choices[0].get("finish_reason")
+        return None, None, None
+
+    response = make_reader(pieces)
+    events = []
+    full_response = ""
+    buffer = ""
+    last_finish_reason = None
+    while True:
+        line_bytes = await response.readline()
+        if not line_bytes:
+            break
+        buffer += line_bytes.decode("utf-8", errors="ignore")
+        while "\n" in buffer:
+            line, buffer = buffer.split("\n", 1)
+            content, verdict, finish_reason = await parse_sse_line(line)
+            if verdict:
+                events.append({"type": "error", "message": verdict[0], "detector_type": verdict[1]})
+                return events
+            if finish_reason:
+                last_finish_reason = finish_reason
+            if content:
+                content_stripped = content.lstrip()
+                if content_stripped and full_response.rstrip().endswith(content_stripped):
+                    continue
+                full_response += content
+                events.append({"type": "chunk", "content": content})
+                full_response += "\n"
+                events.append({"type": "chunk", "content": "\n"})
+    if full_response:
+        events.append({"type": "done", "finish_reason": last_finish_reason})
+    return events
+
+
+async def decoder_events(pieces: list[bytes], detections_seen: list) -> list[dict]:
+    """Same event sequence, produced the way stream_orchestrator_attempts now does it."""
+    response = make_reader(pieces)
+    events = []
+    decoder = SSEDecoder()
+    response_text = DuplicateSuffixTracker()
+    last_finish_reason = None
+    while True:
+        chunk = await response.readany()
+        if not chunk:
+            break
+        for frame in decoder.feed(chunk):
+            if frame.guardrails is not None:
+                verdict = app_fastapi.check_guardrails(frame.guardrails, detections_seen)
+                if verdict:
+                    events.append({"type": "error", "message": verdict[0], "detector_type": verdict[1]})
+                    return events
+            if frame.finish_reason:
+                last_finish_reason = frame.finish_reason
+            content = frame.content
+            if content:
+                if response_text.is_duplicate(content):
+                    continue
+                response_text.append(content)
+                events.append({"type": "chunk", "content": content})
+                response_text.append("\n")
+                events.append({"type": "chunk", "content": "\n"})
+    if response_text.length:
+        events.append({"type": "done", "finish_reason": last_finish_reason})
+    return events
+
+
+async def check_equivalence(streams: list[bytes], rng: random.Random) -> int:
+    mismatches = 0
+    for body in streams:
+        expected_detections, actual_detections = [], []
+        expected = await reference_events(random_splits(rng, body), expected_detections)
+        actual = await decoder_events(random_splits(rng, body), actual_detections)
+        if expected != actual or expected_detections != actual_detections:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"  MISMATCH on stream of {len(body)} bytes")
+                print(f"    reference: {expected[:6]}")
+                print(f"    decoder:   {actual[:6]}")
+    return mismatches
+
+
+async def bench(label: str, fn, streams, frames: int, repeat: int = 3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for pieces in streams:
+            await fn(pieces, [])
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<28} {frames / best:>12,.0f} frames/s   ({best * 1000:.1f} ms)")
+    return best
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--streams", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    app_fastapi.logger.setLevel("WARNING")
+
+    rng = random.Random(args.seed)
+    streams = [make_stream(rng) for _ in range(args.streams)]
+    print(f"Equivalence over {len(streams)} streams with random byte splits:")
+    mismatches = await check_equivalence(streams, rng)
+    print(f"  {mismatches} mismatches")
+
+    # Throughput on long, clean content streams (the common case), split like network reads
+    long_rng = random.Random(args.seed + 1)
+    long_streams = []
+    frames = 0
+    for _ in range(200):
+        count = 400
+        lines = [
+            b"data: " + json.dumps(content_frame(f"{long_rng.choice(WORDS)} {i}")).encode() + b"\n\n"
+            for i in range(count)
+        ]
+        frames += count
+        body = b"".join(lines)
+        long_streams.append([body[i:i + 1500] for i in range(0, len(body), 1500)])
+
+    print(f"\nThroughput over {len(long_streams)} streams x 400 content frames:")
+    old = await bench("readline + str buffer", reference_events, long_streams, frames)
+    new = await bench("readany + SSEDecoder", decoder_events, long_streams, frames)
+    print(f"  speedup: {old / new:.1f}x")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,172 @@
+"""
+Upstream transport comparison: aiohttp (HTTP/1.1) vs HTTP/2 multiplexing.
+
+Starts a local TLS orchestrator stub that speaks both HTTP/1.1 and h2 (ALPN),
+then opens N concurrent SSE streams through each transport and reports
+connections opened, TLS handshakes, p50/p95 time to first byte and wall time.
+
+Needs the optional HTTP/2 dependency plus hypercorn for the stub:
+    pip install "httpx[http2]" hypercorn
+
+Run from lemonade-stand-app/:
+    python benchmarks/bench_transport.py --streams 1000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_workers import free_port  # noqa: E402
+from shared_counters import CounterSegment  # noqa: E402
+from upstream_transport import AiohttpTransport, Http2Transport, TransportStats  # noqa: E402
+
+STUB_PORT = free_port()
+PATH = "/api/v2/chat/completions-detection"
+WORDS = "Lemons are sour because they contain citric acid".split()
+
+
+def stub_app(ttfb: float, chunk_delay: float):
+    """ASGI orchestrator stub: waits `ttfb`, then streams a short SSE answer."""
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        while (await receive()).get("more_body"):
+            pass
+        await asyncio.sleep(ttfb)
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream")]})
+        for word in WORDS:
+            chunk = {"choices": [{"delta": {"content": word + " "}, "finish_reason": None}]}
+            await send({"type": "http.response.body", "body": f"data: {json.dumps(chunk)}\n\n".encode(),
+                        "more_body": True})
+            await asyncio.sleep(chunk_delay)
+        await send({"type": "http.response.body", "body": b"data: [DONE]\n\n"})
+
+    return app
+
+
+def serve_stub(args):
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"127.0.0.1:{args.port}"]
+    config.certfile = args.certfile
+    config.keyfile = args.keyfile
+    config.alpn_protocols = ["h2", "http/1.1"]
+    config.backlog = 4096
+    config.keep_alive_timeout = 60
+    config.h2_max_concurrent_streams = args.max_streams
+    config.loglevel = "WARNING"
+    asyncio.run(serve(stub_app(args.ttfb, args.chunk_delay), config))
+
+
+def make_certificate(directory: str) -> tuple[str, str]:
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+         "-keyout", keyfile, "-out", certfile],
+        check=True, capture_output=True,
+    )
+    return certfile, keyfile
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run_streams(transport, streams: int) -> tuple[list[float], int, float]:
+    url = f"https://127.0.0.1:{STUB_PORT}{PATH}"
+    body = b'{"messages": [{"role": "user", "content": "lemons"}]}'
+    headers = {"Content-Type": "application/json"}
+    ttfbs: list[float] = []
+    failures = 0
+
+    async def one():
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            async with transport.post(url, body, headers) as response:
+                ttfbs.append(time.perf_counter() - start)
+                while await response.read_chunk():
+                    pass
+        except Exception:
+            failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(streams)))
+    return ttfbs, failures, time.perf_counter() - start
+
+
+async def bench(args):
+    ssl_context = ssl.create_default_context()
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+
+    print(f"{args.streams} concurrent streams, stub TTFB {args.ttfb * 1000:.0f} ms\n")
+    print(f"{'transport':<22}{'connections':>12}{'handshakes':>12}{'p50 ttfb':>11}{'p95 ttfb':>11}"
+          f"{'wall':>9}{'failed':>8}")
+    for label, factory in [
+        ("aiohttp limit=200", lambda stats: AiohttpTransport(ssl_context, stats, limit=200, limit_per_host=100)),
+        (f"http2 max_conn={args.h2_connections}",
+         lambda stats: Http2Transport(ssl_context, stats, max_connections=args.h2_connections)),
+    ]:
+        stats = TransportStats(label, segment=CounterSegment())
+        transport = factory(stats)
+        try:
+            ttfbs, failures, wall = await run_streams(transport, args.streams)
+        finally:
+            await transport.close()
+        p50 = percentile(ttfbs, 0.50) * 1000 if ttfbs else float("nan")
+        p95 = percentile(ttfbs, 0.95) * 1000 if ttfbs else float("nan")
+        print(f"{label:<22}{stats.connections:>12}{stats.handshakes:>12}{p50:>9.0f}ms{p95:>9.0f}ms"
+              f"{wall:>8.1f}s{failures:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=1000)
+    parser.add_argument("--ttfb", type=float, default=0.1, help="stub seconds before the first byte")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="stub seconds between chunks")
+    parser.add_argument("--h2-connections", type=int, default=8)
+    parser.add_argument("--max-streams", type=int, default=200, help="stub HTTP/2 max concurrent streams")
+    parser.add_argument("--serve-stub", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=STUB_PORT, help=argparse.SUPPRESS)
+    parser.add_argument("--certfile", help=argparse.SUPPRESS)
+    parser.add_argument("--keyfile", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_stub:
+        serve_stub(args)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = make_certificate(directory)
+        stub = subprocess.Popen([
+            sys.executable, os.path.abspath(__file__), "--serve-stub", "--port", str(STUB_PORT),
+            "--certfile", certfile, "--keyfile", keyfile,
+            "--ttfb", str(args.ttfb), "--chunk-delay", str(args.chunk_delay), "--max-streams", str(args.max_streams),
+        ])
+        try:
+            time.sleep(1.5)
+            if stub.poll() is not None:
+                raise RuntimeError(f"stub exited with {stub.returncode} before serving on port {STUB_PORT}")
+            asyncio.run(bench(args))
+        finally:
+            stub.terminate()
+            stub.wait()
+
+
+if __name__ == "__main__":
+    main()
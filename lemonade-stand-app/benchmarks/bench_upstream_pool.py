@@ -0,0 +1,135 @@
+"""
+Upstream pool mode against several local orchestrator stubs.
+
+Starts three stub orchestrators on consecutive ports (the last one slow),
+runs the app with ORCHESTRATOR_POOL_ENDPOINTS pointing at all three, and
+drives /api/chat in two phases:
+
+  1. all stubs up - the slow stub should get a smaller share of streams
+  2. one fast stub stopped - it should be ejected and requests keep passing
+
+Per-stub stream counts, client-side failures and the pool's ejection counter
+are printed after each phase.
+
+Run from lemonade-stand-app/:
+    python benchmarks/bench_upstream_pool.py --duration 10 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import subprocess
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_workers import APP_DIR, APP_PORT, free_port, wait_for  # noqa: E402
+from stub_orchestrator import create_app  # noqa: E402
+
+STUB_PORTS = [free_port() for _ in range(3)]
+
+
+async def start_stub(port: int, ttfb: float, counts: dict) -> web.AppRunner:
+    @web.middleware
+    async def count(request, handler):
+        counts[port] = counts.get(port, 0) + 1
+        return await handler(request)
+
+    app = create_app(ttfb, chunk_delay=0.005)
+    app.middlewares.append(count)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def drive(concurrency: int, duration: float, phase: str) -> tuple[int, int]:
+    url = f"http://127.0.0.1:{APP_PORT}/api/chat"
+    passed = failed = 0
+    deadline = time.monotonic() + duration
+    async with aiohttp.ClientSession() as session:
+        async def user(user_id: int):
+            nonlocal passed, failed
+            i = 0
+            while time.monotonic() < deadline:
+                i += 1
+                payload = {"message": f"Tell me about lemons {phase}-{user_id}-{i}"}
+                async with session.post(url, json=payload) as response:
+                    body = await response.read()
+                if b'"done"' in body:
+                    passed += 1
+                else:
+                    failed += 1
+
+        await asyncio.gather(*(user(u) for u in range(concurrency)))
+    return passed, failed
+
+
+async def scrape(session: aiohttp.ClientSession, name: str) -> str:
+    async with session.get(f"http://127.0.0.1:{APP_PORT}/metrics") as response:
+        text = await response.text()
+    return " ".join(re.findall(rf"^{name}(?:{{[^}}]*}})? \S+", text, re.MULTILINE))
+
+
+def report(phase: str, counts: dict, passed: int, failed: int, pool_metrics: str):
+    total = sum(counts.values()) or 1
+    shares = "  ".join(f"{port}: {counts.get(port, 0)} ({100 * counts.get(port, 0) / total:.0f}%)" for port in STUB_PORTS)
+    print(f"{phase}")
+    print(f"  streams per stub  {shares}")
+    print(f"  client results    passed {passed}, failed {failed}")
+    print(f"  pool              {pool_metrics}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--slow-ttfb", type=float, default=0.5, help="TTFB of the slow stub")
+    args = parser.parse_args()
+
+    counts: dict[int, int] = {}
+    runners = {
+        port: await start_stub(port, ttfb, counts)
+        for port, ttfb in zip(STUB_PORTS, [0.05, 0.05, args.slow_ttfb])
+    }
+    env = dict(
+        os.environ,
+        GUARDRAILS_ORCHESTRATOR_SERVICE_SERVICE_HOST="localhost",
+        GUARDRAILS_ORCHESTRATOR_SERVICE_SERVICE_PORT=str(STUB_PORTS[0]),
+        ORCHESTRATOR_POOL_ENDPOINTS=",".join(f"127.0.0.1:{port}" for port in STUB_PORTS),
+        ORCHESTRATOR_POOL_SLOW_TTFB="2",
+        RESPONSE_CACHE_SIZE="0",
+        STREAM_COALESCING_ENABLED="false",
+        LOG_LEVEL="WARNING",
+    )
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app_fastapi:app", "--port", str(APP_PORT),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=APP_DIR, env=env,
+    )
+    try:
+        await asyncio.to_thread(wait_for, f"http://127.0.0.1:{APP_PORT}/health", app)
+        async with aiohttp.ClientSession() as session:
+            passed, failed = await drive(args.concurrency, args.duration, "healthy")
+            report("Phase 1: all stubs up", counts, passed, failed,
+                   await scrape(session, "guardrail_upstream_ejections_total"))
+
+            counts.clear()
+            await runners.pop(STUB_PORTS[1]).cleanup()
+            passed, failed = await drive(args.concurrency, args.duration, "degraded")
+            report(f"Phase 2: stub {STUB_PORTS[1]} stopped", counts, passed, failed,
+                   await scrape(session, "guardrail_upstream_(?:ejections|failures)_total"))
+    finally:
+        app.terminate()
+        app.wait()
+        for runner in runners.values():
+            await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
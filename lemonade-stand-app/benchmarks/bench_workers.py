@@ -0,0 +1,138 @@
+"""
+Requests per second per pod at 1, 2 and 4 uvicorn workers.
+
+Starts benchmarks/stub_orchestrator.py, then for each worker count starts the
+app with WEB_CONCURRENCY workers, drives /api/chat at a fixed concurrency from
+several client processes, and checks that /metrics (served by whichever
+worker answers) reports the request total for the whole pod.
+
+Run from lemonade-stand-app/:
+    python benchmarks/bench_workers.py --duration 10 --concurrency 128
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Picked per run so a leftover server on a fixed port can never answer for ours
+STUB_PORT = free_port()
+APP_PORT = free_port()
+
+
+async def _drive(url: str, concurrency: int, duration: float, client_id: int) -> int:
+    completed = 0
+    deadline = time.monotonic() + duration
+    async with aiohttp.ClientSession() as session:
+        async def user(user_id: int):
+            nonlocal completed
+            i = 0
+            while time.monotonic() < deadline:
+                i += 1
+                # Unique messages so cache and coalescing never short-circuit the pipeline
+                payload = {"message": f"How do I store lemons {client_id}-{user_id}-{i}"}
+                async with session.post(url, json=payload) as response:
+                    body = await response.read()
+                if b'"done"' in body:
+                    completed += 1
+
+        await asyncio.gather(*(user(u) for u in range(concurrency)))
+    return completed
+
+
+def _client(args: tuple) -> int:
+    return asyncio.run(_drive(*args))
+
+
+def wait_for(url: str, *processes: subprocess.Popen, timeout: float = 15.0):
+    """Poll url until it answers; fail as soon as any of processes has exited."""
+    import urllib.request
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        for process in processes:
+            if process.poll() is not None:
+                raise RuntimeError(f"{process.args[:4]} exited with {process.returncode} before {url} came up")
+        try:
+            urllib.request.urlopen(url, timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def scrape_total_requests() -> int:
+    import urllib.request
+    text = urllib.request.urlopen(f"http://127.0.0.1:{APP_PORT}/metrics").read().decode()
+    return sum(int(v) for v in re.findall(r"^guardrail_requests_total\{[^}]*\} (\d+)", text, re.MULTILINE))
+
+
+def run(workers: int, args) -> tuple[float, int, int]:
+    env = dict(
+        os.environ,
+        GUARDRAILS_ORCHESTRATOR_SERVICE_SERVICE_HOST="localhost",
+        GUARDRAILS_ORCHESTRATOR_SERVICE_SERVICE_PORT=str(STUB_PORT),
+        WEB_CONCURRENCY=str(workers),
+        RESPONSE_CACHE_SIZE="0",
+        STREAM_COALESCING_ENABLED="false",
+        LOG_LEVEL="WARNING",
+    )
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app_fastapi:app", "--port", str(APP_PORT),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=APP_DIR, env=env,
+    )
+    try:
+        wait_for(f"http://127.0.0.1:{APP_PORT}/health", app)
+        url = f"http://127.0.0.1:{APP_PORT}/api/chat"
+        per_client = max(1, args.concurrency // args.clients)
+        start = time.monotonic()
+        with multiprocessing.Pool(args.clients) as pool:
+            completed = sum(pool.map(_client, [(url, per_client, args.duration, c) for c in range(args.clients)]))
+        elapsed = time.monotonic() - start
+        return completed / elapsed, completed, scrape_total_requests()
+    finally:
+        app.terminate()
+        app.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=128)
+    parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(APP_DIR, "benchmarks", "stub_orchestrator.py"), "--port", str(STUB_PORT)],
+        cwd=APP_DIR,
+    )
+    try:
+        wait_for(f"http://127.0.0.1:{STUB_PORT}/stats", stub)
+        print(f"{'workers':>8}{'req/s':>10}{'completed':>11}{'/metrics total':>16}")
+        for workers in args.workers:
+            rps, completed, scraped = run(workers, args)
+            print(f"{workers:>8}{rps:>10.1f}{completed:>11}{scraped:>16}")
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
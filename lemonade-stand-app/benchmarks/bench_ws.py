@@ -0,0 +1,188 @@
+"""
+The k6 burst scenario over SSE vs WebSocket.
+
+Every virtual user sends --prompts prompts --sleep seconds apart, all users
+starting together, as k6-csv-burst-test.js does. Three transports:
+
+  sse-close      POST /api/chat on a new connection per prompt (what an ingress
+                 that does not keep client connections alive costs)
+  sse-keepalive  POST /api/chat, one keep-alive connection per user
+  ws             one /ws/chat socket per user, prompts multiplexed by id
+
+Reported per transport: TCP connections the client opened (what the ingress
+has to accept), p50/p95 time to first event, p95 time to the final event, and
+errors. Starts the mock orchestrator and the app like bench_e2e.py; pass --url
+to measure a running deployment instead, where connection setup includes TLS
+and the router.
+
+Run from lemonade-stand-app/:
+    python benchmarks/bench_ws.py --vus 200 --prompts 5 --sleep 7
+    python benchmarks/bench_ws.py --url https://lemonade.apps.example.com --vus 500 --transports sse-close ws
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_e2e import percentile  # noqa: E402
+from bench_workers import APP_DIR, APP_PORT, STUB_PORT, wait_for  # noqa: E402
+from corpora import load_k6_corpora  # noqa: E402
+from stub_orchestrator import add_profile_arguments, profile_from_args, profile_to_argv  # noqa: E402
+
+TRANSPORTS = ["sse-close", "sse-keepalive", "ws"]
+
+
+class Results:
+    def __init__(self):
+        self.connections = 0
+        self.first_event: list[float] = []
+        self.final_event: list[float] = []
+        self.errors = 0
+
+    def record(self, sent: float, first: float | None, last_type: str | None):
+        if first is None or last_type not in ("done", "error"):
+            self.errors += 1
+            return
+        self.first_event.append(first - sent)
+        self.final_event.append(time.perf_counter() - sent)
+
+
+def _counting_trace(results: Results) -> aiohttp.TraceConfig:
+    trace = aiohttp.TraceConfig()
+
+    async def on_connection_create_end(session, ctx, params):
+        results.connections += 1
+
+    trace.on_connection_create_end.append(on_connection_create_end)
+    return trace
+
+
+async def sse_user(base_url: str, prompts: list[str], args, rng: random.Random, results: Results, keepalive: bool):
+    connector = aiohttp.TCPConnector(limit=1, force_close=not keepalive)
+    async with aiohttp.ClientSession(
+        connector=connector, trace_configs=[_counting_trace(results)], timeout=aiohttp.ClientTimeout(total=180)
+    ) as session:
+        for i in range(args.prompts):
+            if i:
+                await asyncio.sleep(args.sleep)
+            sent = time.perf_counter()
+            first = None
+            last_type = None
+            try:
+                async with session.post(f"{base_url}/api/chat", json={"message": rng.choice(prompts)}) as response:
+                    async for line in response.content:
+                        if line.startswith(b"data: "):
+                            if first is None:
+                                first = time.perf_counter()
+                            last_type = json.loads(line[6:]).get("type")
+            except aiohttp.ClientError:
+                pass
+            results.record(sent, first, last_type)
+
+
+async def ws_user(base_url: str, prompts: list[str], args, rng: random.Random, results: Results):
+    ws_url = base_url.replace("http", "ws", 1) + "/ws/chat"
+    async with aiohttp.ClientSession(
+        trace_configs=[_counting_trace(results)], timeout=aiohttp.ClientTimeout(total=None)
+    ) as session:
+        try:
+            async with session.ws_connect(ws_url, heartbeat=None) as ws:
+                for i in range(args.prompts):
+                    if i:
+                        await asyncio.sleep(args.sleep)
+                    sent = time.perf_counter()
+                    first = None
+                    last_type = None
+                    await ws.send_str(json.dumps({"id": i, "message": rng.choice(prompts)}))
+                    while last_type not in ("done", "error"):
+                        message = await asyncio.wait_for(ws.receive(), timeout=180)
+                        if message.type != aiohttp.WSMsgType.TEXT:
+                            break
+                        if first is None:
+                            first = time.perf_counter()
+                        last_type = json.loads(message.data).get("type")
+                    results.record(sent, first, last_type)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            results.errors += 1
+
+
+async def run_transport(transport: str, base_url: str, prompts: list[str], args) -> Results:
+    results = Results()
+    users = []
+    for vu in range(args.vus):
+        rng = random.Random(vu)
+        if transport == "ws":
+            users.append(ws_user(base_url, prompts, args, rng, results))
+        else:
+            users.append(sse_user(base_url, prompts, args, rng, results, keepalive=transport == "sse-keepalive"))
+    await asyncio.gather(*users)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="app base URL (default: start the stub and the app locally)")
+    parser.add_argument("--transports", nargs="+", choices=TRANSPORTS, default=TRANSPORTS)
+    parser.add_argument("--vus", type=int, default=200)
+    parser.add_argument("--prompts", type=int, default=5, help="prompts per virtual user")
+    parser.add_argument("--sleep", type=float, default=7.0, help="seconds between a user's prompts")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra app environment")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    corpora = load_k6_corpora()
+    prompts = [p for name in ("SAFE_PROMPTS", "BLOCKED_PROMPTS", "INJECTION_PROMPTS") for p in corpora[name]]
+
+    processes = []
+    base_url = args.url.rstrip("/") if args.url else f"http://127.0.0.1:{APP_PORT}"
+    if not args.url:
+        processes.append(subprocess.Popen(
+            [sys.executable, os.path.join(APP_DIR, "benchmarks", "stub_orchestrator.py"), "--port", str(STUB_PORT),
+             *profile_to_argv(profile_from_args(args))],
+            cwd=APP_DIR,
+        ))
+        env = dict(
+            os.environ,
+            GUARDRAILS_ORCHESTRATOR_SERVICE_SERVICE_HOST="localhost",
+            GUARDRAILS_ORCHESTRATOR_SERVICE_SERVICE_PORT=str(STUB_PORT),
+            RESPONSE_CACHE_SIZE="0",
+            STREAM_COALESCING_ENABLED="false",
+            UPSTREAM_WARM_CONNECTIONS="0",
+            LOG_LEVEL="WARNING",
+        )
+        env.update(item.split("=", 1) for item in args.env)
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app_fastapi:app", "--port", str(APP_PORT),
+             "--log-level", "warning", "--no-access-log"],
+            cwd=APP_DIR, env=env,
+        ))
+    try:
+        if not args.url:
+            wait_for(f"http://127.0.0.1:{STUB_PORT}/stats", processes[0])
+            wait_for(f"{base_url}/health", *processes)
+        results = {transport: asyncio.run(run_transport(transport, base_url, prompts, args))
+                   for transport in args.transports}
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+
+    print(f"{args.vus} users x {args.prompts} prompts, {args.sleep:g}s apart\n")
+    print(f"  {'transport':<15}{'connections':>12}{'first p50':>12}{'first p95':>12}{'final p95':>12}{'errors':>8}")
+    for transport, r in results.items():
+        print(f"  {transport:<15}{r.connections:>12}"
+              f"{percentile(r.first_event, .5) * 1000:>10.1f}ms{percentile(r.first_event, .95) * 1000:>10.1f}ms"
+              f"{percentile(r.final_event, .95) * 1000:>10.1f}ms{r.errors:>8}")
+
+
+if __name__ == "__main__":
+    main()
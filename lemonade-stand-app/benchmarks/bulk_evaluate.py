@@ -0,0 +1,98 @@
+"""
+Replay prompt corpora through /api/chat/bulk and tabulate the verdicts.
+
+Uploads the k6 prompt arrays (SAFE_PROMPTS, BLOCKED_PROMPTS, ...) and/or
+guidellm-dataset/test_prompts.txt as one batch, writes every verdict line to
+--out and prints outcomes per corpus, so detector threshold changes can be
+compared run to run. Prompt ids are "<corpus>:<n>".
+
+Run from lemonade-stand-app/:
+    python benchmarks/bulk_evaluate.py --url http://localhost:8080 --concurrency 16 --out verdicts.jsonl
+    python benchmarks/bulk_evaluate.py --corpora HAP_PROMPTS INJECTION_PROMPTS --no-test-prompts
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from collections import Counter, defaultdict
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpora import CORPUS_NAMES, load_k6_corpora, load_test_prompts  # noqa: E402
+
+OUTCOMES = ["passed", "blocked-input", "blocked-output", "shed", "error"]
+
+
+def build_batch(corpus_names: list[str], test_prompts: bool) -> bytes:
+    corpora = load_k6_corpora()
+    lines = []
+    for name in corpus_names:
+        lines += [json.dumps({"id": f"{name}:{i}", "message": p}) for i, p in enumerate(corpora[name])]
+    if test_prompts:
+        lines += [json.dumps({"id": f"test_prompts:{i}", "message": p}) for i, p in enumerate(load_test_prompts())]
+    return "\n".join(lines).encode() + b"\n"
+
+
+async def run(url: str, batch: bytes, concurrency: int, out: str | None) -> tuple[list[dict], dict]:
+    verdicts, summary = [], {}
+    timeout = aiohttp.ClientTimeout(total=None, sock_read=600)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with session.post(
+            f"{url.rstrip('/')}/api/chat/bulk", params={"concurrency": str(concurrency)}, data=batch,
+            headers={"Content-Type": "application/x-ndjson"},
+        ) as response:
+            if response.status != 200:
+                raise SystemExit(f"{response.status}: {await response.text()}")
+            output = open(out, "w") if out else None
+            try:
+                async for line in response.content:
+                    item = json.loads(line)
+                    if item["type"] == "summary":
+                        summary = item
+                        continue
+                    verdicts.append(item)
+                    if output:
+                        output.write(line.decode())
+                    if len(verdicts) % 100 == 0:
+                        print(f"  {len(verdicts)} verdicts", file=sys.stderr)
+            finally:
+                if output:
+                    output.close()
+    return verdicts, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8080", help="app base URL")
+    parser.add_argument("--corpora", nargs="*", default=CORPUS_NAMES, choices=CORPUS_NAMES)
+    parser.add_argument("--no-test-prompts", action="store_true", help="skip guidellm-dataset/test_prompts.txt")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--out", default=None, help="write verdict NDJSON here")
+    args = parser.parse_args()
+
+    batch = build_batch(args.corpora, not args.no_test_prompts)
+    verdicts, summary = asyncio.run(run(args.url, batch, args.concurrency, args.out))
+
+    by_corpus = defaultdict(Counter)
+    detectors = defaultdict(Counter)
+    for verdict in verdicts:
+        corpus = str(verdict.get("id", "?")).rsplit(":", 1)[0]
+        by_corpus[corpus][verdict["outcome"]] += 1
+        if verdict.get("detector"):
+            detectors[corpus][verdict["detector"]] += 1
+
+    print(f"\n  {'corpus':<24}" + "".join(f"{o:>16}" for o in OUTCOMES) + "  blocking detectors")
+    for corpus, counts in by_corpus.items():
+        blocking = ", ".join(f"{d} {n}" for d, n in detectors[corpus].most_common())
+        print(f"  {corpus:<24}" + "".join(f"{counts[o]:>16}" for o in OUTCOMES) + f"  {blocking}")
+    if summary:
+        print(f"\n  {summary['prompts']} prompts in {summary['seconds']:.1f}s "
+              f"({summary['prompts_per_second']} prompts/s at concurrency {summary['concurrency']})")
+
+
+if __name__ == "__main__":
+    main()
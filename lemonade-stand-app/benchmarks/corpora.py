@@ -0,0 +1,50 @@
+"""
+Prompt corpora shared by the benchmarks.
+Reads the prompt arrays straight out of the k6 scripts so both tools stay in sync.
+"""
+
+import json
+import os
+import re
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(APP_DIR)
+DATASET_DIR = os.path.join(REPO_DIR, "guidellm-dataset")
+
+K6_SCRIPTS = ["k6-load-test.js", "k6-csv-burst-test.js", "k6-orchestrator-test.js"]
+CORPUS_NAMES = [
+    "SAFE_PROMPTS",
+    "BLOCKED_PROMPTS",
+    "INJECTION_PROMPTS",
+    "NON_ENGLISH_PROMPTS",
+    "HAP_PROMPTS",
+    "OUTPUT_TRIGGER_PROMPTS",
+]
+
+_ARRAY_RE = re.compile(r"^const (\w+) = \[\n(.*?)^\];", re.MULTILINE | re.DOTALL)
+_STRING_RE = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+
+def load_k6_corpora(scripts: list[str] = K6_SCRIPTS) -> dict[str, list[str]]:
+    """Return {array name: prompts} merged across the k6 scripts, deduplicated in order."""
+    corpora = {name: [] for name in CORPUS_NAMES}
+    for script in scripts:
+        with open(os.path.join(APP_DIR, script), "r") as f:
+            source = f.read()
+        for name, body in _ARRAY_RE.findall(source):
+            if name not in corpora:
+                continue
+            for line in body.splitlines():
+                if line.strip().startswith("//"):
+                    continue
+                for literal in _STRING_RE.findall(line):
+                    prompt = json.loads(f'"{literal}"')
+                    if prompt not in corpora[name]:
+                        corpora[name].append(prompt)
+    return corpora
+
+
+def load_test_prompts() -> list[str]:
+    """Prompts from guidellm-dataset/test_prompts.txt."""
+    with open(os.path.join(DATASET_DIR, "test_prompts.txt"), "r") as f:
+        return [line.strip() for line in f if line.strip()]
@@ -0,0 +1,447 @@
+"""
+Open-loop load generator for /api/chat.
+
+The k6 scripts are closed-loop: every VU waits for its answer and sleeps
+before the next prompt, so a slow service also slows the offered load and
+queueing collapse shows up late. Here requests are sent on a fixed schedule
+whatever the service does:
+
+  poisson   exponential gaps around --rate (independent users)
+  constant  evenly spaced at --rate
+  trace     recorded arrival times from --trace, optionally rescaled to --rate
+
+Prompts are replayed in order from guidellm-dataset/processed_dataset.jsonl
+(or any .jsonl with a "text" field, or a .txt with one prompt per line).
+
+Latencies are measured from the time a request was *scheduled*, not from when
+it was actually sent. When the generator or the service falls behind, the wait
+counts against the service, so the percentiles are corrected for coordinated
+omission. They are recorded in HDR-style log-linear histograms (under 1%
+relative error).
+
+Outcomes are read from the app's SSE events the way k6 does: passed, blocked
+(error event after streamed content = blocked-output, otherwise
+blocked-input), shed (error event with retry_after), error (HTTP error, no
+answer, client timeout).
+
+Each --rate is one step. The report is printed as Markdown in the layout of
+load-test-results-summary.md and can also be written as JSON.
+
+Run from lemonade-stand-app/:
+    python benchmarks/loadgen.py --url http://127.0.0.1:8080 --rate 20 50 100 --duration 60
+    python benchmarks/loadgen.py --url https://lemonade-stand... --arrivals constant --rate 300 \\
+        --dataset ../guidellm-dataset/test_prompts.txt --report-md results.md --report-json results.json
+    python benchmarks/loadgen.py --url http://127.0.0.1:8080 --arrivals trace --trace arrivals.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import date
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpora import DATASET_DIR  # noqa: E402
+
+OUTCOMES = ["passed", "blocked-input", "blocked-output", "shed", "error"]
+PERCENTILES = [50, 90, 95, 99, 99.9]
+
+# The k6 thresholds (k6-load-test.js), in milliseconds and rates
+THRESHOLDS = {
+    "TTFB p50": ("ttfb", 50, 5000),
+    "TTFB p95": ("ttfb", 95, 15000),
+    "Total p95": ("total", 95, 60000),
+}
+MIN_SUCCESS_RATE = 0.80
+MAX_ERROR_RATE = 0.20
+
+
+# =============================================================================
+# HDR-style histogram
+# =============================================================================
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of integer microseconds, in the style of HdrHistogram:
+    each power-of-two range is split into SUB_BUCKETS linear buckets, so any
+    value is stored with under 1% relative error from 1 us to hours.
+    """
+
+    SUB_BITS = 7
+    SUB_BUCKETS = 1 << SUB_BITS
+
+    def __init__(self):
+        self.counts: dict[tuple[int, int], int] = {}
+        self.total = 0
+        self.max = 0
+
+    def record(self, seconds: float):
+        value = max(0, int(seconds * 1e6))
+        exponent = max(0, value.bit_length() - self.SUB_BITS)
+        key = (exponent, value >> exponent)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.total += 1
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        """Seconds at percentile q (0-100); the highest value equivalent to the bucket."""
+        if not self.total:
+            return math.nan
+        rank = max(1, math.ceil(q / 100 * self.total))
+        seen = 0
+        for exponent, sub in sorted(self.counts):
+            seen += self.counts[(exponent, sub)]
+            if seen >= rank:
+                return min(((sub + 1) << exponent) - 1, self.max) / 1e6
+        return self.max / 1e6
+
+    def summary(self) -> dict:
+        result = {f"p{q:g}": round(self.percentile(q), 6) for q in PERCENTILES}
+        result["max"] = self.max / 1e6
+        result["count"] = self.total
+        return result
+
+
+# =============================================================================
+# Workload
+# =============================================================================
+
+def load_prompts(path: str) -> list[str]:
+    """Prompts from a guidellm .jsonl ("text" field) or a .txt with one per line."""
+    prompts = []
+    with open(path, "r") as f:
+        for line in f:
+            if path.endswith(".jsonl"):
+                if not line.strip():
+                    continue
+                line = json.loads(line).get("text", "")
+                # guidellm rows can carry the tokenizer's BOS marker and padding
+                line = line.replace("<|begin_of_text|>", "")
+            line = line.strip()
+            if line:
+                prompts.append(line)
+    return prompts
+
+
+def load_trace(path: str) -> list[tuple[float, str | None]]:
+    """(seconds from the first arrival, prompt or None) from a .jsonl with "timestamp" and optional "text"."""
+    rows = []
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                rows.append((float(row["timestamp"]), row.get("text")))
+    rows.sort(key=lambda row: row[0])
+    first = rows[0][0] if rows else 0.0
+    return [(t - first, text) for t, text in rows]
+
+
+def schedule(arrivals: str, rate: float | None, duration: float, rng: random.Random,
+             trace: list[tuple[float, str | None]] | None = None) -> list[tuple[float, str | None]]:
+    """Offsets in seconds at which requests are due, with a prompt from the trace if it has one."""
+    if arrivals == "trace":
+        if rate and len(trace) > 1 and trace[-1][0] > 0:
+            scale = (len(trace) - 1) / trace[-1][0] / rate
+            trace = [(t * scale, text) for t, text in trace]
+        return [(t, text) for t, text in trace if t < duration]
+    offsets = []
+    t = 0.0
+    while True:
+        t += rng.expovariate(rate) if arrivals == "poisson" else 1 / rate
+        if t >= duration:
+            return offsets
+        offsets.append((t, None))
+
+
+def classify(status: int, body: bytes) -> str:
+    """Outcome of one chat stream, following parseSSEResponse in k6-load-test.js."""
+    if status != 200:
+        return "error"
+    content = False
+    for line in body.split(b"\n"):
+        if not line.startswith(b"data: "):
+            continue
+        try:
+            event = json.loads(line[len(b"data: "):])
+        except ValueError:
+            continue
+        kind = event.get("type")
+        if kind == "chunk":
+            content = content or bool(event.get("content"))
+        elif kind == "error":
+            if "retry_after" in event:
+                return "shed"
+            return "blocked-output" if content else "blocked-input"
+        elif kind == "done":
+            return "passed" if content else "error"
+    return "error"
+
+
+# =============================================================================
+# Open-loop runner
+# =============================================================================
+
+class StepResult:
+    def __init__(self, target_rate: float | None):
+        self.target_rate = target_rate
+        self.outcomes = {outcome: 0 for outcome in OUTCOMES}
+        self.ttfb = LatencyHistogram()
+        self.total = LatencyHistogram()
+        self.service = LatencyHistogram()  # total time from the actual send, without the correction
+        self.send_lag = LatencyHistogram()
+        self.scheduled = 0
+        self.completed_in_window = 0  # finished before the last arrival was due
+        self.window = 0.0
+        self.elapsed = 0.0
+        self.offered_rate = 0.0
+
+
+async def run_step(session: aiohttp.ClientSession, url: str, source: str, prompts: list[str], start_index: int,
+                   arrivals: list[tuple[float, str | None]], duration: float, timeout: float,
+                   target_rate: float | None) -> StepResult:
+    loop = asyncio.get_running_loop()
+    result = StepResult(target_rate)
+    result.scheduled = len(arrivals)
+    result.offered_rate = len(arrivals) / duration if duration else 0.0
+    result.window = duration
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async def one(intended: float, prompt: str):
+        sent = loop.time()
+        first = None
+        body = bytearray()
+        status = 0
+        try:
+            async with session.post(url, json={"message": prompt}, timeout=client_timeout,
+                                    headers={"Accept": "text/event-stream", "X-Source": source}) as response:
+                status = response.status
+                async for chunk in response.content.iter_any():
+                    if first is None:
+                        first = loop.time()
+                    body += chunk
+            outcome = classify(status, bytes(body))
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            outcome = "error"
+        done = loop.time()
+        result.outcomes[outcome] += 1
+        if done <= start + duration:
+            result.completed_in_window += 1
+        result.send_lag.record(sent - intended)
+        result.ttfb.record((first if first is not None else done) - intended)
+        result.total.record(done - intended)
+        result.service.record(done - sent)
+
+    start = loop.time() + 0.05
+    tasks = []
+    for n, (offset, text) in enumerate(arrivals):
+        intended = start + offset
+        delay = intended - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        prompt = text or prompts[(start_index + n) % len(prompts)]
+        tasks.append(asyncio.create_task(one(intended, prompt)))
+    await asyncio.gather(*tasks)
+    result.elapsed = loop.time() - start
+    return result
+
+
+# =============================================================================
+# Reporting
+# =============================================================================
+
+def format_seconds(seconds: float) -> str:
+    if math.isnan(seconds):
+        return "-"
+    return f"{seconds * 1000:.0f}ms" if seconds < 1 else f"{seconds:.2f}s"
+
+
+def rate_label(step: dict) -> str:
+    return f"{step['target_rate']:g} req/s" if step["target_rate"] else "trace"
+
+
+def step_report(step: StepResult) -> dict:
+    completed = sum(step.outcomes.values())
+    answered = completed - step.outcomes["error"] - step.outcomes["shed"]
+    blocked = step.outcomes["blocked-input"] + step.outcomes["blocked-output"]
+    rates = {
+        "success": answered / completed if completed else 0.0,
+        "error": step.outcomes["error"] / completed if completed else 0.0,
+        "shed": step.outcomes["shed"] / completed if completed else 0.0,
+        "blocked": blocked / completed if completed else 0.0,
+    }
+    histograms = {"ttfb": step.ttfb, "total": step.total}
+    failed = [
+        name for name, (metric, q, limit_ms) in THRESHOLDS.items()
+        if histograms[metric].percentile(q) * 1000 >= limit_ms
+    ]
+    if rates["success"] <= MIN_SUCCESS_RATE:
+        failed.append("Success rate")
+    if rates["error"] >= MAX_ERROR_RATE:
+        failed.append("Error rate")
+    return {
+        "target_rate": step.target_rate,
+        "offered_rate": round(step.offered_rate, 3),
+        "scheduled": step.scheduled,
+        "completed": completed,
+        # Completions per second while arrivals were still due; below the offered rate means falling behind
+        "throughput": round(step.completed_in_window / step.window, 3) if step.window else 0.0,
+        "elapsed_seconds": round(step.elapsed, 3),
+        "outcomes": dict(step.outcomes),
+        "rates": {k: round(v, 5) for k, v in rates.items()},
+        "latency_seconds": {
+            "ttfb": step.ttfb.summary(),
+            "total": step.total.summary(),
+            "service_total": step.service.summary(),
+            "send_lag": step.send_lag.summary(),
+        },
+        "failed_thresholds": failed,
+    }
+
+
+def markdown_report(report: dict) -> str:
+    lines = [
+        "# Load Test Results Summary",
+        "",
+        f"**Date**: {report['date']}",
+        "**Application**: Lemonade Stand with FMS Guardrails Orchestrator",
+        f"**Test Tool**: benchmarks/loadgen.py (open-loop, {report['arrivals']} arrivals)",
+        f"**Target**: `{report['url']}`",
+        f"**Prompts**: `{report['dataset']}` ({report['prompts']} prompts)",
+        f"**Step duration**: {report['duration']:g}s, client timeout {report['timeout']:g}s",
+        "",
+        "---",
+        "",
+        "## Test Results",
+        "",
+        "Latencies are measured from each request's scheduled send time (coordinated-omission corrected).",
+        "",
+        "| Rate | Offered | Throughput | Success Rate | Error Rate | p(50) TTFB | p(95) TTFB | p(99) TTFB "
+        "| p(95) Total | Blocked Rate | Shed Rate | Status |",
+        "|------|---------|------------|--------------|------------|------------|------------|------------"
+        "|-------------|--------------|-----------|--------|",
+    ]
+    for step in report["steps"]:
+        ttfb = step["latency_seconds"]["ttfb"]
+        total = step["latency_seconds"]["total"]
+        rates = step["rates"]
+        status = "✅ All pass" if not step["failed_thresholds"] else f"❌ {', '.join(step['failed_thresholds'])} failed"
+        lines.append(
+            f"| {rate_label(step)} | {step['offered_rate']:.1f} req/s | {step['throughput']:.1f} req/s | {rates['success']:.2%} "
+            f"| {rates['error']:.2%} | {format_seconds(ttfb['p50'])} | {format_seconds(ttfb['p95'])} "
+            f"| {format_seconds(ttfb['p99'])} | {format_seconds(total['p95'])} | {rates['blocked']:.2%} "
+            f"| {rates['shed']:.2%} | {status} |"
+        )
+
+    lines += [
+        "",
+        "### Outcomes",
+        "",
+        "| Rate | " + " | ".join(OUTCOMES) + " | p(99) send lag |",
+        "|------|" + "|".join("-" * (len(o) + 2) for o in OUTCOMES) + "|----------------|",
+    ]
+    for step in report["steps"]:
+        lag = step["latency_seconds"]["send_lag"]["p99"]
+        lines.append(
+            f"| {rate_label(step)} | "
+            + " | ".join(str(step["outcomes"][o]) for o in OUTCOMES)
+            + f" | {format_seconds(lag)} |"
+        )
+    lines += [
+        "",
+        "### Thresholds Used",
+        "```",
+        "sse_ttfb_ms: p(50)<5000, p(95)<15000",
+        "sse_total_time_ms: p(95)<60000",
+        f"sse_success_rate: rate>{MIN_SUCCESS_RATE:.2f}",
+        f"sse_error_rate: rate<{MAX_ERROR_RATE:.2f}",
+        "```",
+        "",
+    ]
+    return "\n".join(lines)
+
+
+async def run(args, prompts: list[str], trace: list[tuple[float, str | None]] | None) -> list[dict]:
+    rng = random.Random(args.seed)
+    url = args.url.rstrip("/") + "/api/chat"
+    steps = []
+    index = 0
+    connector = aiohttp.TCPConnector(limit=0, ssl=False if args.insecure else None)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        for n, rate in enumerate(args.rate or [None]):
+            if n and args.cooldown:
+                await asyncio.sleep(args.cooldown)
+            arrivals = schedule(args.arrivals, rate, args.duration, rng, trace)
+            label = f"{rate:g} req/s" if rate else "trace"
+            print(f"Step {n + 1}: {label}, {len(arrivals)} requests over {args.duration:g}s", file=sys.stderr)
+            step = await run_step(session, url, args.source, prompts, index, arrivals, args.duration,
+                                  args.timeout, rate)
+            index += len(arrivals)
+            report = step_report(step)
+            lag = report["latency_seconds"]["send_lag"]["p99"]
+            if lag > 0.01:
+                print(f"  warning: p99 send lag {lag * 1000:.0f} ms - the generator is falling behind its schedule",
+                      file=sys.stderr)
+            steps.append(report)
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", required=True, help="app base URL")
+    parser.add_argument("--rate", type=float, nargs="+", help="target requests/s, one step per value")
+    parser.add_argument("--arrivals", choices=["poisson", "constant", "trace"], default="poisson")
+    parser.add_argument("--trace", help=".jsonl of {\"timestamp\": seconds, \"text\": optional prompt}")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of arrivals per step")
+    parser.add_argument("--cooldown", type=float, default=10.0, help="idle seconds between steps")
+    parser.add_argument("--timeout", type=float, default=120.0, help="client timeout per request (k6 uses 120s)")
+    parser.add_argument("--dataset", default=os.path.join(DATASET_DIR, "processed_dataset.jsonl"))
+    parser.add_argument("--shuffle", action="store_true", help="replay prompts in random order")
+    parser.add_argument("--source", default="redteam", help="X-Source header, as sent by k6")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--insecure", action="store_true", help="skip TLS verification")
+    parser.add_argument("--report-json", help="write the report as JSON")
+    parser.add_argument("--report-md", help="write the report as Markdown")
+    args = parser.parse_args()
+
+    if args.arrivals == "trace" and not args.trace:
+        parser.error("--arrivals trace needs --trace")
+    if args.arrivals != "trace" and not args.rate:
+        parser.error(f"--arrivals {args.arrivals} needs --rate")
+
+    prompts = load_prompts(args.dataset)
+    if args.shuffle:
+        random.Random(args.seed).shuffle(prompts)
+    trace = load_trace(args.trace) if args.trace else None
+
+    steps = asyncio.run(run(args, prompts, trace))
+    report = {
+        "date": date.today().isoformat(),
+        "url": args.url,
+        "arrivals": args.arrivals,
+        "dataset": os.path.relpath(args.dataset),
+        "prompts": len(prompts),
+        "duration": args.duration,
+        "timeout": args.timeout,
+        "generated_at": time.time(),
+        "steps": steps,
+    }
+    markdown = markdown_report(report)
+    print(markdown)
+    if args.report_md:
+        with open(args.report_md, "w") as f:
+            f.write(markdown)
+    if args.report_json:
+        with open(args.report_json, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
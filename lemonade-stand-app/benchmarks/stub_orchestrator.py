@@ -0,0 +1,258 @@
+"""
+Mock guardrails orchestrator for /api/v2/chat/completions-detection.
+
+Streams OpenAI-style SSE answers the way the real orchestrator does:
+
+- Time to first byte and per-stream token rate are drawn from lognormal
+  distributions around the configured medians.
+- Content arrives per token, or per sentence as the orchestrator's sentence
+  chunker emits it when output detectors are on.
+- Insults, prompt injection and mostly non-ASCII prompts are blocked on input
+  with `warnings` + `detections` (hap, prompt_injection, language_detection).
+- Prompts asking for lists/facts/recipes (or a random share of answers) are
+  blocked on output by regex_competitor after a few sentences.
+- Some chunks are sent twice, like the upstream duplicate chunks.
+- Answers longer than the request's max_tokens end with finish_reason "length".
+
+GET /stats returns how many streams of each kind were served.
+
+Run from lemonade-stand-app/:
+    python benchmarks/stub_orchestrator.py --port 9100 --ttfb 0.3 --ttfb-sigma 0.5 --token-rate 40
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+from typing import NamedTuple
+
+from aiohttp import web
+
+ANSWER = "Lemons are sour because they contain citric acid, which gives them their sharp taste."
+
+LEMON_SENTENCES = [
+    ANSWER,
+    "A lemon tree can produce fruit all year round in a warm climate.",
+    "Lemon juice is about five to six percent citric acid.",
+    "Meyer lemons are sweeter and less acidic than Eureka lemons.",
+    "Store lemons in the fridge to keep them fresh for up to a month.",
+    "Lemon zest holds most of the fragrant oils of the fruit.",
+    "Sicily and California are both famous for growing lemons.",
+    "A squeeze of lemon brightens soups, sauces and dressings.",
+    "Lemon trees prefer well-drained soil and plenty of sunlight.",
+    "The vitamin C in lemons helped sailors avoid scurvy.",
+    "Warm lemons give more juice than cold ones.",
+    "Preserved lemons are a classic ingredient in North African cooking.",
+]
+OFF_TOPIC_SENTENCE = "Unlike oranges, lemons are rarely eaten on their own."
+
+HAP_WORDS = {"stupid", "idiot", "hate", "dumb", "shut", "damn", "shit", "fuck", "fucking", "crap", "sucks"}
+INJECTION_RE = re.compile(
+    r"ignore|disregard|forget|pretend|override|jailbreak|system prompt|instructions|you are now|act as|developer mode",
+    re.IGNORECASE,
+)
+OUTPUT_TRIGGER_RE = re.compile(r"facts|list|recipe|compare|citrus|smoothie|juice|salad|cocktail|dessert", re.IGNORECASE)
+LONG_ANSWER_RE = re.compile(r"story|essay|long|detailed|everything|history|\b100\b", re.IGNORECASE)
+
+
+class StubProfile(NamedTuple):
+    ttfb: float = 0.05               # median seconds before the first byte
+    ttfb_sigma: float = 0.0          # lognormal spread of the TTFB (0 = fixed)
+    token_rate: float = 0.0          # median tokens/s per stream (0 = no delay between chunks)
+    token_rate_sigma: float = 0.0    # lognormal spread of the per-stream token rate
+    granularity: str = "token"       # "token" or "sentence"
+    duplicate_rate: float = 0.0      # chance that a chunk is sent twice
+    output_block_rate: float = 0.0   # chance that any clean answer is blocked on output
+    seed: int | None = None
+
+
+def sse(payload: dict) -> bytes:
+    return f"data: {json.dumps(payload)}\n\n".encode()
+
+
+def lognormal(rng: random.Random, median: float, sigma: float) -> float:
+    return median * math.exp(rng.gauss(0, sigma)) if sigma and median else median
+
+
+def classify(message: str) -> tuple[str, str | None]:
+    """(scenario, detector_id) for a user message."""
+    words = set(re.findall(r"\w+", message.lower()))
+    if words & HAP_WORDS:
+        return "blocked-input", "hap"
+    if INJECTION_RE.search(message):
+        return "blocked-input", "prompt_injection"
+    letters = [c for c in message if c.isalpha()]
+    if letters and sum(not c.isascii() for c in letters) >= 0.3 * len(letters):
+        return "blocked-input", "language_detection"
+    if OUTPUT_TRIGGER_RE.search(message):
+        return "blocked-output", "regex_competitor"
+    if LONG_ANSWER_RE.search(message):
+        return "length", None
+    return "passed", None
+
+
+def chunk_event(model: str, content: str | None, finish_reason: str | None = None) -> dict:
+    delta = {"content": content} if content is not None else {}
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def input_block_event(model: str, message: str, detector_id: str) -> dict:
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [],
+        "detections": {"input": [{"message_index": 1, "results": [{
+            "start": 0, "end": len(message), "text": message, "detector_id": detector_id,
+            "detection_type": detector_id, "detection": "sequence_classifier", "score": 0.97,
+        }]}]},
+        "warnings": [{
+            "type": "UNSUITABLE_INPUT",
+            "message": "Unsuitable input detected. Please check the detected entities on your input request and "
+                       "try again with the unsuitable input removed.",
+        }],
+    }
+
+
+def output_block_event(model: str, sentence: str) -> dict:
+    event = chunk_event(model, sentence)
+    start = sentence.index("oranges")
+    event["detections"] = {"output": [{"choice_index": 0, "results": [{
+        "start": start, "end": start + len("oranges"), "text": "oranges", "detector_id": "regex_competitor",
+        "detection_type": "regex", "detection": "custom-regex", "score": 1.0,
+    }]}]}
+    event["warnings"] = [{"type": "UNSUITABLE_OUTPUT", "message": "Unsuitable output detected."}]
+    return event
+
+
+def create_app(ttfb: float = 0.05, chunk_delay: float = 0.0, profile: StubProfile | None = None) -> web.Application:
+    if profile is None:
+        profile = StubProfile(ttfb=ttfb, token_rate=1 / chunk_delay if chunk_delay else 0.0)
+    rng = random.Random(profile.seed)
+    stats: dict[str, int] = {}
+
+    async def completions(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        model = body.get("model", "stub")
+        message = body["messages"][-1]["content"]
+        max_tokens = body.get("max_tokens") or 200
+        scenario, detector_id = classify(message)
+        if scenario == "passed" and rng.random() < profile.output_block_rate:
+            scenario, detector_id = "blocked-output", "regex_competitor"
+        stats[scenario] = stats.get(scenario, 0) + 1
+
+        await asyncio.sleep(lognormal(rng, profile.ttfb, profile.ttfb_sigma))
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        if scenario == "blocked-input":
+            await response.write(sse(input_block_event(model, message, detector_id)))
+            await response.write(b"data: [DONE]\n\n")
+            return response
+
+        n_sentences = rng.randint(20, 30) if scenario == "length" else rng.randint(3, 8)
+        sentences = [rng.choice(LEMON_SENTENCES) for _ in range(n_sentences)]
+        block_at = min(2, n_sentences - 1) if scenario == "blocked-output" else None
+        token_rate = lognormal(rng, profile.token_rate, profile.token_rate_sigma)
+        tokens = 0
+
+        async def send(content: str, n_tokens: int):
+            if token_rate:
+                await asyncio.sleep(n_tokens / token_rate)
+            event = sse(chunk_event(model, content))
+            await response.write(event)
+            if rng.random() < profile.duplicate_rate:
+                await response.write(event)
+
+        for index, sentence in enumerate(sentences):
+            if index == block_at:
+                await response.write(sse(output_block_event(model, OFF_TOPIC_SENTENCE)))
+                await response.write(b"data: [DONE]\n\n")
+                return response
+            words = sentence.split(" ")
+            words = [words[0]] + [" " + word for word in words[1:]]
+            if index:
+                words[0] = " " + words[0]
+            words = words[:max_tokens - tokens]
+            tokens += len(words)
+            if profile.granularity == "sentence":
+                await send("".join(words), len(words))
+            else:
+                for word in words:
+                    await send(word, 1)
+            if tokens >= max_tokens:
+                break
+
+        finish_reason = "length" if tokens >= max_tokens else "stop"
+        await response.write(sse(chunk_event(model, None, finish_reason)))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.router.add_post("/api/v2/chat/completions-detection", completions)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    """Stub profile options, shared with the end-to-end harness."""
+    parser.add_argument("--ttfb", type=float, default=0.05, help="median seconds before the first byte")
+    parser.add_argument("--ttfb-sigma", type=float, default=0.0, help="lognormal spread of the TTFB")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="median tokens/s per stream (0 = no delay)")
+    parser.add_argument("--token-rate-sigma", type=float, default=0.0, help="lognormal spread of the token rate")
+    parser.add_argument("--granularity", choices=["token", "sentence"], default="token")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="chance that a chunk is sent twice")
+    parser.add_argument("--output-block-rate", type=float, default=0.0,
+                        help="chance that a clean answer is blocked on output")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def profile_from_args(args: argparse.Namespace) -> StubProfile:
+    return StubProfile(
+        ttfb=args.ttfb,
+        ttfb_sigma=args.ttfb_sigma,
+        token_rate=args.token_rate,
+        token_rate_sigma=args.token_rate_sigma,
+        granularity=args.granularity,
+        duplicate_rate=args.duplicate_rate,
+        output_block_rate=args.output_block_rate,
+        seed=args.seed,
+    )
+
+
+def profile_to_argv(profile: StubProfile) -> list[str]:
+    argv = []
+    for name, value in profile._asdict().items():
+        if value is not None:
+            argv += [f"--{name.replace('_', '-')}", str(value)]
+    return argv
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--chunk-delay", type=float, default=None,
+                        help="fixed seconds between chunks (overrides --token-rate)")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    profile = profile_from_args(args)
+    if args.chunk_delay:
+        profile = profile._replace(token_rate=1 / args.chunk_delay, token_rate_sigma=0.0)
+    web.run_app(create_app(profile=profile), port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Bulk guardrail evaluation for offline prompt corpora.
+A batch is NDJSON in, NDJSON out: each input line is a prompt (a JSON object
+with "message" and an optional "id", or a bare JSON string; plain text lines
+with a text/plain upload). Prompts run through the chat pipeline with bounded
+concurrency and one verdict line per prompt is streamed back as soon as it
+completes - in completion order, so each carries its input index - followed by
+one summary line.
+"""
+
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Any, AsyncIterator, Callable, NamedTuple
+
+from latency_histograms import classify_outcome
+
+# (message, detections list to fill) -> chat events
+ChatRunner = Callable[[str, list], AsyncIterator[dict]]
+
+
+class BulkPrompt(NamedTuple):
+    index: int
+    message: str
+    id: Any = None
+
+
+class BulkRequestError(ValueError):
+    """Malformed or oversized batch; reported to the client as a 400."""
+
+
+def parse_prompt_line(index: int, line: str, plain_text: bool = False) -> BulkPrompt:
+    if plain_text:
+        return BulkPrompt(index, line)
+    try:
+        item = json.loads(line)
+    except ValueError as e:
+        raise BulkRequestError(f"line {index + 1}: invalid JSON ({e})")
+    if isinstance(item, str):
+        return BulkPrompt(index, item)
+    if isinstance(item, dict) and isinstance(item.get("message"), str):
+        return BulkPrompt(index, item["message"], item.get("id"))
+    raise BulkRequestError(f'line {index + 1}: expected a string or an object with a "message" string')
+
+
+async def read_prompts(chunks: AsyncIterator[bytes], max_prompts: int, plain_text: bool = False) -> list[BulkPrompt]:
+    """Parse an uploaded batch as it arrives; blank lines are skipped."""
+    prompts = []
+    buffer = b""
+    line_number = 0
+
+    def add(raw: bytes):
+        nonlocal line_number
+        line = raw.decode("utf-8", errors="replace").strip()
+        line_number += 1
+        if not line:
+            return
+        if len(prompts) >= max_prompts:
+            raise BulkRequestError(f"batch exceeds {max_prompts} prompts")
+        prompt = parse_prompt_line(line_number - 1, line, plain_text)
+        prompts.append(prompt._replace(index=len(prompts)))
+
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for raw in lines:
+            add(raw)
+    add(buffer)
+    return prompts
+
+
+async def evaluate_prompt(prompt: BulkPrompt, run_chat: ChatRunner) -> dict:
+    """Run one prompt and reduce its event stream to a verdict."""
+    detections: list[tuple[str, dict]] = []
+    last_event = None
+    tokens = 0
+    first_content = None
+    start = time.perf_counter()
+    try:
+        async for event in run_chat(prompt.message, detections):
+            if event.get("type") == "chunk":
+                tokens += 1
+                if first_content is None:
+                    first_content = time.perf_counter() - start
+            last_event = event
+    except Exception as e:
+        last_event = {"type": "error", "message": f"Error: {e}"}
+    latency = time.perf_counter() - start
+
+    outcome = classify_outcome(last_event, detections)
+    if outcome == "error" and last_event is not None and "retry_after" in last_event:
+        outcome = "shed"
+    verdict = {"type": "verdict", "index": prompt.index}
+    if prompt.id is not None:
+        verdict["id"] = prompt.id
+    verdict["outcome"] = outcome
+    if outcome.startswith("blocked"):
+        verdict["detector"] = last_event.get("detector_type")
+    elif outcome != "passed":
+        verdict["error"] = last_event["message"] if last_event else "no response"
+    # Every orchestrator detection with its score, whether or not it crossed a blocking threshold
+    verdict["detections"] = [
+        {"detector_id": result.get("detector_id"), "direction": direction, "score": result.get("score")}
+        for direction, det in detections if isinstance(det, dict)
+        for result in det.get("results") or [] if isinstance(result, dict)
+    ]
+    verdict["latency_ms"] = round(latency * 1000, 1)
+    verdict["first_content_ms"] = round(first_content * 1000, 1) if first_content is not None else None
+    verdict["tokens"] = tokens
+    return verdict
+
+
+def error_verdict(prompt: BulkPrompt, message: str) -> dict:
+    verdict = {"type": "verdict", "index": prompt.index}
+    if prompt.id is not None:
+        verdict["id"] = prompt.id
+    verdict["outcome"] = "error"
+    verdict["error"] = message
+    return verdict
+
+
+async def evaluate(prompts: list[BulkPrompt], run_chat: ChatRunner, concurrency: int) -> AsyncIterator[bytes]:
+    """NDJSON verdict lines as prompts complete, then a summary line. Closing the stream cancels the batch."""
+    results: asyncio.Queue[dict] = asyncio.Queue()
+    pending = iter(prompts)
+
+    async def worker():
+        # Workers share one iterator, so each pulls the next prompt when it frees up
+        for prompt in pending:
+            try:
+                verdict = await evaluate_prompt(prompt, run_chat)
+            except Exception as e:
+                # Every prompt must produce a verdict, or the batch never ends
+                verdict = error_verdict(prompt, f"Error: {e!r}")
+            await results.put(verdict)
+
+    start = time.perf_counter()
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(prompts)))]
+    outcomes = Counter()
+    try:
+        for _ in range(len(prompts)):
+            verdict = await results.get()
+            outcomes[verdict["outcome"]] += 1
+            yield json.dumps(verdict, ensure_ascii=False).encode() + b"\n"
+        elapsed = time.perf_counter() - start
+        summary = {
+            "type": "summary",
+            "prompts": len(prompts),
+            "outcomes": dict(outcomes),
+            "concurrency": len(workers),
+            "seconds": round(elapsed, 3),
+            "prompts_per_second": round(len(prompts) / elapsed, 1) if elapsed > 0 else None,
+        }
+        yield json.dumps(summary).encode() + b"\n"
+    finally:
+        for task in workers:
+            task.cancel()
@@ -0,0 +1,157 @@
+"""
+Outbound SSE frame batching for /api/chat.
+Adjacent chunk events are merged into one `data:` frame, and everything that
+is ready at the same time goes out as a single write, so a response costs a
+handful of JSON encodes and socket writes instead of two per token.
+"""
+
+import asyncio
+import json
+import time
+from contextlib import aclosing
+from typing import AsyncIterator
+
+from shared_counters import CounterSegment
+
+_END = object()
+
+
+def encode_event(event: dict) -> str:
+    return f"data: {json.dumps(event)}\n\n"
+
+
+def _merged_chunk(pending: list[str]) -> dict:
+    event = {"type": "chunk", "content": "".join(pending)}
+    pending.clear()
+    return event
+
+
+class FrameBatcher:
+    """
+    Turns a chat event stream into SSE text.
+
+    Chunk events are held for at most `window` seconds (0 merges only what is
+    already available) or until `max_chars` of content is pending. Any other
+    event - error, done - flushes the pending chunks and is written
+    immediately in the same write. Counters are shared across workers.
+    """
+
+    RESPONSES, EVENTS, FRAMES, WRITES = range(4)
+
+    def __init__(self, window: float = 0.01, max_chars: int = 4096, segment: CounterSegment | None = None):
+        self.window = window
+        self.max_chars = max_chars
+        self._counters_block = (segment or CounterSegment()).allocate("q", 4)
+        self._counters = self._counters_block.local
+
+    async def stream(self, events: AsyncIterator[dict]) -> AsyncIterator[str]:
+        """SSE text for a chat event stream, one string per write."""
+        counters = self._counters
+        counters[self.RESPONSES] += 1
+        # aclosing: a client disconnect closes _merge (and its producer) now, not at GC
+        async with aclosing(self._merge(events)) as merged:
+            async for batch, n_events in merged:
+                counters[self.EVENTS] += n_events
+                counters[self.FRAMES] += len(batch)
+                counters[self.WRITES] += 1
+                yield "".join(encode_event(event) for event in batch)
+
+    async def batches(self, events: AsyncIterator[dict]) -> AsyncIterator[list[dict]]:
+        """The same merging for transports that frame events themselves (WebSocket); not counted as SSE."""
+        async with aclosing(self._merge(events)) as merged:
+            async for batch, _ in merged:
+                yield batch
+
+    async def _merge(self, events: AsyncIterator[dict]) -> AsyncIterator[tuple[list[dict], int]]:
+        """Lists of events ready to go out together, with how many input events they cover."""
+        # The producer runs as its own task so a pending batch can be flushed on a
+        # timer without cancelling the upstream iterator mid-read
+        queue: list = []
+        ready = asyncio.Event()
+
+        async def produce():
+            try:
+                async for event in events:
+                    queue.append(event)
+                    ready.set()
+            finally:
+                queue.append(_END)
+                ready.set()
+
+        producer = asyncio.create_task(produce())
+        pending: list[str] = []
+        pending_chars = 0
+        n_events = 0
+        deadline = 0.0
+        try:
+            while True:
+                if not queue:
+                    if pending and self.window > 0:
+                        try:
+                            async with asyncio.timeout(deadline - time.monotonic()):
+                                await ready.wait()
+                        except TimeoutError:
+                            pass
+                    else:
+                        await ready.wait()
+                ready.clear()
+
+                out = []
+                finished = False
+                for event in queue:
+                    if event is _END:
+                        finished = True
+                        break
+                    n_events += 1
+                    if event.get("type") == "chunk":
+                        if not pending:
+                            deadline = time.monotonic() + self.window
+                        content = event.get("content", "")
+                        pending.append(content)
+                        pending_chars += len(content)
+                        if pending_chars >= self.max_chars:
+                            out.append(_merged_chunk(pending))
+                            pending_chars = 0
+                        continue
+                    if pending:
+                        out.append(_merged_chunk(pending))
+                        pending_chars = 0
+                    out.append(event)
+                queue.clear()
+
+                if pending and (finished or self.window <= 0 or time.monotonic() >= deadline):
+                    out.append(_merged_chunk(pending))
+                    pending_chars = 0
+                if out:
+                    yield out, n_events
+                    n_events = 0
+                if finished:
+                    break
+            # Surface producer errors exactly as iterating the events directly would
+            await producer
+        finally:
+            if not producer.done():
+                producer.cancel()
+                # Let the producer run its own cleanup (closing the upstream response) before we return
+                await asyncio.gather(producer, return_exceptions=True)
+
+    def get_prometheus_metrics(self) -> str:
+        responses, events, frames, writes = self._counters_block.totals()
+        lines = [
+            "# HELP guardrail_sse_responses_total Chat responses streamed to clients",
+            "# TYPE guardrail_sse_responses_total counter",
+            f"guardrail_sse_responses_total {responses}",
+            "",
+            "# HELP guardrail_sse_events_total Chat events produced before frame batching",
+            "# TYPE guardrail_sse_events_total counter",
+            f"guardrail_sse_events_total {events}",
+            "",
+            "# HELP guardrail_sse_frames_total SSE data frames sent to clients after batching",
+            "# TYPE guardrail_sse_frames_total counter",
+            f"guardrail_sse_frames_total {frames}",
+            "",
+            "# HELP guardrail_sse_writes_total Response body writes handed to the server",
+            "# TYPE guardrail_sse_writes_total counter",
+            f"guardrail_sse_writes_total {writes}",
+        ]
+        return "\n".join(lines)
@@ -0,0 +1,281 @@
+"""
+Single-pass multilingual fruit matcher.
+Compiles the per-language fruit regexes into one casefolded trie so a message
+is scanned once instead of once per language pattern.
+"""
+
+import unicodedata
+from typing import Iterator, NamedTuple
+
+
+class FruitMatch(NamedTuple):
+    """A fruit term found in a message. Span indexes the original text."""
+    term: str
+    language: str
+    span: tuple[int, int]
+
+
+# =============================================================================
+# Pattern Expansion
+# =============================================================================
+
+_PATTERN_PREFIX = r"\b(?i:"
+_PATTERN_SUFFIX = r")\b"
+
+
+def _expand_alternation(body: str, pos: int) -> tuple[list[str], int]:
+    """Expand `a|b|...` starting at pos, stopping at an unmatched ')'."""
+    branches = []
+    while True:
+        branch, pos = _expand_sequence(body, pos)
+        branches.extend(branch)
+        if pos < len(body) and body[pos] == "|":
+            pos += 1
+            continue
+        return branches, pos
+
+
+def _expand_sequence(body: str, pos: int) -> tuple[list[str], int]:
+    """Expand a concatenation of literals, `(?:...)` groups and `?` quantifiers."""
+    results = [""]
+    while pos < len(body) and body[pos] not in "|)":
+        if body.startswith("(?:", pos):
+            options, pos = _expand_alternation(body, pos + 3)
+            if pos >= len(body) or body[pos] != ")":
+                raise ValueError(f"Unbalanced group in fruit pattern at {pos}")
+            pos += 1
+        elif body[pos] in "\\[](){}*+.^$":
+            raise ValueError(f"Unsupported regex syntax {body[pos]!r} in fruit pattern at {pos}")
+        else:
+            options = [body[pos]]
+            pos += 1
+
+        if pos < len(body) and body[pos] == "?":
+            options = options + [""]
+            pos += 1
+
+        results = [prefix + option for prefix in results for option in options]
+    return results, pos
+
+
+def expand_pattern(pattern: str) -> list[str]:
+    """
+    Expand a `\\b(?i:...)\\b` fruit pattern into the finite list of terms it matches.
+    Only literals, non-capturing groups, alternation and `?` are supported.
+    """
+    if not (pattern.startswith(_PATTERN_PREFIX) and pattern.endswith(_PATTERN_SUFFIX)):
+        raise ValueError(f"Fruit pattern must be wrapped in {_PATTERN_PREFIX}...{_PATTERN_SUFFIX}")
+    body = pattern[len(_PATTERN_PREFIX):-len(_PATTERN_SUFFIX)]
+    terms, pos = _expand_alternation(body, 0)
+    if pos != len(body):
+        raise ValueError(f"Unbalanced ')' in fruit pattern at {pos}")
+    return terms
+
+
+# =============================================================================
+# Normalization
+# =============================================================================
+
+# re.IGNORECASE treats the Turkish dotted/dotless i as plain i; casefold() does not
+_TURKISH_I = str.maketrans({"İ": "i", "ı": "i"})
+
+
+def _fold(text: str) -> str:
+    """NFKC + casefold, re-normalized so folding cannot leave decomposed output."""
+    folded = unicodedata.normalize("NFKC", text).translate(_TURKISH_I).casefold()
+    return unicodedata.normalize("NFKC", folded)
+
+
+def normalize_with_offsets(text: str) -> tuple[str, list[int], list[int]]:
+    """
+    Casefold and NFKC-normalize text.
+    Returns (folded, starts, ends) where folded[i] came from text[starts[i]:ends[i]].
+    """
+    if text.isascii():
+        # Fast path: ASCII lowercasing never changes length
+        n = len(text)
+        return text.lower(), list(range(n)), list(range(1, n + 1))
+
+    folded = []
+    starts = []
+    ends = []
+
+    def flush(seg_start: int, seg_end: int):
+        piece = _fold(text[seg_start:seg_end])
+        folded.append(piece)
+        starts.extend([seg_start] * len(piece))
+        ends.extend([seg_end] * len(piece))
+
+    # Normalize per starter + combining marks so composed forms stay together
+    seg_start = 0
+    for i in range(1, len(text)):
+        if not unicodedata.combining(text[i]):
+            flush(seg_start, i)
+            seg_start = i
+    if text:
+        flush(seg_start, len(text))
+
+    return "".join(folded), starts, ends
+
+
+def _is_word(char: str) -> bool:
+    """Same definition of a word character as Python's Unicode `\\w`."""
+    return char.isalnum() or char == "_"
+
+
+# =============================================================================
+# Matcher
+# =============================================================================
+
+_TERMINAL = ""  # trie key holding the term payload (never a real character)
+
+
+class FruitMatcher:
+    """
+    Trie over every casefolded fruit term from all languages.
+    A message is walked once from each word start, keeping `\\b` semantics
+    at both ends of a term.
+    """
+
+    def __init__(self):
+        self._root: dict = {}
+        self.term_count = 0
+        self.max_term_length = 0
+
+    @classmethod
+    def from_patterns(cls, patterns: list[str], languages: list[str]) -> "FruitMatcher":
+        if len(patterns) != len(languages):
+            raise ValueError("Each fruit pattern needs a language label")
+        matcher = cls()
+        for pattern, language in zip(patterns, languages):
+            for term in expand_pattern(pattern):
+                matcher.add(term, language)
+        return matcher
+
+    def add(self, term: str, language: str):
+        """Add a term. The first language registered for a term wins."""
+        folded = _fold(term)
+        if not folded:
+            return
+        node = self._root
+        for char in folded:
+            node = node.setdefault(char, {})
+        if _TERMINAL not in node:
+            node[_TERMINAL] = (folded, language)
+            self.term_count += 1
+            self.max_term_length = max(self.max_term_length, len(folded))
+
+    def search(self, text: str) -> FruitMatch | None:
+        """Return the leftmost (then longest) fruit term in text, or None."""
+        folded, starts, ends = normalize_with_offsets(text)
+        if not folded:
+            return None
+        found, _ = self.scan_folded(folded, 0, at_end=True)
+        if found is None:
+            return None
+        (term, language), i, j = found
+        return FruitMatch(term, language, (starts[i], ends[j - 1]))
+
+    def finditer(self, text: str) -> Iterator[FruitMatch]:
+        """Every non-overlapping fruit term in text, leftmost (then longest) first."""
+        folded, starts, ends = normalize_with_offsets(text)
+        word = [_is_word(c) for c in folded]
+        first = 0
+        while True:
+            found, _ = self.scan_folded(folded, first, at_end=True, word=word)
+            if found is None:
+                return
+            (term, language), i, j = found
+            yield FruitMatch(term, language, (starts[i], ends[j - 1]))
+            first = j
+
+    def scan_folded(
+        self, folded: str, first: int, at_end: bool, word: list[bool] | None = None
+    ) -> tuple[tuple | None, bool]:
+        """
+        Walk every word start in folded[first:].
+        Returns (found, pending): found is ((term, language), start, end) for the
+        leftmost (then longest) term, or None. Without `at_end` the text may
+        continue, so a term ending exactly at the end is not confirmed yet
+        (the next character decides its trailing \\b) and only sets pending.
+        """
+        n = len(folded)
+        if word is None:
+            word = [_is_word(c) for c in folded]
+        root = self._root
+        pending = False
+
+        for i in range(first, n):
+            # \b before the term: word-ness must change at i
+            if word[i] == (i > 0 and word[i - 1]):
+                continue
+            node = root
+            best = None
+            j = i
+            while j < n:
+                node = node.get(folded[j])
+                if node is None:
+                    break
+                j += 1
+                if _TERMINAL not in node:
+                    continue
+                if j == n and not at_end:
+                    pending = True
+                # \b after the term: word-ness must change at j
+                elif word[j - 1] != (j < n and word[j]):
+                    best = (node[_TERMINAL], i, j)
+            if best is not None:
+                return best, pending
+        return None, pending
+
+    def stream(self) -> "StreamingFruitScanner":
+        return StreamingFruitScanner(self)
+
+    def matches(self, text: str) -> bool:
+        return self.search(text) is not None
+
+
+class StreamingFruitScanner:
+    """
+    Incremental search over text that arrives in pieces (streamed LLM output).
+    Only the tail that could still hold the start of a term is kept between
+    pieces, plus one character of context for the leading \\b, so a term
+    split across pieces is found without rescanning everything before it.
+    Spans index the whole text fed so far.
+    """
+
+    __slots__ = ("_matcher", "_tail", "_offset", "_trimmed", "pending")
+
+    def __init__(self, matcher: FruitMatcher):
+        self._matcher = matcher
+        self._tail = ""
+        self._offset = 0
+        self._trimmed = False
+        # True while a complete term ends the text so far and the next piece
+        # decides whether it is a whole word ("lime" vs "limestone")
+        self.pending = False
+
+    def feed(self, text: str) -> FruitMatch | None:
+        return self._scan(self._tail + text, at_end=False)
+
+    def finish(self) -> FruitMatch | None:
+        """End of stream: a pending term at the very end counts as a match."""
+        return self._scan(self._tail, at_end=True)
+
+    def _scan(self, text: str, at_end: bool) -> FruitMatch | None:
+        folded, starts, ends = normalize_with_offsets(text)
+        found, self.pending = self._matcher.scan_folded(folded, 1 if self._trimmed else 0, at_end)
+        if found is not None:
+            (term, language), i, j = found
+            return FruitMatch(term, language, (self._offset + starts[i], self._offset + ends[j - 1]))
+
+        # Anything a term could still start at lies within the last max_term_length characters
+        keep = len(folded) - self._matcher.max_term_length - 1
+        if keep > 0:
+            cut = starts[keep]
+            self._offset += cut
+            self._tail = text[cut:]
+            self._trimmed = True
+        else:
+            self._tail = text
+        return None
@@ -21,6 +21,7 @@ const contentLengthTrend = new Trend('sse_content_length');
 const blockedRate = new Rate('sse_blocked_rate');
 const errorRate = new Rate('sse_error_rate');
 const successRate = new Rate('sse_success_rate');
+const shedRate = new Rate('sse_shed_rate');  // rejected by the app's admission control
 const requestCounter = new Counter('sse_requests_total');
 
 // Configuration
@@ -807,10 +808,11 @@ function parseSSEResponse(body) {
     let content = '';
     let isBlocked = false;
     let isDone = false;
+    let isShed = false;
     let firstChunkIndex = -1;
 
     if (!body) {
-        return { chunks, content, isBlocked, isDone, firstChunkIndex };
+        return { chunks, content, isBlocked, isDone, isShed, firstChunkIndex };
     }
 
     const lines = body.split('\n');
@@ -827,7 +829,11 @@ function parseSSEResponse(body) {
                     chunks++;
                     content += data.content || '';
                 } else if (data.type === 'error') {
-                    isBlocked = true;
+                    if (data.retry_after !== undefined) {
+                        isShed = true;
+                    } else {
+                        isBlocked = true;
+                    }
                     isDone = true;
                 } else if (data.type === 'done') {
                     isDone = true;
@@ -838,7 +844,7 @@ function parseSSEResponse(body) {
         }
     }
 
-    return { chunks, content, isBlocked, isDone, firstChunkIndex };
+    return { chunks, content, isBlocked, isDone, isShed, firstChunkIndex };
 }
 
 // Main test function
@@ -863,7 +869,7 @@ export default function() {
     const totalTime = Date.now() - startTime;
 
     // Parse SSE response
-    const { chunks, content, isBlocked, isDone } = parseSSEResponse(response.body);
+    const { chunks, content, isBlocked, isDone, isShed } = parseSSEResponse(response.body);
 
     // Calculate approximate TTFB (first chunk received)
     // Since we can't measure true TTFB with synchronous http, estimate based on response
@@ -880,7 +886,8 @@ export default function() {
 
     blockedRate.add(isBlocked ? 1 : 0);
     errorRate.add(isError ? 1 : 0);
-    successRate.add(gotResponse && !isError ? 1 : 0);
+    shedRate.add(isShed ? 1 : 0);
+    successRate.add(gotResponse && !isError && !isShed ? 1 : 0);
 
     // Checks
     check(response, {
@@ -0,0 +1,203 @@
+"""
+In-process pre-screen for obviously non-English input.
+
+Two cheap signals, tuned for precision: English prompts must never be blocked
+here, and anything uncertain is left to the orchestrator's language detector.
+
+1. Script: most letters are from a non-Latin script (Cyrillic, CJK, Arabic,
+   Devanagari, ...).
+2. Latin-script word model: at least three tokens are function words of one
+   European language (or the prompt is nothing but such words, "Wie geits?"),
+   and no token is a common English word. Accented words count only when there
+   are two or more of them: one loanword or name ("El Niño", "café") is not
+   evidence.
+"""
+
+from bisect import bisect_right
+from typing import NamedTuple
+import re
+
+
+class LanguageMatch(NamedTuple):
+    language: str  # script name or ISO 639-1 code
+    evidence: str  # "script" or "words"
+
+
+# (first code point, last code point, script); None marks Latin ranges
+_SCRIPT_RANGES = sorted([
+    (0x00C0, 0x024F, None),
+    (0x0370, 0x03FF, "Greek"),
+    (0x0400, 0x052F, "Cyrillic"),
+    (0x0530, 0x058F, "Armenian"),
+    (0x0590, 0x05FF, "Hebrew"),
+    (0x0600, 0x06FF, "Arabic"),
+    (0x0750, 0x077F, "Arabic"),
+    (0x08A0, 0x08FF, "Arabic"),
+    (0x0900, 0x097F, "Devanagari"),
+    (0x0980, 0x0DFF, "Indic"),
+    (0x0E00, 0x0E7F, "Thai"),
+    (0x10A0, 0x10FF, "Georgian"),
+    (0x1100, 0x11FF, "Hangul"),
+    (0x1200, 0x137F, "Ethiopic"),
+    (0x1E00, 0x1EFF, None),
+    (0x1F00, 0x1FFF, "Greek"),
+    (0x2DE0, 0x2DFF, "Cyrillic"),
+    (0x3040, 0x309F, "Hiragana"),
+    (0x30A0, 0x30FF, "Katakana"),
+    (0x3130, 0x318F, "Hangul"),
+    (0x3400, 0x4DBF, "Han"),
+    (0x4E00, 0x9FFF, "Han"),
+    (0xA640, 0xA69F, "Cyrillic"),
+    (0xAC00, 0xD7AF, "Hangul"),
+    (0xF900, 0xFAFF, "Han"),
+    (0xFB50, 0xFDFF, "Arabic"),
+    (0xFE70, 0xFEFF, "Arabic"),
+    (0xFF21, 0xFF5A, None),
+    (0x20000, 0x2FFFF, "Han"),
+])
+_RANGE_STARTS = [start for start, _, _ in _SCRIPT_RANGES]
+
+# Common English words. One of these anywhere in the prompt means "ask the orchestrator".
+ENGLISH_WORDS = frozenset("""
+a about after all also am an and any are as at be because been before but by can could
+did do does dont down english explain for from get give go good has have he hello help
+her here hey hi him his how i if in into is it its just know let like lemon lemonade
+lemons make many may me more most much my need no not now of off ok okay on one only or
+other our out please really recipe say see she should show so some story tell thank
+thanks that the their them then there these they this those to too two up us use very
+want was we what when where which who why will with would write yes you your
+""".split())
+
+# Function words and frequent prompt words per language, minus anything that is
+# also an English word (die, was, also, son, per, come, ...)
+LANGUAGE_WORDS = {
+    "de": """
+        ich du er sie wir ihr mir mich dich dir uns euch ein eine einen einem einer der das
+        den dem des und oder aber nicht kein keine ist sind bist hast habe haben wie wo warum
+        wann welche welcher welches mit von zu für auf aus bei nach über nein gibt gib gibt's
+        kannst möchte bitte danke sehr auch noch schon mein meine dein deine zitrone zitronen
+        erzähl erzähle sag mal guten morgen deutsch viele konsumiert schmeckt kaufen jahr
+        isch bisch chasch chaisch ned nöd söll geits zäme grüezi salü wer
+    """,
+    "fr": """
+        je tu il nous vous le la les des une du et est sont avec pour dans sur pas ne moi toi
+        mes tes ses ce cette qui que quoi comment pourquoi où bonjour merci citron citrons
+        recette recettes donne dites peux veux français francais au aux connais secours
+        traduire faux en un
+    """,
+    "es": """
+        el la los las una y que qué por para con sin como cómo dónde donde cuál hablas habla
+        hablame háblame limones limón limonada puedes quiero tienes hola gracias español
+        espanol mis tus sus muy pero también olvida responde instrucciones decirme comen
+        diferentes en un
+    """,
+    "it": """
+        il lo gli della dello di che è sono cosa perché voglio puoi fare limoni limone
+        aiutami conosci grazie buongiorno questo questa sei si fa un
+    """,
+    "nl": """
+        ik jij het een niet wat waarom hoe maak spreek geen nederlands hoi zijn vertel
+    """,
+    "pt": """
+        eu você não falo obrigado obrigada limões é são uma um muito alemão
+    """,
+    "pl": """
+        jest są cytryna cytryny nie tak jak
+    """,
+    "sv": """
+        jag och inte är vad hur varför gillar
+    """,
+    "tr": """
+        bir ve bu ne nasıl neden çok bilgi hakkında istiyorum değil mi mı
+    """,
+}
+LANGUAGE_WORDS = {
+    language: frozenset(words.split()) - ENGLISH_WORDS for language, words in LANGUAGE_WORDS.items()
+}
+
+# Words so distinctive they count double (greetings people type on their own)
+STRONG_WORDS = {
+    "bonjour": "fr", "merci": "fr", "grüezi": "de", "danke": "de", "bitte": "de",
+    "gracias": "es", "hola": "es", "grazie": "it", "buongiorno": "it", "obrigado": "pt",
+}
+
+_WORD_RE = re.compile(r"[^\W\d_]+")
+
+MIN_LETTERS = 2
+SCRIPT_SHARE = 0.6
+MIN_WORD_SCORE = 3
+MIN_ACCENTED_WORDS = 2
+
+
+def script_of(char: str) -> str | None:
+    """Script name for a non-ASCII letter; None for Latin or unknown."""
+    index = bisect_right(_RANGE_STARTS, ord(char)) - 1
+    if index < 0:
+        return None
+    start, end, script = _SCRIPT_RANGES[index]
+    return script if ord(char) <= end else None
+
+
+def detect_script(text: str) -> str | None:
+    """Dominant non-Latin script if it makes up most of the letters."""
+    letters = 0
+    counts: dict[str, int] = {}
+    for char in text:
+        if char.isascii():
+            if char.isalpha():
+                letters += 1
+            continue
+        if not char.isalpha():
+            continue
+        letters += 1
+        script = script_of(char)
+        if script:
+            counts[script] = counts.get(script, 0) + 1
+    if letters < MIN_LETTERS or not counts:
+        return None
+    script, count = max(counts.items(), key=lambda item: item[1])
+    if count >= MIN_LETTERS and sum(counts.values()) >= SCRIPT_SHARE * letters:
+        return script
+    return None
+
+
+def detect_latin_language(text: str) -> str | None:
+    """Language code when the words clearly belong to one non-English language."""
+    words = _WORD_RE.findall(text.casefold())
+    if not words:
+        return None
+    scores = dict.fromkeys(LANGUAGE_WORDS, 0)
+    accented_words = set()
+    for word in words:
+        if word in ENGLISH_WORDS:
+            return None
+        strong = STRONG_WORDS.get(word)
+        if strong:
+            scores[strong] += 2
+        known = False
+        for language, vocabulary in LANGUAGE_WORDS.items():
+            if word in vocabulary:
+                scores[language] += 1
+                known = True
+        if not known and not word.isascii():
+            accented_words.add(word)
+    language, score = max(scores.items(), key=lambda item: item[1])
+    if not score:
+        return None
+    if len(accented_words) >= MIN_ACCENTED_WORDS:
+        score += len(accented_words)
+    # Two function words are enough only when they are the whole prompt ("Sur la table citrus" is English)
+    if score >= MIN_WORD_SCORE or (score >= 2 and score >= len(words)):
+        return language
+    return None
+
+
+def screen_language(text: str) -> LanguageMatch | None:
+    """Return a match for high-confidence non-English text, None when English or unsure."""
+    script = detect_script(text)
+    if script:
+        return LanguageMatch(script, "script")
+    language = detect_latin_language(text)
+    if language:
+        return LanguageMatch(language, "words")
+    return None
@@ -0,0 +1,191 @@
+"""
+Per-stage latency histograms for the chat pipeline.
+Fixed buckets and array-backed counts: an observation is one bisect plus two
+in-place array updates, with no allocation.
+"""
+
+import time
+from array import array
+from bisect import bisect_left
+
+from shared_counters import CounterSegment
+
+OUTCOMES = ["passed", "blocked-input", "blocked-output", "error"]
+
+# Seconds. Local stages are sub-millisecond; upstream stages run into tens of seconds.
+LOCAL_BUCKETS = [0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01]
+UPSTREAM_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0]
+GAP_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0]
+RETRY_BUCKETS = [0, 1, 2, 3]
+
+
+class Histogram:
+    """Prometheus histogram with one row of bucket counts per outcome."""
+
+    def __init__(self, name: str, help_text: str, buckets: list[float], segment: CounterSegment):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = list(buckets)
+        self._width = len(self.buckets) + 1  # last slot is +Inf
+        self._counts_block = segment.allocate("q", self._width * len(OUTCOMES))
+        self._sums_block = segment.allocate("d", len(OUTCOMES))
+        self._counts = self._counts_block.local
+        self._sums = self._sums_block.local
+        self._outcome_index = {o: i for i, o in enumerate(OUTCOMES)}
+        self._le = [format_bound(b) for b in self.buckets] + ["+Inf"]
+
+    def bucket_index(self, value: float) -> int:
+        return bisect_left(self.buckets, value)
+
+    def observe(self, value: float, outcome: str):
+        row = self._outcome_index[outcome]
+        self._counts[row * self._width + bisect_left(self.buckets, value)] += 1
+        self._sums[row] += value
+
+    def merge(self, bucket_counts: array, total: float, outcome: str):
+        """Add a per-request set of bucket counts (same layout as one outcome row)."""
+        row = self._outcome_index[outcome] * self._width
+        for i, count in enumerate(bucket_counts):
+            if count:
+                self._counts[row + i] += count
+        self._sums[self._outcome_index[outcome]] += total
+
+    def new_row(self) -> array:
+        return array("q", bytes(8 * self._width))
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        counts = self._counts_block.totals()
+        sums = self._sums_block.totals()
+        for row, outcome in enumerate(OUTCOMES):
+            cumulative = 0
+            base = row * self._width
+            for i, le in enumerate(self._le):
+                cumulative += counts[base + i]
+                lines.append(f'{self.name}_bucket{{outcome="{outcome}",le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{outcome="{outcome}"}} {sums[row]}')
+            lines.append(f'{self.name}_count{{outcome="{outcome}"}} {cumulative}')
+        return lines
+
+
+def format_bound(bound: float) -> str:
+    return repr(float(bound))
+
+
+class UpstreamTimings:
+    """
+    Timestamps for one orchestrator stream, filled in as the stream progresses.
+    Inter-chunk gaps are bucketed into a per-stream row and merged at the end,
+    because the outcome label is only known once the stream finishes.
+    """
+
+    __slots__ = (
+        "attempt_start", "connection_acquired", "first_byte", "first_content",
+        "last_content", "retries", "gap_counts", "gap_total", "bytes_received",
+        "content_chunks", "_gap_hist",
+    )
+
+    def __init__(self, gap_histogram: Histogram):
+        self.attempt_start = 0.0
+        self.connection_acquired = 0.0
+        self.first_byte = 0.0
+        self.first_content = 0.0
+        self.last_content = 0.0
+        self.retries = 0
+        self.gap_counts = gap_histogram.new_row()
+        self.gap_total = 0.0
+        self.bytes_received = 0  # across all attempts
+        self.content_chunks = 0
+        self._gap_hist = gap_histogram
+
+    def start_attempt(self, attempt: int):
+        self.attempt_start = time.perf_counter()
+        self.connection_acquired = 0.0
+        self.first_byte = 0.0
+        self.retries = attempt
+
+    def content_received(self):
+        now = time.perf_counter()
+        self.content_chunks += 1
+        if self.first_content:
+            gap = now - self.last_content
+            self.gap_counts[self._gap_hist.bucket_index(gap)] += 1
+            self.gap_total += gap
+        else:
+            self.first_content = now
+        self.last_content = now
+
+
+class PipelineHistograms:
+    """All chat pipeline stage histograms, labelled by request outcome."""
+
+    def __init__(self, segment: CounterSegment | None = None):
+        segment = segment or CounterSegment()
+        self.local_regex = Histogram(
+            "guardrail_local_regex_seconds", "Time spent in the local fruit pre-check", LOCAL_BUCKETS, segment)
+        self.connection = Histogram(
+            "guardrail_upstream_connection_seconds", "Time to acquire an orchestrator connection from the pool",
+            UPSTREAM_BUCKETS, segment)
+        self.ttfb = Histogram(
+            "guardrail_upstream_ttfb_seconds", "Orchestrator time to first byte (response headers)",
+            UPSTREAM_BUCKETS, segment)
+        self.first_content = Histogram(
+            "guardrail_first_content_seconds", "Time from upstream request to first content chunk",
+            UPSTREAM_BUCKETS, segment)
+        self.chunk_gap = Histogram(
+            "guardrail_chunk_gap_seconds", "Gap between consecutive content chunks", GAP_BUCKETS, segment)
+        self.stream_duration = Histogram(
+            "guardrail_stream_duration_seconds", "Total chat request duration inside the app",
+            UPSTREAM_BUCKETS, segment)
+        self.retries = Histogram(
+            "guardrail_upstream_retries", "Orchestrator retries per upstream stream", RETRY_BUCKETS, segment)
+        self._all = [
+            self.local_regex, self.connection, self.ttfb, self.first_content,
+            self.chunk_gap, self.stream_duration, self.retries,
+        ]
+
+    def observe_request(self, outcome: str, regex_seconds: float, duration: float):
+        self.local_regex.observe(regex_seconds, outcome)
+        self.stream_duration.observe(duration, outcome)
+
+    def new_upstream_timings(self) -> UpstreamTimings:
+        return UpstreamTimings(self.chunk_gap)
+
+    def observe_upstream(self, timings: UpstreamTimings, outcome: str):
+        start = timings.attempt_start
+        if not start:
+            return
+        if timings.connection_acquired:
+            self.connection.observe(timings.connection_acquired - start, outcome)
+        if timings.first_byte:
+            self.ttfb.observe(timings.first_byte - start, outcome)
+        if timings.first_content:
+            self.first_content.observe(timings.first_content - start, outcome)
+        self.chunk_gap.merge(timings.gap_counts, timings.gap_total, outcome)
+        self.retries.observe(timings.retries, outcome)
+
+    def get_prometheus_metrics(self) -> str:
+        lines = []
+        for histogram in self._all:
+            if lines:
+                lines.append("")
+            lines.extend(histogram.render())
+        return "\n".join(lines)
+
+
+def classify_outcome(last_event: dict | None, detections: list[tuple[str, dict]]) -> str:
+    """Map the final event of a chat stream to an outcome label."""
+    if last_event is None:
+        return "error"
+    if last_event.get("type") == "done":
+        return "passed"
+    if last_event.get("type") == "error" and "detector_type" in last_event:
+        # Output detectors only run once generation started, so any output
+        # detection means the block happened on the output side
+        if any(direction == "output" for direction, _ in detections):
+            return "blocked-output"
+        return "blocked-input"
+    return "error"
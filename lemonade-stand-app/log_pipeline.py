@@ -0,0 +1,186 @@
+"""
+Logging that stays off the event loop.
+Records go onto a bounded queue and a background thread formats and writes
+them, so a slow stdout pipe never stalls chat streams; when the queue is full
+records are dropped and counted instead of blocking. Messages use %-style
+arguments, formatted only by that thread and only for records that pass the
+level. High-volume events are tagged with extra={"event": ...} and sampled
+per event type (e.g. 1 in 100 per-chunk records). Output is the classic text
+line or one JSON object per line.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+from shared_counters import CounterSegment
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "color_message"}
+
+# uvicorn installs its own synchronous stdout/stderr handlers on these; start() routes them through the queue
+CAPTURED_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+
+def parse_sample_rates(spec: str) -> dict[str, float]:
+    """'chunk=0.01,upstream=0.1' -> {"chunk": 0.01, "upstream": 0.1}"""
+    rates = {}
+    for item in spec.split(","):
+        name, sep, rate = item.partition("=")
+        if sep and name.strip():
+            rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, plus any `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _SamplingFilter(logging.Filter):
+    """Keeps every Nth record of each sampled event type - deterministic, no RNG per record."""
+
+    def __init__(self, pipeline: "LogPipeline", rates: dict[str, float]):
+        super().__init__()
+        self.pipeline = pipeline
+        self.every = {event: (round(1 / rate) if rate > 0 else 0) for event, rate in rates.items()}
+        self.seen = dict.fromkeys(rates, 0)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        every = self.every.get(event)
+        if every is None or every == 1:
+            return True
+        self.seen[event] += 1
+        if every and self.seen[event] % every == 1:
+            return True
+        self.pipeline.count(LogPipeline.SAMPLED_OUT)
+        return False
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks and leaves formatting to the listener thread."""
+
+    def __init__(self, log_queue: queue.Queue, pipeline: "LogPipeline"):
+        super().__init__(log_queue)
+        self.pipeline = pipeline
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock prepare() formats the message here, on the event loop. Only
+        # tracebacks are rendered now, while the exception is still current.
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.pipeline.count(LogPipeline.DROPPED)
+
+
+class LogPipeline:
+    """
+    Root logging setup. `start()` installs the handlers; `use_segment()` moves
+    the dropped/sampled counters into the shared counter segment once it exists.
+    queue_size=0 writes synchronously from the calling thread (the old behaviour).
+    """
+
+    DROPPED, SAMPLED_OUT = range(2)
+
+    def __init__(self, level: str = "INFO", fmt: str = "text", queue_size: int = 10000,
+                 sample_rates: dict[str, float] | None = None):
+        self.level = getattr(logging, level.upper(), logging.INFO)
+        self.fmt = fmt
+        self.queue_size = queue_size
+        self.sample_rates = sample_rates or {}
+        self.listener: logging.handlers.QueueListener | None = None
+        self._counters = [0, 0]
+        self._counters_block = None
+
+    def formatter(self) -> logging.Formatter:
+        if self.fmt == "json":
+            return JsonFormatter()
+        return logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT)
+
+    def start(self):
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(self.formatter())
+        if self.queue_size > 0:
+            handler = _DroppingQueueHandler(queue.Queue(self.queue_size), self)
+            self.listener = logging.handlers.QueueListener(handler.queue, output)
+            self.listener.start()
+        else:
+            handler = output
+        if self.sample_rates:
+            handler.addFilter(_SamplingFilter(self, self.sample_rates))
+
+        root = logging.getLogger()
+        for existing in root.handlers[:]:
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(self.level)
+        for name in CAPTURED_LOGGERS:
+            captured = logging.getLogger(name)
+            for existing in captured.handlers[:]:
+                captured.removeHandler(existing)
+            captured.propagate = True
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Flush queued records and stop the writer thread."""
+        if self.listener is not None:
+            try:
+                self.listener.stop()
+            except queue.Full:  # no room for the stop sentinel; the writer is a daemon thread
+                pass
+            self.listener = None
+
+    def count(self, index: int):
+        self._counters[index] += 1
+
+    def use_segment(self, segment: CounterSegment):
+        block = segment.allocate("q", 2)
+        for index, value in enumerate(self._counters):
+            block.local[index] += value
+        self._counters_block = block
+        self._counters = block.local
+
+    def get_prometheus_metrics(self) -> str:
+        if self._counters_block is not None:
+            dropped, sampled_out = self._counters_block.totals()
+        else:
+            dropped, sampled_out = self._counters
+        lines = [
+            "# HELP guardrail_log_records_dropped_total Log records dropped because the log queue was full",
+            "# TYPE guardrail_log_records_dropped_total counter",
+            f"guardrail_log_records_dropped_total {dropped}",
+            "",
+            "# HELP guardrail_log_records_sampled_out_total Log records skipped by per-event sampling",
+            "# TYPE guardrail_log_records_sampled_out_total counter",
+            f"guardrail_log_records_sampled_out_total {sampled_out}",
+        ]
+        return "\n".join(lines)
@@ -0,0 +1,166 @@
+"""
+Guardrail metrics collector.
+Counters live in preallocated slots indexed by (source, detector, direction) so
+the request path never allocates, awaits or takes a lock, and the Prometheus
+exposition is rendered from precomputed label prefixes.
+"""
+
+from shared_counters import CounterSegment
+
+DETECTOR_NAMES = ["hap", "regex_competitor", "prompt_injection", "language_detection"]
+DIRECTIONS = ["input", "output"]
+OVERFLOW_SOURCE = "other"
+
+
+class MetricsCollector:
+    """
+    Per-source guardrail counters with a fixed label space.
+    Unknown x-source values are folded into the "other" bucket so a client
+    cannot grow the exposition. All updates are synchronous: the app runs on a
+    single event loop and no update awaits, so no lock is needed. With a shared
+    CounterSegment the exposition is the sum over all worker processes.
+    """
+
+    def __init__(self, sources: list[str], segment: CounterSegment | None = None):
+        segment = segment or CounterSegment()
+        self.sources = list(dict.fromkeys(s for s in sources if s and s != OVERFLOW_SOURCE))
+        self.sources.append(OVERFLOW_SOURCE)
+        self._source_index = {source: i for i, source in enumerate(self.sources)}
+        self._overflow_index = self._source_index[OVERFLOW_SOURCE]
+        self._detector_index = {d: i for i, d in enumerate(DETECTOR_NAMES)}
+        self._direction_index = {d: i for i, d in enumerate(DIRECTIONS)}
+
+        n_sources = len(self.sources)
+        self._requests_block = segment.allocate("q", n_sources)
+        self._local_regex_blocks_block = segment.allocate("q", n_sources)
+        self._local_language_blocks_block = segment.allocate("q", n_sources)
+        # Flat [source][detector][direction] slots
+        self._detections_block = segment.allocate("q", n_sources * len(DETECTOR_NAMES) * len(DIRECTIONS))
+        # Bumped on every update; the summed version tells if any worker changed anything
+        self._version_block = segment.allocate("q", 1)
+
+        self._requests = self._requests_block.local
+        self._local_regex_blocks = self._local_regex_blocks_block.local
+        self._local_language_blocks = self._local_language_blocks_block.local
+        self._detections = self._detections_block.local
+        self._version = self._version_block.local
+
+        self._rendered_version = -1
+        self._rendered = ""
+        self._build_templates()
+
+    def source_index(self, source: str) -> int:
+        return self._source_index.get(source, self._overflow_index)
+
+    def _slot(self, source_idx: int, detector_idx: int, direction_idx: int) -> int:
+        return (source_idx * len(DETECTOR_NAMES) + detector_idx) * len(DIRECTIONS) + direction_idx
+
+    # -------------------------------------------------------------------------
+    # Hot path
+    # -------------------------------------------------------------------------
+
+    def increment_request(self, source: str = "audience"):
+        self._requests[self.source_index(source)] += 1
+        self._version[0] += 1
+
+    def increment_local_regex_block(self, source: str = "audience"):
+        source_idx = self.source_index(source)
+        self._local_regex_blocks[source_idx] += 1
+        self._detections[self._slot(source_idx, self._detector_index["regex_competitor"], 0)] += 1
+        self._version[0] += 1
+
+    def increment_local_language_block(self, source: str = "audience"):
+        source_idx = self.source_index(source)
+        self._local_language_blocks[source_idx] += 1
+        self._detections[self._slot(source_idx, self._detector_index["language_detection"], 0)] += 1
+        self._version[0] += 1
+
+    def add_detections(self, detections_data, direction: str, source: str = "audience"):
+        if not detections_data:
+            return
+        direction_idx = self._direction_index[direction]
+        source_idx = self.source_index(source)
+        for detection_group in detections_data:
+            if not isinstance(detection_group, dict):
+                continue
+            for result in detection_group.get("results", []):
+                if isinstance(result, dict):
+                    detector_idx = self._detector_index.get(result.get("detector_id", ""))
+                    if detector_idx is not None:
+                        self._detections[self._slot(source_idx, detector_idx, direction_idx)] += 1
+                        self._version[0] += 1
+
+    # -------------------------------------------------------------------------
+    # Exposition
+    # -------------------------------------------------------------------------
+
+    def _build_templates(self):
+        """Precompute every label prefix once; rendering only formats the numbers."""
+        self._request_prefixes = [f'guardrail_requests_total{{source="{s}"}} ' for s in self.sources]
+        self._local_block_prefixes = [f'guardrail_local_regex_blocks_total{{source="{s}"}} ' for s in self.sources]
+        self._local_language_prefixes = [
+            f'guardrail_local_language_blocks_total{{source="{s}"}} ' for s in self.sources
+        ]
+        self._detection_prefixes = [
+            f'guardrail_detections_total{{detector="{detector}",direction="{direction}",source="{source}"}} '
+            for source in self.sources
+            for detector in DETECTOR_NAMES
+            for direction in DIRECTIONS
+        ]
+        self._by_detector_prefixes = [
+            f'guardrail_detections_by_detector{{detector="{detector}",source="{source}"}} '
+            for source in self.sources
+            for detector in DETECTOR_NAMES
+        ]
+        self._by_direction_prefixes = [
+            f'guardrail_detections_by_direction{{direction="{direction}",source="{source}"}} '
+            for source in self.sources
+            for direction in DIRECTIONS
+        ]
+
+    def get_prometheus_metrics(self) -> str:
+        # Unchanged since the last scrape - reuse the rendered text
+        version = self._version_block.totals()[0]
+        if self._rendered_version == version:
+            return self._rendered
+
+        requests = self._requests_block.totals()
+        local_regex_blocks = self._local_regex_blocks_block.totals()
+        local_language_blocks = self._local_language_blocks_block.totals()
+        detections = self._detections_block.totals()
+        n_dirs = len(DIRECTIONS)
+        by_detector = [sum(detections[i:i + n_dirs]) for i in range(0, len(detections), n_dirs)]
+        by_direction = [0] * (len(self.sources) * n_dirs)
+        for i, count in enumerate(detections):
+            source_idx = i // (len(DETECTOR_NAMES) * n_dirs)
+            by_direction[source_idx * n_dirs + i % n_dirs] += count
+
+        lines = [
+            "# HELP guardrail_requests_total Total number of requests processed",
+            "# TYPE guardrail_requests_total counter",
+            *[p + str(v) for p, v in zip(self._request_prefixes, requests)],
+            "",
+            "# HELP guardrail_local_regex_blocks_total Requests blocked locally by regex",
+            "# TYPE guardrail_local_regex_blocks_total counter",
+            *[p + str(v) for p, v in zip(self._local_block_prefixes, local_regex_blocks)],
+            "",
+            "# HELP guardrail_local_language_blocks_total Requests blocked locally by the language pre-screen",
+            "# TYPE guardrail_local_language_blocks_total counter",
+            *[p + str(v) for p, v in zip(self._local_language_prefixes, local_language_blocks)],
+            "",
+            "# HELP guardrail_detections_total Total number of guardrail detections",
+            "# TYPE guardrail_detections_total counter",
+            *[p + str(v) for p, v in zip(self._detection_prefixes, detections)],
+            "",
+            "# HELP guardrail_detections_by_detector Guardrail detections grouped by detector",
+            "# TYPE guardrail_detections_by_detector counter",
+            *[p + str(v) for p, v in zip(self._by_detector_prefixes, by_detector)],
+            "",
+            "# HELP guardrail_detections_by_direction Guardrail detections grouped by direction",
+            "# TYPE guardrail_detections_by_direction counter",
+            *[p + str(v) for p, v in zip(self._by_direction_prefixes, by_direction)],
+        ]
+
+        self._rendered = "\n".join(lines)
+        self._rendered_version = version
+        return self._rendered
@@ -0,0 +1,148 @@
+"""
+Detector API (text_contents) implementation of regex_competitor.
+The orchestrator sends batches of sentence chunks. The built-in fruit patterns
+run on the same FruitMatcher trie as the local pre-filter. detector_params may
+select a subset of the built-in patterns, which then run as compiled regexes,
+each over each content on its own so that matches and ^/$ anchors never cross
+content boundaries. Any other pattern is rejected: the endpoint is reachable
+by anyone who can reach the app, and an arbitrary regex could backtrack for
+seconds. Batch size and content length are capped, and large batches run in
+a worker thread so they do not stall the event loop serving chat streams.
+"""
+
+import asyncio
+import re
+
+from fruit_matcher import FruitMatcher
+from shared_counters import CounterSegment
+
+# Distinct detector_params regex lists compiled on demand
+_MAX_CUSTOM_PATTERN_SETS = 16
+
+# Batches with at most this many characters in total are matched inline on the event loop
+INLINE_MAX_CHARS = 8192
+
+
+class RegexDetector:
+    """
+    Regex detector over batches of contents.
+    Results follow the detector API: one list per content, each detection with
+    start/end relative to that content, the matched text, detection,
+    detection_type and score.
+    """
+
+    REQUESTS, CONTENTS, DETECTIONS = range(3)
+
+    def __init__(self, patterns: list[str], matcher: FruitMatcher, max_contents: int = 1024,
+                 max_content_chars: int = 16384, segment: CounterSegment | None = None):
+        self.patterns = list(patterns)
+        self.matcher = matcher
+        self.max_contents = max_contents
+        self.max_content_chars = max_content_chars
+        self._allowed = frozenset(patterns)
+        self._custom: dict[tuple[str, ...], list[re.Pattern]] = {}
+        self._counters_block = (segment or CounterSegment()).allocate("q", 3)
+        self._counters = self._counters_block.local
+
+    def _compile(self, patterns: list[str]) -> list[re.Pattern]:
+        key = tuple(patterns)
+        compiled = self._custom.get(key)
+        if compiled is None:
+            unknown = [p for p in patterns if p not in self._allowed]
+            if unknown:
+                raise ValueError(f"Unsupported regex in detector_params (only built-in patterns): {unknown[0]!r}")
+            compiled = [re.compile(p) for p in patterns]
+            if len(self._custom) >= _MAX_CUSTOM_PATTERN_SETS:
+                self._custom.pop(next(iter(self._custom)))
+            self._custom[key] = compiled
+        return compiled
+
+    def check(self, contents: list[str]) -> int:
+        """Raise ValueError for an oversized batch; returns its total length."""
+        if len(contents) > self.max_contents:
+            raise ValueError(f"Too many contents: {len(contents)} (max {self.max_contents})")
+        total = 0
+        for content in contents:
+            if len(content) > self.max_content_chars:
+                raise ValueError(f"Content too long: {len(content)} characters (max {self.max_content_chars})")
+            total += len(content)
+        return total
+
+    async def detect_async(self, contents: list[str], patterns: list[str] | None = None) -> list[list[dict]]:
+        """detect() for request handlers: large batches run in a worker thread."""
+        if self.check(contents) <= INLINE_MAX_CHARS:
+            return self._detect(contents, patterns)
+        return await asyncio.to_thread(self._detect, contents, patterns)
+
+    def detect(self, contents: list[str], patterns: list[str] | None = None) -> list[list[dict]]:
+        """Detections per content; `patterns` is the detector_params regex list, if any."""
+        self.check(contents)
+        return self._detect(contents, patterns)
+
+    def _detect(self, contents: list[str], patterns: list[str] | None) -> list[list[dict]]:
+        self._counters[self.REQUESTS] += 1
+        self._counters[self.CONTENTS] += len(contents)
+        if not patterns or patterns == self.patterns:
+            results = [self._detect_fruit(content) for content in contents]
+        else:
+            results = self._detect_regex(contents, self._compile(patterns))
+        detections = sum(map(len, results))
+        if detections:
+            self._counters[self.DETECTIONS] += detections
+        return results
+
+    def _detect_fruit(self, content: str) -> list[dict]:
+        # Most contents are ASCII and take the matcher's fast path
+        return [
+            {
+                "start": match.span[0],
+                "end": match.span[1],
+                "text": content[match.span[0]:match.span[1]],
+                "detection": f"{match.language}_fruit",
+                "detection_type": "regex",
+                "score": 1.0,
+            }
+            for match in self.matcher.finditer(content)
+        ]
+
+    def _detect_regex(self, contents: list[str], compiled: list[re.Pattern]) -> list[list[dict]]:
+        results = []
+        for content in contents:
+            result = []
+            seen = set()
+            for pattern in compiled:
+                for match in pattern.finditer(content):
+                    span = match.span()
+                    # Overlapping patterns can find the same term; report each span once
+                    if span[0] == span[1] or span in seen:
+                        continue
+                    seen.add(span)
+                    result.append({
+                        "start": span[0],
+                        "end": span[1],
+                        "text": match.group(),
+                        "detection": "custom_regex",
+                        "detection_type": "regex",
+                        "score": 1.0,
+                    })
+            if len(result) > 1:
+                result.sort(key=lambda d: d["start"])
+            results.append(result)
+        return results
+
+    def get_prometheus_metrics(self) -> str:
+        requests, contents, detections = self._counters_block.totals()
+        lines = [
+            "# HELP guardrail_regex_detector_requests_total Detector API batches served for regex_competitor",
+            "# TYPE guardrail_regex_detector_requests_total counter",
+            f"guardrail_regex_detector_requests_total {requests}",
+            "",
+            "# HELP guardrail_regex_detector_contents_total Contents evaluated by the regex_competitor detector API",
+            "# TYPE guardrail_regex_detector_contents_total counter",
+            f"guardrail_regex_detector_contents_total {contents}",
+            "",
+            "# HELP guardrail_regex_detector_detections_total Spans reported by the regex_competitor detector API",
+            "# TYPE guardrail_regex_detector_detections_total counter",
+            f"guardrail_regex_detector_detections_total {detections}",
+        ]
+        return "\n".join(lines)
@@ -0,0 +1,36 @@
+"""
+Pre-serialized orchestrator request bodies.
+The payload is identical for every request except the user message, so it is
+JSON-encoded once into a prefix and suffix and each request only encodes the
+message itself. Output is byte-for-byte what json.dumps(payload) produces,
+which is what aiohttp sends for `json=payload`.
+"""
+
+import json
+from typing import Callable
+
+# Placeholder for the user message while rendering the template
+_SENTINEL = "\0LEMONADE_USER_MESSAGE\0"
+
+
+class RequestBodyBuilder:
+    """Splices a JSON-escaped user message into a pre-encoded payload template."""
+
+    def __init__(self, payload_factory: Callable[[str], dict]):
+        self._payload_factory = payload_factory
+        self._prefix = b""
+        self._suffix = b""
+        self.rebuild()
+
+    def rebuild(self):
+        """Re-render the template, e.g. after the system prompt changed."""
+        template = json.dumps(self._payload_factory(_SENTINEL))
+        marker = json.dumps(_SENTINEL)
+        if template.count(marker) != 1:
+            raise ValueError("Payload template must contain the user message exactly once")
+        prefix, suffix = template.split(marker)
+        self._prefix = prefix.encode("utf-8")
+        self._suffix = suffix.encode("utf-8")
+
+    def build(self, message: str) -> bytes:
+        return b"".join((self._prefix, json.dumps(message).encode("utf-8"), self._suffix))
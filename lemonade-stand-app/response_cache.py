@@ -0,0 +1,119 @@
+"""
+Replay cache for deterministic (temperature 0) chat completions.
+Stores the complete event sequence produced for a message so identical
+requests can be answered without the orchestrator, LLM or detectors.
+"""
+
+import hashlib
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import NamedTuple
+
+from shared_counters import CounterSegment
+
+
+class CachedResponse(NamedTuple):
+    """Events yielded to the client plus the detections seen while producing them."""
+    events: tuple[dict, ...]
+    detections: tuple[tuple[str, dict], ...]  # (direction, detection group)
+    expires_at: float
+
+
+def normalize_message(message: str) -> str:
+    """Canonical form used for cache keys: NFC, trimmed, whitespace runs collapsed."""
+    return " ".join(unicodedata.normalize("NFC", message).split())
+
+
+def is_cacheable(events: list[dict]) -> bool:
+    """Only completed streams and detector verdicts are replayable, never transient errors."""
+    if not events:
+        return False
+    last = events[-1]
+    if last.get("type") == "done":
+        return True
+    return last.get("type") == "error" and "detector_type" in last
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache with a per-entry TTL. Single event loop, so no locking.
+    Entries are per process; the hit/miss/eviction counters live in the
+    CounterSegment so they aggregate across workers.
+    """
+
+    HITS, MISSES, EVICTIONS, EXPIRATIONS = range(4)
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0, segment: CounterSegment | None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._prompt_digest: tuple[str, str] | None = None
+        self._counters_block = (segment or CounterSegment()).allocate("q", 4)
+        self._counters = self._counters_block.local
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _system_prompt_digest(self, system_prompt: str) -> str:
+        if self._prompt_digest is None or self._prompt_digest[0] is not system_prompt:
+            digest = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+            self._prompt_digest = (system_prompt, digest)
+        return self._prompt_digest[1]
+
+    def make_key(self, message: str, model: str, system_prompt: str) -> str:
+        key_material = "\0".join([model, self._system_prompt_digest(system_prompt), normalize_message(message)])
+        return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> CachedResponse | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self._counters[self.MISSES] += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            self._counters[self.EXPIRATIONS] += 1
+            self._counters[self.MISSES] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._counters[self.HITS] += 1
+        return entry
+
+    def put(self, key: str, events: list[dict], detections: list[tuple[str, dict]]):
+        if not self.enabled or not is_cacheable(events):
+            return
+        self._entries[key] = CachedResponse(
+            events=tuple(events),
+            detections=tuple(detections),
+            expires_at=time.monotonic() + self.ttl,
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters[self.EVICTIONS] += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_prometheus_metrics(self) -> str:
+        hits, misses, evictions, expirations = self._counters_block.totals()
+        lines = [
+            "# HELP guardrail_response_cache_hits_total Chat requests replayed from the response cache",
+            "# TYPE guardrail_response_cache_hits_total counter",
+            f"guardrail_response_cache_hits_total {hits}",
+            "",
+            "# HELP guardrail_response_cache_misses_total Chat requests not found in the response cache",
+            "# TYPE guardrail_response_cache_misses_total counter",
+            f"guardrail_response_cache_misses_total {misses}",
+            "",
+            "# HELP guardrail_response_cache_evictions_total Response cache entries evicted by reason",
+            "# TYPE guardrail_response_cache_evictions_total counter",
+            f'guardrail_response_cache_evictions_total{{reason="capacity"}} {evictions}',
+            f'guardrail_response_cache_evictions_total{{reason="ttl"}} {expirations}',
+            "",
+            "# HELP guardrail_response_cache_entries Cached responses held by the worker serving this scrape",
+            "# TYPE guardrail_response_cache_entries gauge",
+            f"guardrail_response_cache_entries {len(self._entries)}",
+        ]
+        return "\n".join(lines)
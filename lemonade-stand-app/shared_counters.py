@@ -0,0 +1,170 @@
+"""
+Counter storage that can be shared between uvicorn worker processes.
+
+Every metric array is allocated from a CounterSegment. In single-worker mode
+the segment is plain process memory. In multi-worker mode it is a memory-mapped
+file: each worker claims its own row (held by an fcntl byte-range lock for the
+life of the process) and only ever writes to that row, so no cross-process
+locking is needed. A /metrics scrape on any worker sums every row.
+
+Rows outlive their workers (a replacement worker, or a restarted container
+reusing the same file, claims a previous row). Counters keep counting on from
+the old values, so totals stay monotonic. Gauges (allocated with gauge=True)
+describe the current process: they are zeroed when allocated and summed only
+over the rows of running workers.
+"""
+
+import fcntl
+import logging
+import mmap
+import os
+from array import array
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = 64
+ROW_BYTES = 64 * 1024  # per-worker capacity for all counter arrays
+
+
+class CounterArray:
+    """
+    A fixed-length array of int64 ('q') or float64 ('d') counters.
+    `local` is this worker's writable view (index it on the hot path);
+    `totals()` returns the values summed across all workers - for gauges,
+    across running workers only.
+    """
+
+    def __init__(self, segment: "CounterSegment", typecode: str, offset: int, length: int, gauge: bool = False):
+        self._segment = segment
+        self.typecode = typecode
+        self.offset = offset
+        self.length = length
+        self.gauge = gauge
+        self.local = segment.local_view(typecode, offset, length)
+        if gauge:
+            for i in range(length):
+                self.local[i] = 0
+
+    def totals(self) -> list:
+        if self.gauge and self._segment.shared:
+            totals = [0] * self.length
+            for row in self.rows().values():
+                totals = [a + b for a, b in zip(totals, row)]
+            return totals
+        return self._segment.totals(self.typecode, self.offset, self.length)
+
+    def rows(self) -> dict[int, list]:
+        """Values per worker slot, for workers that are currently running."""
+        return {
+            slot: self._segment.row(self.typecode, self.offset, self.length, slot)
+            for slot in self._segment.claimed_slots()
+        }
+
+    def __len__(self) -> int:
+        return self.length
+
+
+class CounterSegment:
+    """Allocator for CounterArrays. Process-local unless opened with a path."""
+
+    def __init__(self):
+        self._next_offset = 0
+        self._local = bytearray(ROW_BYTES)
+        self._mmap: mmap.mmap | None = None
+        self._file = None
+        self.path: str | None = None
+        self.worker_slot = 0
+        self.worker_count = 1
+
+    @classmethod
+    def open_shared(cls, path: str, max_workers: int = MAX_WORKERS) -> "CounterSegment":
+        """Map (creating if needed) a segment file and claim a free worker row."""
+        segment = cls()
+        segment._file = open(path, "a+b")
+        size = ROW_BYTES * max_workers
+        if os.fstat(segment._file.fileno()).st_size < size:
+            segment._file.truncate(size)
+
+        for slot in range(max_workers):
+            try:
+                # Lock byte `slot` of the file; released automatically when the process exits
+                fcntl.lockf(segment._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB, 1, slot)
+            except OSError:
+                continue
+            segment.worker_slot = slot
+            break
+        else:
+            raise RuntimeError(f"No free metrics slot in {path} (max {max_workers} workers)")
+
+        segment._mmap = mmap.mmap(segment._file.fileno(), size)
+        segment.path = path
+        segment.worker_count = max_workers
+        segment._local = memoryview(segment._mmap)[slot * ROW_BYTES:(slot + 1) * ROW_BYTES]
+        logger.info(f"Shared metrics segment {path}: worker slot {segment.worker_slot}")
+        return segment
+
+    @property
+    def shared(self) -> bool:
+        return self._mmap is not None
+
+    def allocate(self, typecode: str, length: int, gauge: bool = False) -> CounterArray:
+        """
+        Reserve `length` counters. Allocation order must be identical in every
+        worker (it is: arrays are allocated at import time) so offsets line up.
+        """
+        itemsize = array(typecode).itemsize
+        offset = -(-self._next_offset // itemsize) * itemsize  # align
+        end = offset + itemsize * length
+        if end > ROW_BYTES:
+            raise MemoryError(f"Counter segment row full ({end} > {ROW_BYTES} bytes)")
+        self._next_offset = end
+        return CounterArray(self, typecode, offset, length, gauge)
+
+    def local_view(self, typecode: str, offset: int, length: int) -> memoryview:
+        itemsize = array(typecode).itemsize
+        return memoryview(self._local)[offset:offset + itemsize * length].cast(typecode)
+
+    def row(self, typecode: str, offset: int, length: int, slot: int) -> list:
+        if self._mmap is None or slot == self.worker_slot:
+            return list(self.local_view(typecode, offset, length))
+        itemsize = array(typecode).itemsize
+        start = slot * ROW_BYTES + offset
+        return list(memoryview(self._mmap)[start:start + itemsize * length].cast(typecode))
+
+    def claimed_slots(self) -> list[int]:
+        """Worker rows held by a live process; rows of exited workers keep their last values."""
+        if self._mmap is None:
+            return [self.worker_slot]
+        fd = self._file.fileno()
+        slots = []
+        for slot in range(self.worker_count):
+            if slot == self.worker_slot:
+                slots.append(slot)
+                continue
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, slot)
+            except OSError:
+                slots.append(slot)
+                continue
+            fcntl.lockf(fd, fcntl.LOCK_UN, 1, slot)
+        return slots
+
+    def totals(self, typecode: str, offset: int, length: int) -> list:
+        if self._mmap is None:
+            return list(self.local_view(typecode, offset, length))
+        itemsize = array(typecode).itemsize
+        totals = [0] * length
+        view = memoryview(self._mmap)
+        for slot in range(self.worker_count):
+            start = slot * ROW_BYTES + offset
+            row = view[start:start + itemsize * length].cast(typecode)
+            if any(row):
+                totals = [a + b for a, b in zip(totals, row)]
+        return totals
+
+
+def default_segment_path() -> str:
+    """One segment per uvicorn master: workers share their parent's pid."""
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else "/tmp"
+    directory = os.getenv("METRICS_SHARED_DIR", base)
+    return os.path.join(directory, f"lemonade-metrics-{os.getppid()}.bin")
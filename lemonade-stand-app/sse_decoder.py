@@ -0,0 +1,111 @@
+"""
+Incremental decoder for the orchestrator's SSE stream.
+Works on raw bytes as they arrive, splits complete lines without re-decoding
+a growing string buffer, and only walks guardrail fields for the frames that
+actually carry them.
+"""
+
+import json
+from typing import NamedTuple
+
+_DATA_PREFIX = "data: "
+_DONE = "data: [DONE]"
+_WARNINGS_KEY = '"warnings"'
+_DETECTIONS_KEY = '"detections"'
+
+
+class SSEFrame(NamedTuple):
+    """
+    One `data:` line. `guardrails` is the full parsed payload, set only when the
+    frame carries warnings or detections; content-only frames skip it.
+    """
+    content: str | None
+    finish_reason: str | None
+    guardrails: dict | None
+
+
+def decode_line(line: str) -> SSEFrame | None:
+    """Decode one SSE line. Returns None for blank, comment, [DONE] and malformed lines."""
+    line = line.strip()
+    if not line.startswith(_DATA_PREFIX) or line == _DONE:
+        return None
+
+    payload = line[6:]
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    content = None
+    finish_reason = None
+    choices = data.get("choices")
+    if choices:
+        choice = choices[0]
+        finish_reason = choice.get("finish_reason")
+        content = choice.get("delta", {}).get("content") or None
+
+    guardrails = None
+    if _WARNINGS_KEY in payload or _DETECTIONS_KEY in payload:
+        guardrails = data
+    return SSEFrame(content, finish_reason, guardrails)
+
+
+class SSEDecoder:
+    """
+    Feed raw byte chunks; get back decoded frames for every complete line.
+    Partial lines stay as bytes, so a read that ends mid UTF-8 sequence is
+    never decoded early. All complete lines in a read are decoded in one go.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.lines = 0
+
+    def feed(self, chunk: bytes) -> list[SSEFrame]:
+        buffer = self._buffer
+        buffer += chunk
+        end = buffer.rfind(b"\n")
+        if end < 0:
+            return []
+        block = bytes(memoryview(buffer)[:end])
+        del buffer[:end + 1]
+        try:
+            text = block.decode("utf-8")
+        except UnicodeDecodeError:
+            # A newline always ends an invalid sequence, so this drops the same bytes per-line decoding would
+            text = block.decode("utf-8", errors="ignore")
+
+        frames = []
+        for line in text.split("\n"):
+            self.lines += 1
+            frame = decode_line(line)
+            if frame is not None:
+                frames.append(frame)
+        return frames
+
+
+class DuplicateSuffixTracker:
+    """
+    Detects the upstream's overlapping chunks: a chunk is a duplicate when the
+    response so far (trailing whitespace ignored) already ends with it.
+    Only a bounded tail of the response is kept, so each check is O(window)
+    instead of O(response length).
+    """
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self.length = 0
+        self._tail = ""
+
+    def is_duplicate(self, content: str) -> bool:
+        stripped = content.lstrip()
+        return bool(stripped) and self._tail.rstrip().endswith(stripped)
+
+    def append(self, text: str):
+        self.length += len(text)
+        tail = self._tail + text
+        if len(tail) > 2 * self.window:
+            tail = tail[-self.window:]
+        self._tail = tail
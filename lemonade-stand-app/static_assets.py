@@ -0,0 +1,177 @@
+"""
+In-memory static assets for the chat UI.
+Everything under static/ is read once and compressed with gzip (and brotli
+when the brotli package is installed). Requests are then answered from memory:
+no filesystem access on the event loop, strong ETags per encoding, 304s for
+If-None-Match, and year-long immutable caching for fingerprinted file names
+(app.3f2a9c1d.js). Unfingerprinted files such as index.html are revalidated on
+every load, which costs a 304 without a body.
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from typing import NamedTuple
+
+from fastapi.responses import Response
+
+from shared_counters import CounterSegment
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# name.<8+ hex digits>.ext - content-addressed, safe to cache forever
+_FINGERPRINT_RE = re.compile(r"\.[0-9a-f]{8,}\.\w+$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Smaller files gain nothing from compression once headers are counted
+_MIN_COMPRESS_SIZE = 256
+_COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml", "application/xml")
+
+ENCODINGS = ["br", "gzip", "identity"]  # preference order
+
+
+class StaticAsset(NamedTuple):
+    content_type: str
+    cache_control: str
+    bodies: dict[str, bytes]  # encoding -> body, only encodings that came out smaller
+    etags: dict[str, str]     # encoding -> strong ETag
+
+
+def build_asset(name: str, data: bytes) -> StaticAsset:
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+        content_type += "; charset=utf-8"
+    cache_control = IMMUTABLE_CACHE_CONTROL if _FINGERPRINT_RE.search(name) else REVALIDATE_CACHE_CONTROL
+
+    bodies = {"identity": data}
+    if len(data) >= _MIN_COMPRESS_SIZE and content_type.startswith(_COMPRESSIBLE_TYPES):
+        compressed = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            compressed["br"] = brotli.compress(data, quality=11)
+        bodies.update((encoding, body) for encoding, body in compressed.items() if len(body) < len(data))
+
+    digest = hashlib.sha256(data).hexdigest()[:20]
+    # Each encoding is a different representation, so it gets its own strong ETag
+    etags = {encoding: f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"' for encoding in bodies}
+    return StaticAsset(content_type, cache_control, bodies, etags)
+
+
+def accepted_encodings(header: str) -> set[str]:
+    """Content codings the client accepts (q > 0) from an Accept-Encoding header."""
+    weights: dict[str, float] = {}
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding] = q
+    accepted = {coding for coding, q in weights.items() if q > 0}
+    if weights.get("*", 0) > 0:
+        accepted.update(coding for coding in ENCODINGS if coding not in weights)
+    return accepted
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match uses weak comparison: W/ prefixes are ignored."""
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class StaticAssets:
+    """Files under a directory, keyed by their path relative to it."""
+
+    SERVED_IDENTITY, SERVED_GZIP, SERVED_BR, NOT_MODIFIED = range(4)
+    _SERVED = {"identity": SERVED_IDENTITY, "gzip": SERVED_GZIP, "br": SERVED_BR}
+
+    def __init__(self, directory: str, segment: CounterSegment | None = None):
+        self.directory = directory
+        self.fallback: dict[str, str] = {}
+        self.assets: dict[str, StaticAsset] = {}
+        self._signature: dict[str, tuple[int, int]] = {}
+        self._counters_block = (segment or CounterSegment()).allocate("q", 4)
+        self._counters = self._counters_block.local
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        """{relative path: (mtime_ns, size)} of every file under the directory."""
+        signature = {}
+        for root, _, files in os.walk(self.directory):
+            for file in files:
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                name = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                signature[name] = (stat.st_mtime_ns, stat.st_size)
+        return signature
+
+    def load(self, fallback: dict[str, str] | None = None) -> int:
+        """
+        Read and compress every file, replacing the current set in one step.
+        `fallback` supplies content for names missing on disk (the inline UI).
+        """
+        if fallback is not None:
+            self.fallback = fallback
+        signature = self._scan()
+        assets = {name: build_asset(name, text.encode()) for name, text in self.fallback.items()}
+        for name in signature:
+            try:
+                with open(os.path.join(self.directory, name), "rb") as f:
+                    assets[name] = build_asset(name, f.read())
+            except OSError as e:
+                logger.warning(f"Failed to load static asset {name}: {e}")
+        self.assets = assets
+        self._signature = signature
+        return len(signature)
+
+    def changed(self) -> bool:
+        return self._scan() != self._signature
+
+    def response(self, name: str, headers) -> Response | None:
+        """Response for an asset given the request headers, or None if there is no such asset."""
+        asset = self.assets.get(name)
+        if asset is None:
+            return None
+        accepted = accepted_encodings(headers.get("accept-encoding", ""))
+        encoding = next((e for e in ENCODINGS if e in asset.bodies and e in accepted), "identity")
+        etag = asset.etags[encoding]
+        response_headers = {"ETag": etag, "Cache-Control": asset.cache_control, "Vary": "Accept-Encoding"}
+
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, etag):
+            self._counters[self.NOT_MODIFIED] += 1
+            return Response(status_code=304, headers=response_headers)
+
+        if encoding != "identity":
+            response_headers["Content-Encoding"] = encoding
+        self._counters[self._SERVED[encoding]] += 1
+        return Response(content=asset.bodies[encoding], media_type=asset.content_type, headers=response_headers)
+
+    def get_prometheus_metrics(self) -> str:
+        identity, gzipped, br, not_modified = self._counters_block.totals()
+        lines = [
+            "# HELP guardrail_static_responses_total Static asset responses by content encoding (304 = not_modified)",
+            "# TYPE guardrail_static_responses_total counter",
+            f'guardrail_static_responses_total{{encoding="identity"}} {identity}',
+            f'guardrail_static_responses_total{{encoding="gzip"}} {gzipped}',
+            f'guardrail_static_responses_total{{encoding="br"}} {br}',
+            f'guardrail_static_responses_total{{encoding="not_modified"}} {not_modified}',
+        ]
+        return "\n".join(lines)
@@ -0,0 +1,106 @@
+"""
+Cancelling orchestrator streams nobody is reading.
+A chat stream can spend many seconds waiting on the orchestrator between
+writes; if the client leaves meanwhile, a server that only notices on the next
+write keeps vLLM generating and the detectors scoring for nobody. The response
+class here watches the ASGI receive channel for http.disconnect and cancels the
+body iterator the moment it arrives, whatever ASGI spec version the server
+reports (Starlette only does this itself below 2.4). Cancellation unwinds
+through process_chat into the upstream request, which closes the orchestrator
+stream. StreamCancellations counts those streams and what they had already
+pulled from upstream.
+"""
+
+import asyncio
+from typing import Callable
+
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+from starlette.types import Receive, Scope, Send
+
+from latency_histograms import UpstreamTimings
+from shared_counters import CounterSegment
+
+
+class DisconnectAwareStreamingResponse(StreamingResponse):
+    """StreamingResponse that cancels its body as soon as the client disconnects."""
+
+    def __init__(self, *args, on_disconnect: Callable[[], None] | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_disconnect = on_disconnect
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await super().__call__(scope, receive, send)
+            return
+
+        streamer = asyncio.create_task(self.stream_response(send))
+        watcher = asyncio.create_task(self.listen_for_disconnect(receive))
+        try:
+            await asyncio.wait({streamer, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            streamer.cancel()
+            watcher.cancel()
+            raise
+        watcher.cancel()
+        if not streamer.done():
+            # Disconnected - wait for the body to unwind so the upstream stream
+            # is closed before this request is considered finished
+            streamer.cancel()
+            if self.on_disconnect:
+                self.on_disconnect()
+            await asyncio.gather(streamer, return_exceptions=True)
+            return
+
+        try:
+            streamer.result()
+        except OSError:
+            if self.on_disconnect:
+                self.on_disconnect()
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+
+class StreamCancellations:
+    """Counters for client disconnects and the orchestrator streams cancelled because of them."""
+
+    DISCONNECTS, CANCELLED_WAITING, CANCELLED_STREAMING, BYTES, CHUNKS = range(5)
+
+    def __init__(self, segment: CounterSegment | None = None):
+        self._counters_block = (segment or CounterSegment()).allocate("q", 5)
+        self._counters = self._counters_block.local
+
+    def client_disconnected(self):
+        self._counters[self.DISCONNECTS] += 1
+
+    def record(self, timings: UpstreamTimings):
+        """An orchestrator stream cancelled before its final event."""
+        counters = self._counters
+        counters[self.CANCELLED_STREAMING if timings.first_content else self.CANCELLED_WAITING] += 1
+        counters[self.BYTES] += timings.bytes_received
+        counters[self.CHUNKS] += timings.content_chunks
+
+    def get_prometheus_metrics(self) -> str:
+        disconnects, waiting, streaming, abandoned_bytes, chunks = self._counters_block.totals()
+        lines = [
+            "# HELP guardrail_client_disconnects_total Streaming responses whose client disconnected before the end",
+            "# TYPE guardrail_client_disconnects_total counter",
+            f"guardrail_client_disconnects_total {disconnects}",
+            "",
+            "# HELP guardrail_upstream_cancelled_streams_total Orchestrator streams cancelled because nobody was "
+            "reading them (waiting = before the first content chunk)",
+            "# TYPE guardrail_upstream_cancelled_streams_total counter",
+            f'guardrail_upstream_cancelled_streams_total{{stage="waiting"}} {waiting}',
+            f'guardrail_upstream_cancelled_streams_total{{stage="streaming"}} {streaming}',
+            "",
+            "# HELP guardrail_upstream_cancelled_bytes_total Orchestrator bytes received by streams that were cancelled",
+            "# TYPE guardrail_upstream_cancelled_bytes_total counter",
+            f"guardrail_upstream_cancelled_bytes_total {abandoned_bytes}",
+            "",
+            "# HELP guardrail_upstream_cancelled_tokens_total Content chunks (about one token each) received by "
+            "streams that were cancelled",
+            "# TYPE guardrail_upstream_cancelled_tokens_total counter",
+            f"guardrail_upstream_cancelled_tokens_total {chunks}",
+        ]
+        return "\n".join(lines)
@@ -0,0 +1,152 @@
+"""
+Single-flight coalescing of identical in-flight chat streams.
+The first request for a key owns the upstream stream; identical requests that
+arrive while it is running subscribe to it instead of opening their own.
+"""
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Callable
+
+from shared_counters import CounterSegment
+
+logger = logging.getLogger(__name__)
+
+# Factory for the upstream stream: returns (event iterator, shared context)
+StreamFactory = Callable[[], tuple[AsyncIterator[dict], Any]]
+
+
+class _SharedStream:
+    """
+    One upstream stream fanned out to many subscribers.
+    Events go to an append-only log; each subscriber only holds a cursor into it,
+    so the producer never waits on a subscriber and a slow reader stalls nobody.
+    """
+
+    def __init__(self, events: AsyncIterator[dict], context: Any, max_events: int):
+        self.context = context
+        self.max_events = max_events
+        self.history: list[dict] = []
+        self.finished = False
+        self.error: BaseException | None = None
+        self.subscribers = 0
+        self._events = events
+        self._waiter = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def joinable(self) -> bool:
+        return not self.finished and len(self.history) < self.max_events
+
+    def start(self, on_finish: Callable[["_SharedStream"], None]):
+        self._task = asyncio.create_task(self._run())
+        self._task.add_done_callback(lambda _: on_finish(self))
+
+    def _publish(self):
+        waiter, self._waiter = self._waiter, asyncio.Event()
+        waiter.set()
+
+    async def _run(self):
+        try:
+            async for event in self._events:
+                self.history.append(event)
+                self._publish()
+                if self.subscribers == 0:
+                    # Every Subscription was dropped before it was iterated
+                    self.cancel()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self._publish()
+
+    def cancel(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    async def subscribe(self) -> AsyncIterator[dict]:
+        cursor = 0
+        # Counted here, paired with the finally, so a Subscription that is never iterated never counts
+        self.subscribers += 1
+        try:
+            while True:
+                if cursor < len(self.history):
+                    event = self.history[cursor]
+                    cursor += 1
+                    yield event
+                    continue
+                if self.finished:
+                    break
+                await self._waiter.wait()
+            if self.error:
+                raise self.error
+        finally:
+            self.subscribers -= 1
+            # Nobody left to read it - stop pulling tokens from upstream
+            if self.subscribers == 0 and not self.finished:
+                self.cancel()
+
+
+class Subscription:
+    """Handle returned by StreamCoalescer.subscribe; iterate it for events."""
+
+    def __init__(self, shared: _SharedStream, leader: bool):
+        self._shared = shared
+        self.leader = leader
+
+    @property
+    def context(self) -> Any:
+        return self._shared.context
+
+    def __aiter__(self) -> AsyncIterator[dict]:
+        return self._shared.subscribe()
+
+
+class StreamCoalescer:
+    """Registry of in-flight shared streams keyed by request identity."""
+
+    LEADERS, FOLLOWERS = range(2)
+
+    def __init__(self, max_events: int = 2048, segment: CounterSegment | None = None):
+        self.max_events = max_events
+        self._inflight: dict[str, _SharedStream] = {}
+        self._counters_block = (segment or CounterSegment()).allocate("q", 2)
+        self._counters = self._counters_block.local
+
+    def subscribe(self, key: str, factory: StreamFactory) -> Subscription:
+        shared = self._inflight.get(key)
+        if shared is not None and shared.joinable:
+            self._counters[self.FOLLOWERS] += 1
+            logger.debug(f"Coalescing request onto in-flight stream ({shared.subscribers} subscribers)")
+            return Subscription(shared, leader=False)
+
+        events, context = factory()
+        shared = _SharedStream(events, context, self.max_events)
+        self._inflight[key] = shared
+        shared.start(lambda s: self._finish(key, s))
+        self._counters[self.LEADERS] += 1
+        return Subscription(shared, leader=True)
+
+    def _finish(self, key: str, shared: _SharedStream):
+        # Only drop the entry if a newer stream has not replaced it
+        if self._inflight.get(key) is shared:
+            del self._inflight[key]
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def get_prometheus_metrics(self) -> str:
+        leaders, followers = self._counters_block.totals()
+        lines = [
+            "# HELP guardrail_coalesced_requests_total Chat requests by role in stream coalescing",
+            "# TYPE guardrail_coalesced_requests_total counter",
+            f'guardrail_coalesced_requests_total{{role="leader"}} {leaders}',
+            f'guardrail_coalesced_requests_total{{role="follower"}} {followers}',
+            "",
+            "# HELP guardrail_inflight_upstream_streams Shared upstream streams in the worker serving this scrape",
+            "# TYPE guardrail_inflight_upstream_streams gauge",
+            f"guardrail_inflight_upstream_streams {len(self._inflight)}",
+        ]
+        return "\n".join(lines)
@@ -0,0 +1,326 @@
+"""
+Per-request tracing with W3C trace context.
+Each chat request gets a trace: a root span plus child spans for the local
+pre-checks and every orchestrator attempt, with events for first byte, first
+content and block decisions. The upstream POST carries a `traceparent` header
+so orchestrator spans join the same trace.
+
+Sampling is decided once, at the head: an incoming traceparent's sampled flag
+is honoured, otherwise a new trace is sampled with probability `sample_ratio`.
+Unsampled traces still propagate ids but record nothing - every span call is
+a no-op. Finished spans are queued and exported in batches by a background
+task, as OTLP/HTTP JSON to a collector or appended to a file (one OTLP export
+request per line, the format the collector's otlpjsonfile receiver reads);
+encoding and file writes run in a worker thread.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+from collections import deque
+
+import aiohttp
+
+from shared_counters import CounterSegment
+
+logger = logging.getLogger(__name__)
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_INVALID_TRACE_ID = "0" * 32
+_INVALID_SPAN_ID = "0" * 16
+
+# OTLP span kinds
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+_STATUS_ERROR = 2
+
+
+def parse_traceparent(header: str | None) -> tuple[str, str, bool] | None:
+    """(trace_id, parent span_id, sampled) from a version 00 traceparent header, None if absent or invalid."""
+    if not header:
+        return None
+    match = _TRACEPARENT_RE.match(header.strip().lower())
+    if not match:
+        return None
+    trace_id, span_id, flags = match.groups()
+    if trace_id == _INVALID_TRACE_ID or span_id == _INVALID_SPAN_ID:
+        return None
+    return trace_id, span_id, bool(int(flags, 16) & 1)
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits) or 1:0{bits // 4}x}"
+
+
+class Span:
+    """A timed operation in a sampled trace. end() is idempotent; the first call hands the span to the tracer."""
+
+    __slots__ = ("trace", "name", "kind", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "events",
+                 "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: str | None, kind: int, attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.kind = kind
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.events: list[tuple[int, str, dict]] = []
+        self.error: str | None = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def event(self, name: str, **attributes):
+        self.events.append((time.time_ns(), name, attributes))
+
+    def fail(self, message: str):
+        self.error = message
+
+    def end(self, **attributes):
+        if self.end_ns:
+            return
+        self.attributes.update(attributes)
+        self.end_ns = time.time_ns()
+        self.trace.tracer.collect(self)
+
+
+class _NoopSpan:
+    """Stand-in for spans of unsampled traces: same interface, records nothing."""
+
+    __slots__ = ("trace",)
+
+    span_id = None
+
+    def __init__(self, trace: "Trace"):
+        self.trace = trace
+
+    def set(self, **attributes):
+        pass
+
+    def event(self, name: str, **attributes):
+        pass
+
+    def fail(self, message: str):
+        pass
+
+    def end(self, **attributes):
+        pass
+
+
+class Trace:
+    """Ids and sampling decision for one request; trace_id is None when tracing is off and nothing came in."""
+
+    __slots__ = ("tracer", "trace_id", "parent_id", "sampled", "_noop")
+
+    def __init__(self, tracer: "Tracer", trace_id: str | None, parent_id: str | None, sampled: bool):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self._noop = _NoopSpan(self)
+
+    def span(self, name: str, parent: Span | _NoopSpan | None = None, kind: int = KIND_INTERNAL,
+             **attributes) -> Span | _NoopSpan:
+        """Start a span; without `parent` it is the local root, a child of the incoming traceparent if any."""
+        if not self.sampled:
+            return self._noop
+        return Span(self, name, parent.span_id if parent is not None else self.parent_id, kind, attributes)
+
+    def traceparent(self, span: Span | _NoopSpan) -> str | None:
+        """Header value for an outgoing request made inside `span`."""
+        if self.trace_id is None:
+            return None
+        if self.sampled:
+            return f"00-{self.trace_id}-{span.span_id}-01"
+        # Not recording locally: downstream still gets a consistent trace, marked unsampled
+        return f"00-{self.trace_id}-{_new_id(64)}-00"
+
+
+# =============================================================================
+# OTLP JSON encoding and exporters
+# =============================================================================
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        encoded = {"boolValue": value}
+    elif isinstance(value, int):
+        encoded = {"intValue": str(value)}
+    elif isinstance(value, float):
+        encoded = {"doubleValue": value}
+    else:
+        encoded = {"stringValue": str(value)}
+    return {"key": key, "value": encoded}
+
+
+def _encode_span(span: Span) -> dict:
+    encoded = {
+        "traceId": span.trace.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [_attribute(k, v) for k, v in span.attributes.items() if v is not None],
+    }
+    if span.parent_id:
+        encoded["parentSpanId"] = span.parent_id
+    if span.events:
+        encoded["events"] = [
+            {"timeUnixNano": str(t), "name": name, "attributes": [_attribute(k, v) for k, v in attrs.items()]}
+            for t, name, attrs in span.events
+        ]
+    if span.error is not None:
+        encoded["status"] = {"code": _STATUS_ERROR, "message": span.error}
+    return encoded
+
+
+def encode_spans(spans: list[Span], service_name: str) -> bytes:
+    """An OTLP ExportTraceServiceRequest in the protobuf JSON mapping."""
+    request = {
+        "resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", service_name)]},
+            "scopeSpans": [{"scope": {"name": "lemonade-stand-app"}, "spans": [_encode_span(s) for s in spans]}],
+        }]
+    }
+    return json.dumps(request, separators=(",", ":")).encode()
+
+
+class SpanExporter:
+    """Sends one encoded batch; raise on failure."""
+
+    async def export(self, payload: bytes):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class FileSpanExporter(SpanExporter):
+    def __init__(self, path: str):
+        self.path = path
+
+    def _append(self, payload: bytes):
+        with open(self.path, "ab") as f:
+            f.write(payload + b"\n")
+
+    async def export(self, payload: bytes):
+        await asyncio.to_thread(self._append, payload)
+
+
+class OtlpHttpSpanExporter(SpanExporter):
+    """POSTs to <endpoint>/v1/traces on an OTLP/HTTP collector (port 4318 by convention)."""
+
+    def __init__(self, endpoint: str, timeout: float = 10.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.timeout = timeout
+        self.session: aiohttp.ClientSession | None = None
+
+    async def export(self, payload: bytes):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        async with self.session.post(
+            self.url, data=payload, headers={"Content-Type": "application/json"}
+        ) as response:
+            if response.status >= 300:
+                raise RuntimeError(f"collector returned {response.status}")
+            await response.read()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+# =============================================================================
+# Tracer
+# =============================================================================
+
+class Tracer:
+    """
+    Starts traces and batches finished spans for export. The exporter is set
+    per worker process (in lifespan); without one, traces are only propagated
+    from incoming headers and nothing is recorded.
+    """
+
+    SAMPLED, UNSAMPLED, EXPORTED, DROPPED, FAILED = range(5)
+
+    def __init__(self, service_name: str, sample_ratio: float = 0.01, batch_size: int = 512,
+                 flush_interval: float = 5.0, max_queue: int = 20000, segment: CounterSegment | None = None):
+        self.service_name = service_name
+        self.sample_ratio = sample_ratio
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.exporter: SpanExporter | None = None
+        self.pending: deque[Span] = deque()
+        self._batch_ready = asyncio.Event()
+        self._counters_block = (segment or CounterSegment()).allocate("q", 5)
+        self._counters = self._counters_block.local
+
+    def start_trace(self, traceparent: str | None = None) -> Trace:
+        incoming = parse_traceparent(traceparent)
+        if self.exporter is None:
+            if incoming is None:
+                return Trace(self, None, None, False)
+            return Trace(self, incoming[0], incoming[1], False)
+        if incoming is not None:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id, parent_id, sampled = _new_id(128), None, random.random() < self.sample_ratio
+        self._counters[self.SAMPLED if sampled else self.UNSAMPLED] += 1
+        return Trace(self, trace_id, parent_id, sampled)
+
+    def collect(self, span: Span):
+        if len(self.pending) >= self.max_queue:
+            self._counters[self.DROPPED] += 1
+            return
+        self.pending.append(span)
+        if len(self.pending) >= self.batch_size:
+            self._batch_ready.set()
+
+    async def flush(self):
+        while self.pending and self.exporter is not None:
+            batch = [self.pending.popleft() for _ in range(min(self.batch_size, len(self.pending)))]
+            try:
+                payload = await asyncio.to_thread(encode_spans, batch, self.service_name)
+                await self.exporter.export(payload)
+                self._counters[self.EXPORTED] += len(batch)
+            except Exception as e:
+                self._counters[self.FAILED] += len(batch)
+                logger.warning(f"Span export failed ({len(batch)} spans): {e}")
+                return
+
+    async def run_export(self):
+        """Background task: export whenever a batch fills up or flush_interval passes."""
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            await self.flush()
+
+    async def close(self):
+        await self.flush()
+        if self.exporter is not None:
+            await self.exporter.close()
+
+    def get_prometheus_metrics(self) -> str:
+        sampled, unsampled, exported, dropped, failed = self._counters_block.totals()
+        lines = [
+            "# HELP guardrail_traces_started_total Request traces by head sampling decision",
+            "# TYPE guardrail_traces_started_total counter",
+            f'guardrail_traces_started_total{{sampled="true"}} {sampled}',
+            f'guardrail_traces_started_total{{sampled="false"}} {unsampled}',
+            "",
+            "# HELP guardrail_trace_spans_total Finished spans by export result",
+            "# TYPE guardrail_trace_spans_total counter",
+            f'guardrail_trace_spans_total{{result="exported"}} {exported}',
+            f'guardrail_trace_spans_total{{result="dropped"}} {dropped}',
+            f'guardrail_trace_spans_total{{result="failed"}} {failed}',
+        ]
+        return "\n".join(lines)
@@ -0,0 +1,263 @@
+"""
+Client-side load balancing across orchestrator replicas.
+Resolves every endpoint behind a headless service (or a static host:port
+list), keeps a connection pool per endpoint, and picks the endpoint with the
+fewest outstanding streams weighted by its EWMA time to first byte. Endpoints
+that keep failing or answering slowly are ejected for a while.
+"""
+
+import asyncio
+import logging
+import random
+import socket
+import time
+from typing import Callable
+from urllib.parse import urlsplit
+
+from shared_counters import CounterSegment
+from upstream_transport import UpstreamTransport
+
+logger = logging.getLogger(__name__)
+
+
+def parse_targets(spec: str, default_port: int) -> list[tuple[str, int]]:
+    """'svc-headless:8032,localhost:9101' -> [(host, port), ...]"""
+    targets = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, sep, port = item.rpartition(":")
+        if not sep or not port.isdigit():
+            host, port = item, str(default_port)
+        targets.append((host.strip("[]"), int(port)))
+    return targets
+
+
+class Endpoint:
+    """One orchestrator replica and its connection pool."""
+
+    __slots__ = (
+        "address", "port", "url", "transport", "outstanding", "ewma_ttfb",
+        "consecutive_failures", "ejections", "ejected_until", "removed",
+    )
+
+    def __init__(self, address: str, port: int, url: str, transport: UpstreamTransport, initial_ttfb: float):
+        self.address = address
+        self.port = port
+        self.url = url
+        self.transport = transport
+        self.outstanding = 0
+        self.ewma_ttfb = initial_ttfb
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.removed = False
+
+    @property
+    def name(self) -> str:
+        return f"{self.address}:{self.port}"
+
+    def score(self) -> float:
+        return (self.outstanding + 1) * self.ewma_ttfb
+
+
+class UpstreamPool:
+    """
+    Endpoint set for the orchestrator, refreshed from DNS.
+
+    Call `pick()` before each attempt and `release()` after it, and report
+    `record_ttfb()` / `record_failure()` in between. Ejection doubles on each
+    repeat offence up to `max_ejection` and resets after a healthy response; when every endpoint is ejected the
+    least-loaded one is used anyway rather than failing the request.
+    Counters are shared across workers; endpoint gauges describe the worker
+    serving the scrape.
+    """
+
+    PICKS, FAILURES, EJECTIONS, REFRESHES, REFRESH_ERRORS, ALL_EJECTED = range(6)
+
+    def __init__(
+        self,
+        targets: list[tuple[str, int]],
+        api_url: str,
+        transport_factory: Callable[[], UpstreamTransport],
+        refresh_interval: float = 30.0,
+        slow_ttfb: float = 10.0,
+        eject_after: int = 3,
+        base_ejection: float = 10.0,
+        max_ejection: float = 120.0,
+        ewma_alpha: float = 0.3,
+        segment: CounterSegment | None = None,
+    ):
+        parts = urlsplit(api_url)
+        self._scheme = parts.scheme
+        self._path = parts.path
+        self.targets = targets
+        self.transport_factory = transport_factory
+        self.refresh_interval = refresh_interval
+        self.slow_ttfb = slow_ttfb
+        self.eject_after = eject_after
+        self.base_ejection = base_ejection
+        self.max_ejection = max_ejection
+        self.ewma_alpha = ewma_alpha
+        self.endpoints: dict[tuple[str, int], Endpoint] = {}
+        self._counters_block = (segment or CounterSegment()).allocate("q", 6)
+        self._counters = self._counters_block.local
+
+    # -------------------------------------------------------------------------
+    # Endpoint discovery
+    # -------------------------------------------------------------------------
+
+    async def resolve(self) -> set[tuple[str, int]]:
+        loop = asyncio.get_running_loop()
+        addresses = set()
+        for host, port in self.targets:
+            infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            for _, _, _, _, sockaddr in infos:
+                addresses.add((sockaddr[0], port))
+        return addresses
+
+    async def refresh(self):
+        try:
+            addresses = await self.resolve()
+        except OSError as e:
+            # Keep the current endpoints; a DNS blip must not empty the pool
+            self._counters[self.REFRESH_ERRORS] += 1
+            logger.warning(f"Upstream pool DNS refresh failed: {e}")
+            return
+        if not addresses:
+            self._counters[self.REFRESH_ERRORS] += 1
+            logger.warning("Upstream pool DNS refresh returned no endpoints, keeping the current set")
+            return
+        self._counters[self.REFRESHES] += 1
+
+        initial_ttfb = self._typical_ttfb()
+        for address, port in addresses - self.endpoints.keys():
+            host = f"[{address}]" if ":" in address else address
+            url = f"{self._scheme}://{host}:{port}{self._path}"
+            self.endpoints[(address, port)] = Endpoint(address, port, url, self.transport_factory(), initial_ttfb)
+            logger.info(f"Upstream endpoint added: {address}:{port}")
+        for key in self.endpoints.keys() - addresses:
+            endpoint = self.endpoints.pop(key)
+            endpoint.removed = True
+            logger.info(f"Upstream endpoint removed: {endpoint.name}")
+            if not endpoint.outstanding:
+                await endpoint.transport.close()
+
+    async def run_refresh(self):
+        """Background task: re-resolve the targets every refresh_interval seconds."""
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.refresh()
+
+    def _typical_ttfb(self) -> float:
+        # New endpoints start at the median so they neither flood nor starve
+        values = sorted(e.ewma_ttfb for e in self.endpoints.values())
+        return values[len(values) // 2] if values else 0.1
+
+    # -------------------------------------------------------------------------
+    # Request path
+    # -------------------------------------------------------------------------
+
+    def pick(self) -> Endpoint:
+        if not self.endpoints:
+            raise RuntimeError("Upstream pool has no endpoints")
+        now = time.monotonic()
+        endpoints = list(self.endpoints.values())
+        # Random rotation so ties do not all land on the first endpoint
+        start = random.randrange(len(endpoints))
+        best = None
+        best_score = 0.0
+        for endpoint in endpoints[start:] + endpoints[:start]:
+            if endpoint.ejected_until > now:
+                continue
+            score = endpoint.score()
+            if best is None or score < best_score:
+                best, best_score = endpoint, score
+        if best is None:
+            self._counters[self.ALL_EJECTED] += 1
+            best = min(endpoints, key=Endpoint.score)
+        best.outstanding += 1
+        self._counters[self.PICKS] += 1
+        return best
+
+    def record_ttfb(self, endpoint: Endpoint, ttfb: float):
+        endpoint.ewma_ttfb += self.ewma_alpha * (ttfb - endpoint.ewma_ttfb)
+        if ttfb > self.slow_ttfb:
+            self.record_failure(endpoint)
+        else:
+            endpoint.consecutive_failures = 0
+            endpoint.ejections = 0
+
+    def record_failure(self, endpoint: Endpoint):
+        self._counters[self.FAILURES] += 1
+        now = time.monotonic()
+        if endpoint.ejected_until > now:
+            # Streams picked before the ejection are still failing; don't extend it
+            return
+        endpoint.consecutive_failures += 1
+        if endpoint.consecutive_failures < self.eject_after:
+            return
+        duration = min(self.max_ejection, self.base_ejection * 2 ** endpoint.ejections)
+        endpoint.ejections += 1
+        # Half-open when the ejection ends: one more failure ejects it again
+        endpoint.consecutive_failures = self.eject_after - 1
+        endpoint.ejected_until = now + duration
+        self._counters[self.EJECTIONS] += 1
+        logger.warning(f"Upstream endpoint {endpoint.name} ejected for {duration:.0f}s")
+
+    def release(self, endpoint: Endpoint):
+        endpoint.outstanding -= 1
+        if endpoint.removed and not endpoint.outstanding:
+            asyncio.get_running_loop().create_task(endpoint.transport.close())
+
+    async def close(self):
+        for endpoint in self.endpoints.values():
+            await endpoint.transport.close()
+        self.endpoints.clear()
+
+    # -------------------------------------------------------------------------
+    # Exposition
+    # -------------------------------------------------------------------------
+
+    def get_prometheus_metrics(self) -> str:
+        picks, failures, ejections, refreshes, refresh_errors, all_ejected = self._counters_block.totals()
+        now = time.monotonic()
+        endpoints = sorted(self.endpoints.values(), key=lambda e: e.name)
+        healthy = sum(1 for e in endpoints if e.ejected_until <= now)
+        lines = [
+            "# HELP guardrail_upstream_picks_total Orchestrator attempts routed by the upstream pool",
+            "# TYPE guardrail_upstream_picks_total counter",
+            f"guardrail_upstream_picks_total {picks}",
+            "",
+            "# HELP guardrail_upstream_failures_total Failed or slow orchestrator attempts seen by the upstream pool",
+            "# TYPE guardrail_upstream_failures_total counter",
+            f"guardrail_upstream_failures_total {failures}",
+            "",
+            "# HELP guardrail_upstream_ejections_total Orchestrator endpoints ejected by the circuit breaker",
+            "# TYPE guardrail_upstream_ejections_total counter",
+            f"guardrail_upstream_ejections_total {ejections}",
+            "",
+            "# HELP guardrail_upstream_all_ejected_total Picks made while every endpoint was ejected",
+            "# TYPE guardrail_upstream_all_ejected_total counter",
+            f"guardrail_upstream_all_ejected_total {all_ejected}",
+            "",
+            "# HELP guardrail_upstream_dns_refreshes_total Upstream pool DNS refreshes by result",
+            "# TYPE guardrail_upstream_dns_refreshes_total counter",
+            f'guardrail_upstream_dns_refreshes_total{{result="ok"}} {refreshes}',
+            f'guardrail_upstream_dns_refreshes_total{{result="error"}} {refresh_errors}',
+            "",
+            "# HELP guardrail_upstream_endpoints Orchestrator endpoints known to the worker serving this scrape",
+            "# TYPE guardrail_upstream_endpoints gauge",
+            f'guardrail_upstream_endpoints{{state="healthy"}} {healthy}',
+            f'guardrail_upstream_endpoints{{state="ejected"}} {len(endpoints) - healthy}',
+            "",
+            "# HELP guardrail_upstream_endpoint_outstanding Streams in flight per endpoint in the worker serving this scrape",
+            "# TYPE guardrail_upstream_endpoint_outstanding gauge",
+            *[f'guardrail_upstream_endpoint_outstanding{{endpoint="{e.name}"}} {e.outstanding}' for e in endpoints],
+            "",
+            "# HELP guardrail_upstream_endpoint_ttfb_seconds EWMA time to first byte per endpoint",
+            "# TYPE guardrail_upstream_endpoint_ttfb_seconds gauge",
+            *[f'guardrail_upstream_endpoint_ttfb_seconds{{endpoint="{e.name}"}} {e.ewma_ttfb:.4f}' for e in endpoints],
+        ]
+        return "\n".join(lines)
@@ -0,0 +1,414 @@
+"""
+HTTP transports for orchestrator streams.
+
+The chat pipeline only needs "POST these bytes, give me a status and a body
+to read chunk by chunk", so that is the whole interface. AiohttpTransport
+(HTTP/1.1, one connection per in-flight stream) is the default;
+Http2Transport multiplexes many streams over a few HTTP/2 connections and
+needs the optional httpx[http2] dependency.
+
+Transports raise UpstreamConnectionError for connection/protocol failures
+and asyncio.TimeoutError for timeouts, whatever the underlying library.
+`warm()` opens pooled connections ahead of traffic so the first streams after
+startup do not pay for TCP and TLS setup.
+"""
+
+import asyncio
+import logging
+import ssl
+import time
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import aiohttp
+
+from latency_histograms import UpstreamTimings
+from shared_counters import CounterSegment
+
+# Matches the timeouts the orchestrator session has always used
+TOTAL_TIMEOUT = 120
+CONNECT_TIMEOUT = 5    # 5s to establish connection (internal is fast)
+READ_TIMEOUT = 60      # 60s between chunks (for slow LLM)
+WARM_TIMEOUT = 10      # one warm-up request, connect included
+
+# httpx closes idle connections after this many seconds
+HTTP2_KEEPALIVE_EXPIRY = 5.0
+
+
+class UpstreamConnectionError(Exception):
+    """The orchestrator could not be reached or the connection broke."""
+
+
+class SessionReuseSSLContext(ssl.SSLContext):
+    """
+    Client SSLContext that resumes TLS sessions on reconnects.
+    asyncio (and so aiohttp and httpx) never hands a session to wrap_bio, so
+    every new connection pays a full handshake. The last connection per server
+    name is kept, and its session - including a TLS 1.3 ticket received after
+    the handshake - is offered to the next one.
+    """
+
+    def __init__(self, protocol: int):
+        self._last_connection: dict[str | None, ssl.SSLObject] = {}
+        self._sessions: dict[str | None, ssl.SSLSession] = {}
+        self._resumed_seen = 0
+
+    def _session_for(self, server_hostname: str | None) -> ssl.SSLSession | None:
+        last = self._last_connection.get(server_hostname)
+        if last is not None:
+            try:
+                session = last.session
+            except ValueError:
+                # Handshake still in progress (concurrent connects); keep the previous session
+                session = None
+            if session is not None:
+                self._sessions[server_hostname] = session
+        return self._sessions.get(server_hostname)
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        if session is None and not server_side:
+            session = self._session_for(server_hostname)
+        ssl_object = super().wrap_bio(
+            incoming, outgoing, server_side=server_side, server_hostname=server_hostname, session=session
+        )
+        if not server_side:
+            self._last_connection[server_hostname] = ssl_object
+        return ssl_object
+
+    def take_resumed(self) -> int:
+        """Handshakes that resumed a session since the last call."""
+        resumed = self.session_stats()["hits"]
+        new, self._resumed_seen = resumed - self._resumed_seen, resumed
+        return new
+
+
+class TransportStats:
+    """Connection, TLS handshake and warm-up counters for all transports in the process."""
+
+    CONNECTIONS, HANDSHAKES, RESUMED, WARM_OK, WARM_FAILED = range(5)
+
+    def __init__(self, transport: str, segment: CounterSegment | None = None):
+        self.transport = transport
+        self._counters_block = (segment or CounterSegment()).allocate("q", 5)
+        self._counters = self._counters_block.local
+
+    def connection_opened(self):
+        self._counters[self.CONNECTIONS] += 1
+
+    def handshake_completed(self, ssl_context: ssl.SSLContext | None = None):
+        self._counters[self.HANDSHAKES] += 1
+        if isinstance(ssl_context, SessionReuseSSLContext):
+            self._counters[self.RESUMED] += ssl_context.take_resumed()
+
+    def warm_result(self, ok: int, failed: int):
+        self._counters[self.WARM_OK] += ok
+        self._counters[self.WARM_FAILED] += failed
+
+    @property
+    def connections(self) -> int:
+        return self._counters[self.CONNECTIONS]
+
+    @property
+    def handshakes(self) -> int:
+        return self._counters[self.HANDSHAKES]
+
+    def get_prometheus_metrics(self) -> str:
+        connections, handshakes, resumed, warm_ok, warm_failed = self._counters_block.totals()
+        label = f'{{transport="{self.transport}"}}'
+        lines = [
+            "# HELP guardrail_upstream_connections_opened_total Orchestrator connections opened",
+            "# TYPE guardrail_upstream_connections_opened_total counter",
+            f"guardrail_upstream_connections_opened_total{label} {connections}",
+            "",
+            "# HELP guardrail_upstream_tls_handshakes_total TLS handshakes with the orchestrator",
+            "# TYPE guardrail_upstream_tls_handshakes_total counter",
+            f"guardrail_upstream_tls_handshakes_total{label} {handshakes}",
+            "",
+            "# HELP guardrail_upstream_tls_resumed_total TLS handshakes that resumed an earlier session",
+            "# TYPE guardrail_upstream_tls_resumed_total counter",
+            f"guardrail_upstream_tls_resumed_total{label} {resumed}",
+            "",
+            "# HELP guardrail_upstream_warm_requests_total Connection warm-up requests by result",
+            "# TYPE guardrail_upstream_warm_requests_total counter",
+            f'guardrail_upstream_warm_requests_total{{transport="{self.transport}",result="ok"}} {warm_ok}',
+            f'guardrail_upstream_warm_requests_total{{transport="{self.transport}",result="failed"}} {warm_failed}',
+        ]
+        return "\n".join(lines)
+
+
+class UpstreamResponse(ABC):
+    """Status plus a chunked body; `read_chunk()` returns b"" at the end of the stream."""
+
+    status: int
+
+    @abstractmethod
+    async def text(self) -> str:
+        ...
+
+    @abstractmethod
+    async def read_chunk(self) -> bytes:
+        ...
+
+
+class UpstreamTransport(ABC):
+    """
+    Interface: `post()` is an async context manager yielding an UpstreamResponse.
+    `in_flight` counts open streams; `keepalive_timeout` is how long an idle
+    pooled connection survives.
+    """
+
+    name = ""
+    in_flight = 0
+    keepalive_timeout = 0.0
+
+    @abstractmethod
+    def post(
+        self, url: str, body: bytes, headers: dict, timings: UpstreamTimings | None = None
+    ) -> "AsyncIterator[UpstreamResponse]":
+        ...
+
+    @abstractmethod
+    async def warm(self, url: str, count: int) -> int:
+        """
+        Open or refresh `count` pooled connections with concurrent GETs to `url`.
+        Returns how many got an HTTP response - any status proves the TCP, TLS
+        and HTTP layers work.
+        """
+
+    @abstractmethod
+    async def close(self):
+        ...
+
+
+# =============================================================================
+# aiohttp (HTTP/1.1)
+# =============================================================================
+
+class _AiohttpResponse(UpstreamResponse):
+    __slots__ = ("status", "_response", "read_chunk")
+
+    def __init__(self, response: aiohttp.ClientResponse):
+        self.status = response.status
+        self._response = response
+        # Bound directly - no wrapper call per chunk
+        self.read_chunk = response.content.readany
+
+    async def text(self) -> str:
+        return await self._response.text()
+
+
+class AiohttpTransport(UpstreamTransport):
+    """HTTP/1.1 over a pooled aiohttp TCPConnector: one connection per in-flight stream."""
+
+    name = "aiohttp"
+
+    def __init__(
+        self,
+        ssl_context: ssl.SSLContext,
+        stats: TransportStats,
+        limit: int = 200,
+        limit_per_host: int = 100,
+        keepalive_timeout: float = 30,
+    ):
+        self.stats = stats
+        self.ssl_context = ssl_context
+        self.in_flight = 0
+        self.keepalive_timeout = keepalive_timeout
+        connector = aiohttp.TCPConnector(
+            limit=limit,
+            limit_per_host=limit_per_host,
+            ssl=ssl_context,
+            keepalive_timeout=keepalive_timeout,
+            enable_cleanup_closed=True,
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            trace_configs=[self._trace_config()],
+            timeout=aiohttp.ClientTimeout(
+                total=TOTAL_TIMEOUT, sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT,
+            ),
+        )
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        """Record when each upstream request gets its pool connection (new or reused)."""
+        stats = self.stats
+        ssl_context = self.ssl_context
+
+        async def on_connection_created(session, trace_config_ctx, params):
+            stats.connection_opened()
+            # aiohttp does the TLS handshake as part of creating an https connection
+            if trace_config_ctx.trace_request_ctx is not None and trace_config_ctx.trace_request_ctx.https:
+                stats.handshake_completed(ssl_context)
+            await on_connection_acquired(session, trace_config_ctx, params)
+
+        async def on_connection_acquired(session, trace_config_ctx, params):
+            ctx = trace_config_ctx.trace_request_ctx
+            if ctx is not None and ctx.timings is not None:
+                ctx.timings.connection_acquired = time.perf_counter()
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(on_connection_created)
+        trace_config.on_connection_reuseconn.append(on_connection_acquired)
+        return trace_config
+
+    @asynccontextmanager
+    async def post(self, url: str, body: bytes, headers: dict, timings: UpstreamTimings | None = None):
+        ctx = _TraceContext(timings, url.startswith("https:"))
+        self.in_flight += 1
+        try:
+            async with self.session.post(url, data=body, headers=headers, trace_request_ctx=ctx) as response:
+                yield _AiohttpResponse(response)
+        except aiohttp.ClientError as e:
+            raise UpstreamConnectionError(str(e)) from e
+        finally:
+            self.in_flight -= 1
+
+    async def warm(self, url: str, count: int) -> int:
+        timeout = aiohttp.ClientTimeout(total=WARM_TIMEOUT)
+
+        async def probe() -> bool:
+            ctx = _TraceContext(None, url.startswith("https:"))
+            try:
+                async with self.session.get(url, timeout=timeout, trace_request_ctx=ctx) as response:
+                    # Reading the body returns the connection to the pool
+                    await response.read()
+                return True
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return False
+
+        # Concurrent, so each probe holds a different connection
+        ok = sum(await asyncio.gather(*(probe() for _ in range(count))))
+        self.stats.warm_result(ok, count - ok)
+        return ok
+
+    async def close(self):
+        await self.session.close()
+
+
+class _TraceContext:
+    __slots__ = ("timings", "https")
+
+    def __init__(self, timings: UpstreamTimings | None, https: bool):
+        self.timings = timings
+        self.https = https
+
+
+# =============================================================================
+# HTTP/2 (httpx)
+# =============================================================================
+
+class _Http2Response(UpstreamResponse):
+    __slots__ = ("status", "_response", "_chunks")
+
+    def __init__(self, response):
+        self.status = response.status_code
+        self._response = response
+        # Decoded like aiohttp's reads, in case the orchestrator or a proxy compresses the stream
+        self._chunks = response.aiter_bytes()
+
+    async def text(self) -> str:
+        await self._response.aread()
+        return self._response.text
+
+    async def read_chunk(self) -> bytes:
+        return await anext(self._chunks, b"")
+
+
+class Http2Transport(UpstreamTransport):
+    """
+    HTTP/2 via httpx: concurrent streams are multiplexed over `max_connections`
+    connections, so a burst costs a few handshakes instead of one per stream.
+    httpx puts every stream on a single connection until the server's
+    max-concurrent-streams limit queues them, so each connection gets its own
+    client and streams go to the one with the fewest in flight.
+    """
+
+    name = "http2"
+
+    def __init__(self, ssl_context: ssl.SSLContext, stats: TransportStats, max_connections: int = 8):
+        try:
+            import httpx
+        except ImportError as e:
+            raise RuntimeError("UPSTREAM_TRANSPORT=http2 needs httpx[http2] installed") from e
+        self._httpx = httpx
+        self.stats = stats
+        self.ssl_context = ssl_context
+        self.keepalive_timeout = HTTP2_KEEPALIVE_EXPIRY
+        # httpx logs every request at INFO
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        self.clients = [
+            httpx.AsyncClient(
+                http1=False,
+                http2=True,
+                verify=ssl_context,
+                limits=httpx.Limits(
+                    max_connections=1, max_keepalive_connections=1, keepalive_expiry=HTTP2_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(TOTAL_TIMEOUT, connect=CONNECT_TIMEOUT, read=READ_TIMEOUT),
+            )
+            for _ in range(max(1, max_connections))
+        ]
+        self._outstanding = [0] * len(self.clients)
+
+    def _trace(self, timings: UpstreamTimings | None):
+        stats = self.stats
+        ssl_context = self.ssl_context
+
+        async def trace(event: str, info: dict):
+            if event == "connection.connect_tcp.complete":
+                stats.connection_opened()
+            elif event == "connection.start_tls.complete":
+                stats.handshake_completed(ssl_context)
+            elif event == "http2.send_request_headers.started" and timings is not None:
+                timings.connection_acquired = time.perf_counter()
+
+        return trace
+
+    @asynccontextmanager
+    async def post(self, url: str, body: bytes, headers: dict, timings: UpstreamTimings | None = None):
+        httpx = self._httpx
+        outstanding = self._outstanding
+        index = outstanding.index(min(outstanding))
+        client = self.clients[index]
+        request = client.build_request(
+            "POST", url, content=body, headers=headers, extensions={"trace": self._trace(timings)}
+        )
+        outstanding[index] += 1
+        try:
+            response = await client.send(request, stream=True)
+            try:
+                yield _Http2Response(response)
+            finally:
+                await response.aclose()
+        except httpx.TimeoutException as e:
+            raise asyncio.TimeoutError(str(e)) from e
+        except httpx.TransportError as e:
+            raise UpstreamConnectionError(str(e)) from e
+        finally:
+            outstanding[index] -= 1
+
+    @property
+    def in_flight(self) -> int:
+        return sum(self._outstanding)
+
+    async def warm(self, url: str, count: int) -> int:
+        httpx = self._httpx
+        # One request per client opens its connection; streams share it after that
+        clients = self.clients[:count]
+
+        async def probe(client) -> bool:
+            try:
+                response = await client.get(url, timeout=WARM_TIMEOUT, extensions={"trace": self._trace(None)})
+                await response.aclose()
+                return True
+            except httpx.HTTPError:
+                return False
+
+        ok = sum(await asyncio.gather(*(probe(client) for client in clients)))
+        self.stats.warm_result(ok, len(clients) - ok)
+        return ok
+
+    async def close(self):
+        for client in self.clients:
+            await client.aclose()
@@ -0,0 +1,206 @@
+"""
+Chat over one WebSocket per client, with prompts multiplexed by request id.
+The client sends {"id": ..., "message": ...} (and {"type": "cancel", "id": ...}
+to abandon one); every event the chat pipeline produces comes back as one text
+message, the same chunk/error/done events /api/chat streams plus that "id".
+Chunks are merged by the frame batcher exactly as for SSE. Every prompt ends
+with exactly one final message: done, error (also when the pipeline raises) or
+cancelled.
+
+Backpressure is per connection: at most `max_inflight` prompts run at once.
+One more prompt is held until a slot frees, and any beyond that is rejected
+with an error event. The socket keeps being read either way, so cancels and
+disconnects are seen at any time. Outgoing messages go through a bounded
+queue, so a slow reader pauses its own upstream streams. A client that cannot
+take a message within `send_timeout` is disconnected.
+"""
+
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Callable
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from frame_batcher import FrameBatcher
+from shared_counters import CounterSegment
+
+logger = logging.getLogger(__name__)
+
+# (message, request fields) -> chat events
+ChatRunner = Callable[[str, dict], AsyncIterator[dict]]
+
+FINAL_EVENTS = ("done", "error")
+
+# Close code for clients that stop reading (RFC 6455 1008: policy violation)
+SLOW_CLIENT_CLOSE_CODE = 1008
+
+
+class WebSocketChat:
+    """Serves /ws/chat connections; counters are shared across workers."""
+
+    OPENED, CLOSED, PROMPTS, MESSAGES, INFLIGHT_WAITS, SEND_WAITS, SLOW_CLOSES, REJECTED = range(8)
+
+    def __init__(self, batcher: FrameBatcher, max_inflight: int = 8, send_queue: int = 256,
+                 send_timeout: float = 30.0, segment: CounterSegment | None = None):
+        self.batcher = batcher
+        self.max_inflight = max_inflight
+        self.send_queue = send_queue
+        self.send_timeout = send_timeout
+        segment = segment or CounterSegment()
+        self._counters_block = segment.allocate("q", 8)
+        self._counters = self._counters_block.local
+        self._active_block = segment.allocate("q", 1, gauge=True)
+        self._active = self._active_block.local
+
+    async def serve(self, websocket: WebSocket, run_chat: ChatRunner):
+        await websocket.accept()
+        counters = self._counters
+        counters[self.OPENED] += 1
+        self._active[0] += 1
+        outbox: asyncio.Queue[str] = asyncio.Queue(self.send_queue)
+        prompts: dict = {}
+        # Prompts whose final event (done/error/cancelled) has been queued
+        ended: set = set()
+        # (request id, message, request) waiting for a free slot
+        held = None
+        closing = False
+
+        async def send(message: dict):
+            if outbox.full():
+                counters[self.SEND_WAITS] += 1
+            await outbox.put(json.dumps(message))
+
+        async def run_prompt(request_id, message: str, request: dict):
+            try:
+                async for batch in self.batcher.batches(run_chat(message, request)):
+                    for event in batch:
+                        await send({"id": request_id, **event})
+                        if event.get("type") in FINAL_EVENTS:
+                            ended.add(request_id)
+            except Exception as e:
+                logger.warning(f"WebSocket chat prompt {request_id!r} failed: {e!r}")
+                if request_id not in ended:
+                    await send({"id": request_id, "type": "error", "message": f"Error: {e}"})
+                    ended.add(request_id)
+
+        def start(request_id, message: str, request: dict):
+            counters[self.PROMPTS] += 1
+            task = asyncio.create_task(run_prompt(request_id, message, request))
+            task.add_done_callback(lambda _, request_id=request_id: finished(request_id))
+            prompts[request_id] = task
+
+        def finished(request_id):
+            # A done callback rather than a finally: a prompt cancelled before it starts never runs its body
+            nonlocal held
+            prompts.pop(request_id, None)
+            ended.discard(request_id)
+            if held is not None and not closing:
+                start(*held)
+                held = None
+
+        async def write():
+            while True:
+                text = await outbox.get()
+                try:
+                    await asyncio.wait_for(websocket.send_text(text), self.send_timeout)
+                except asyncio.TimeoutError:
+                    counters[self.SLOW_CLOSES] += 1
+                    await websocket.close(SLOW_CLIENT_CLOSE_CODE, "client not reading")
+                    return
+                counters[self.MESSAGES] += 1
+
+        async def read():
+            nonlocal held
+            while True:
+                try:
+                    request = json.loads(await websocket.receive_text())
+                    if not isinstance(request, dict):
+                        raise ValueError("expected a JSON object")
+                except ValueError as e:
+                    await send({"type": "error", "message": f"Invalid request: {e}"})
+                    continue
+
+                request_id = request.get("id")
+                valid_id = isinstance(request_id, (str, int))
+                if request.get("type") == "cancel":
+                    if valid_id and held is not None and held[0] == request_id:
+                        held = None
+                        await send({"id": request_id, "type": "cancelled"})
+                    elif valid_id and request_id in prompts and request_id not in ended:
+                        # A cancelled task queues nothing more, so this is its last message
+                        if prompts[request_id].cancel():
+                            ended.add(request_id)
+                            await send({"id": request_id, "type": "cancelled"})
+                    continue
+                if not valid_id or not isinstance(request.get("message"), str):
+                    await send({"id": request_id, "type": "error",
+                                "message": 'Invalid request: needs an "id" and a "message" string'})
+                    continue
+                if request_id in prompts or (held is not None and held[0] == request_id):
+                    await send({"id": request_id, "type": "error", "message": "Invalid request: id already in use"})
+                    continue
+                if len(prompts) < self.max_inflight:
+                    start(request_id, request["message"], request)
+                elif held is None:
+                    counters[self.INFLIGHT_WAITS] += 1
+                    held = (request_id, request["message"], request)
+                else:
+                    counters[self.REJECTED] += 1
+                    await send({"id": request_id, "type": "error",
+                                "message": f"Too many prompts in flight (limit {self.max_inflight + 1})"})
+
+        reader = asyncio.create_task(read())
+        writer = asyncio.create_task(write())
+        try:
+            # Either side ending ends the connection: the client went away, or stopped reading
+            done, _ = await asyncio.wait({reader, writer}, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = task.exception()
+                if error is not None and not isinstance(error, WebSocketDisconnect):
+                    logger.warning(f"WebSocket chat connection failed: {error!r}")
+        finally:
+            closing = True
+            for task in [reader, writer, *prompts.values()]:
+                task.cancel()
+            counters[self.CLOSED] += 1
+            self._active[0] -= 1
+
+    def get_prometheus_metrics(self) -> str:
+        opened, _, prompts, messages, inflight_waits, send_waits, slow_closes, rejected = (
+            self._counters_block.totals()
+        )
+        active = self._active_block.totals()[0]
+        lines = [
+            "# HELP guardrail_ws_connections_total WebSocket chat connections accepted",
+            "# TYPE guardrail_ws_connections_total counter",
+            f"guardrail_ws_connections_total {opened}",
+            "",
+            "# HELP guardrail_ws_connections_active WebSocket chat connections currently open",
+            "# TYPE guardrail_ws_connections_active gauge",
+            f"guardrail_ws_connections_active {active}",
+            "",
+            "# HELP guardrail_ws_prompts_total Prompts received over WebSocket chat connections",
+            "# TYPE guardrail_ws_prompts_total counter",
+            f"guardrail_ws_prompts_total {prompts}",
+            "",
+            "# HELP guardrail_ws_prompts_rejected_total Prompts rejected because the connection's in-flight limit "
+            "and its one held prompt were taken",
+            "# TYPE guardrail_ws_prompts_rejected_total counter",
+            f"guardrail_ws_prompts_rejected_total {rejected}",
+            "",
+            "# HELP guardrail_ws_messages_total Event messages sent to WebSocket chat clients",
+            "# TYPE guardrail_ws_messages_total counter",
+            f"guardrail_ws_messages_total {messages}",
+            "",
+            "# HELP guardrail_ws_backpressure_total Times a connection had to wait (inflight = prompt held for a slot, "
+            "send = outgoing queue full)",
+            "# TYPE guardrail_ws_backpressure_total counter",
+            f'guardrail_ws_backpressure_total{{reason="inflight"}} {inflight_waits}',
+            f'guardrail_ws_backpressure_total{{reason="send"}} {send_waits}',
+            "",
+            "# HELP guardrail_ws_slow_client_closes_total Connections closed because the client stopped reading",
+            "# TYPE guardrail_ws_slow_client_closes_total counter",
+            f"guardrail_ws_slow_client_closes_total {slow_closes}",
+        ]
+        return "\n".join(lines)